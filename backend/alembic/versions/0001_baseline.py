@@ -0,0 +1,106 @@
+"""baseline: схема, которую создавал Base.metadata.create_all до появления миграций
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-16
+
+Для уже работающей базы, созданной create_all: `alembic stamp 0001`, затем `alembic upgrade head`.
+Все, что добавлено позже (bigint id, индексы истории и поиска, вложения, позиции прочтения,
+партиции), приходит следующими миграциями — и на новую, и на существующую базу.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String(), nullable=False),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("hashed_password", sa.String(), nullable=False),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("is_online", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "channels",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("description", sa.String(), nullable=True),
+        sa.Column("owner_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_channels_id", "channels", ["id"])
+
+    op.create_table(
+        "text_channels",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("channel_id", sa.Integer(), sa.ForeignKey("channels.id"), nullable=False),
+        sa.Column("position", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+    )
+    op.create_index("ix_text_channels_id", "text_channels", ["id"])
+
+    op.create_table(
+        "voice_channels",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("channel_id", sa.Integer(), sa.ForeignKey("channels.id"), nullable=False),
+        sa.Column("position", sa.Integer(), nullable=True),
+        sa.Column("max_users", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+    )
+    op.create_index("ix_voice_channels_id", "voice_channels", ["id"])
+
+    op.create_table(
+        "channel_members",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("channel_id", sa.Integer(), sa.ForeignKey("channels.id"), nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("joined_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+    )
+    op.create_index("ix_channel_members_id", "channel_members", ["id"])
+
+    op.create_table(
+        "voice_channel_users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("voice_channel_id", sa.Integer(), sa.ForeignKey("voice_channels.id"), nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("joined_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+        sa.Column("is_muted", sa.Boolean(), nullable=True),
+        sa.Column("is_deafened", sa.Boolean(), nullable=True),
+    )
+    op.create_index("ix_voice_channel_users_id", "voice_channel_users", ["id"])
+
+    op.create_table(
+        "messages",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("author_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("text_channel_id", sa.Integer(), sa.ForeignKey("text_channels.id"), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("is_edited", sa.Integer(), nullable=True),
+    )
+    op.create_index("ix_messages_id", "messages", ["id"])
+
+
+def downgrade():
+    for table in (
+        "messages", "voice_channel_users",
+        "channel_members", "voice_channels", "text_channels", "channels", "users"
+    ):
+        op.drop_table(table)
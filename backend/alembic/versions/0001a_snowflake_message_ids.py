@@ -0,0 +1,37 @@
+"""messages.id: integer с последовательностью -> bigint для snowflake-id
+
+Revision ID: 0001a
+Revises: 0001
+Create Date: 2026-10-17
+
+Базы, созданные create_all до перехода на snowflake, хранят id сообщений в integer: первая же
+вставка snowflake-id переполняет его. Смена типа перезаписывает таблицу под эксклюзивной
+блокировкой — на больших базах выполняется в окно обслуживания. Для баз, где id уже bigint,
+миграция ничего не делает.
+"""
+from alembic import op
+
+revision = "0001a"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        DO $$
+        BEGIN
+            IF (SELECT data_type FROM information_schema.columns
+                WHERE table_name = 'messages' AND column_name = 'id') <> 'bigint' THEN
+                ALTER TABLE messages ALTER COLUMN id TYPE BIGINT;
+            END IF;
+        END $$
+    """)
+    # id назначает приложение: последовательность integer больше не используется
+    op.execute("ALTER TABLE messages ALTER COLUMN id DROP DEFAULT")
+    op.execute("DROP SEQUENCE IF EXISTS messages_id_seq")
+
+
+def downgrade():
+    # Обратно в integer нельзя: snowflake-id в него не помещаются
+    pass
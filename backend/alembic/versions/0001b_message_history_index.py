@@ -0,0 +1,27 @@
+"""messages: составной индекс (text_channel_id, id) для постраничной истории
+
+Revision ID: 0001b
+Revises: 0001a
+Create Date: 2026-10-17
+
+История канала читается по курсору диапазонным сканированием этого индекса. Индекс строится
+CONCURRENTLY — запись в таблицу на время построения не блокируется.
+"""
+from alembic import op
+
+revision = "0001b"
+down_revision = "0001a"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_text_channel_id_id ON messages (text_channel_id, id)"
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_messages_text_channel_id_id")
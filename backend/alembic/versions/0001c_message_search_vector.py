@@ -0,0 +1,31 @@
+"""messages: вычисляемый search_vector и GIN-индекс для полнотекстового поиска
+
+Revision ID: 0001c
+Revises: 0001b
+Create Date: 2026-10-17
+
+Добавление хранимого вычисляемого столбца перезаписывает таблицу под эксклюзивной блокировкой
+(вектор считается для каждой строки) — на больших базах выполняется в окно обслуживания.
+GIN-индекс строится CONCURRENTLY, без блокировки записи.
+"""
+from alembic import op
+
+revision = "0001c"
+down_revision = "0001b"
+branch_labels = None
+depends_on = None
+
+SEARCH_VECTOR = "to_tsvector('russian', coalesce(content, '')) || to_tsvector('english', coalesce(content, ''))"
+
+
+def upgrade():
+    op.execute(
+        f"ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED"
+    )
+    with op.get_context().autocommit_block():
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_search_vector ON messages USING gin (search_vector)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_messages_search_vector")
+    op.execute("ALTER TABLE messages DROP COLUMN IF EXISTS search_vector")
@@ -0,0 +1,32 @@
+"""read_states: позиция прочтения и счетчик упоминаний на пару (пользователь, текстовый канал)
+
+Revision ID: 0001d
+Revises: 0001c
+Create Date: 2026-10-17
+
+Таблица могла уже появиться через create_all у баз, развернутых до миграций, — тогда пропускается.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001d"
+down_revision = "0001c"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table("read_states"):
+        return
+    op.create_table(
+        "read_states",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("text_channel_id", sa.Integer(), sa.ForeignKey("text_channels.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("last_read_message_id", sa.BigInteger(), nullable=False),
+        sa.Column("mention_count", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_table("read_states")
@@ -0,0 +1,42 @@
+"""attachments: вложения с адресацией по sha256 содержимого
+
+Revision ID: 0001e
+Revises: 0001d
+Create Date: 2026-10-17
+
+Таблица могла уже появиться через create_all у баз, развернутых до миграций, — тогда пропускается.
+message_id без внешнего ключа: вложение привязывается раньше, чем строка сообщения записывается пакетом.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001e"
+down_revision = "0001d"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table("attachments"):
+        return
+    op.create_table(
+        "attachments",
+        sa.Column("id", sa.BigInteger(), primary_key=True, autoincrement=False),
+        sa.Column("message_id", sa.BigInteger(), nullable=True),
+        sa.Column("uploader_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("text_channel_id", sa.Integer(), sa.ForeignKey("text_channels.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("filename", sa.String(255), nullable=False),
+        sa.Column("content_type", sa.String(255), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("sha256", sa.String(64), nullable=False),
+        sa.Column("width", sa.Integer(), nullable=True),
+        sa.Column("height", sa.Integer(), nullable=True),
+        sa.Column("thumbnails", sa.JSON(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+    )
+    op.create_index("ix_attachments_message_id", "attachments", ["message_id"])
+    op.create_index("ix_attachments_sha256", "attachments", ["sha256"])
+
+
+def downgrade():
+    op.drop_table("attachments")
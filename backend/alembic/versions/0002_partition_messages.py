@@ -0,0 +1,95 @@
+"""messages: помесячные партиции по id, прежняя таблица становится партицией messages_legacy
+
+Revision ID: 0002
+Revises: 0001e
+Create Date: 2026-10-16
+
+Данные не копируются: старая таблица присоединяется целиком и покрывает все id до конца
+текущего месяца. Диапазон проверяется заранее через CHECK ... NOT VALID + VALIDATE вне
+транзакции (запись не блокируется), поэтому ATTACH не сканирует таблицу.
+"""
+from datetime import datetime, timezone
+from alembic import op
+
+from app.core.config import settings
+from app.services.partitions import add_months, month_start, partition_bounds, partition_name
+
+revision = "0002"
+down_revision = "0001e"
+branch_labels = None
+depends_on = None
+
+SEARCH_VECTOR = "to_tsvector('russian', coalesce(content, '')) || to_tsvector('english', coalesce(content, ''))"
+COLUMNS = "id, content, author_id, text_channel_id, created_at, updated_at, is_edited"
+INDEXES = {
+    "ix_messages_id": "(id)",
+    "ix_messages_text_channel_id_id": "(text_channel_id, id)",
+    "ix_messages_search_vector": "USING gin (search_vector)"
+}
+
+
+def _create_table(name: str, partitioned: bool):
+    op.execute(f"""
+        CREATE TABLE {name} (
+            id BIGINT NOT NULL,
+            content TEXT NOT NULL,
+            author_id INTEGER NOT NULL REFERENCES users (id),
+            text_channel_id INTEGER NOT NULL REFERENCES text_channels (id),
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            updated_at TIMESTAMP WITH TIME ZONE,
+            is_edited INTEGER,
+            search_vector TSVECTOR GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED,
+            CONSTRAINT {name}_pkey PRIMARY KEY (id)
+        ){" PARTITION BY RANGE (id)" if partitioned else ""}
+    """)
+
+
+def _create_indexes():
+    for index, definition in INDEXES.items():
+        op.execute(f"CREATE INDEX {index} ON messages {definition}")
+
+
+def upgrade():
+    current = month_start(datetime.now(timezone.utc))
+    legacy_upper = partition_bounds(current)[1]
+
+    with op.get_context().autocommit_block():
+        op.execute(f"ALTER TABLE messages ADD CONSTRAINT messages_legacy_range CHECK (id < {legacy_upper}) NOT VALID")
+        op.execute("ALTER TABLE messages VALIDATE CONSTRAINT messages_legacy_range")
+
+    op.execute("ALTER TABLE messages RENAME TO messages_legacy")
+    op.execute("ALTER TABLE messages_legacy RENAME CONSTRAINT messages_pkey TO messages_legacy_pkey")
+    for index in INDEXES:
+        op.execute(f"ALTER INDEX IF EXISTS {index} RENAME TO {index.replace('ix_messages', 'ix_messages_legacy')}")
+
+    _create_table("messages", partitioned=True)
+    # Индексы родителя; у messages_legacy при присоединении подхватываются уже существующие
+    _create_indexes()
+
+    op.execute(f"ALTER TABLE messages ATTACH PARTITION messages_legacy FOR VALUES FROM (MINVALUE) TO ({legacy_upper})")
+    op.execute("ALTER TABLE messages_legacy DROP CONSTRAINT messages_legacy_range")
+
+    for offset in range(1, settings.MESSAGE_PARTITIONS_AHEAD + 1):
+        month = add_months(current, offset)
+        lower, upper = partition_bounds(month)
+        op.execute(
+            f"CREATE TABLE {partition_name(month)} PARTITION OF messages FOR VALUES FROM ({lower}) TO ({upper})"
+        )
+
+
+def downgrade():
+    """Обычная таблица messages из всех партиций.
+
+    Строки копируются целиком (партиции бывают и в messages_legacy, и созданные бэкендом,
+    а на новой базе messages_legacy может не быть вовсе), запись на время копирования
+    блокируется — на большой таблице выполнять в окно обслуживания. Отсоединенные архивом
+    партиции не возвращаются.
+    """
+    _create_table("messages_plain", partitioned=False)
+    op.execute("LOCK TABLE messages IN EXCLUSIVE MODE")
+    op.execute(f"INSERT INTO messages_plain ({COLUMNS}) SELECT {COLUMNS} FROM messages")
+    # Вместе с родителем удаляются все его партиции, включая messages_legacy
+    op.execute("DROP TABLE messages")
+    op.execute("ALTER TABLE messages_plain RENAME TO messages")
+    op.execute("ALTER TABLE messages RENAME CONSTRAINT messages_plain_pkey TO messages_pkey")
+    _create_indexes()
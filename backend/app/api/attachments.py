@@ -0,0 +1,237 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import Optional, Tuple
+from urllib.parse import quote
+import mimetypes
+import os
+from app.core.config import settings
+from app.db.database import get_db
+from app.models import Attachment, TextChannel, User
+from app.schemas.message import Attachment as AttachmentSchema
+from app.core.dependencies import get_current_active_user, get_member_text_channel, ensure_channel_member
+from app.services.storage import storage
+from app.services.thumbnails import thumbnails, thumbnail_key
+
+router = APIRouter()
+
+# Открываются в браузере только растровые изображения и медиа; SVG, HTML и прочее могут
+# исполнять скрипты на нашем домене и всегда отдаются как скачивание
+INLINE_TYPES = frozenset({
+    "image/png", "image/jpeg", "image/gif", "image/webp", "image/avif",
+    "video/mp4", "video/webm", "video/ogg",
+    "audio/mpeg", "audio/ogg", "audio/wav", "audio/webm", "audio/mp4", "audio/flac"
+})
+
+
+def _clean_filename(filename: str) -> str:
+    name = os.path.basename(filename.replace("\\", "/")).strip()
+    name = "".join(ch for ch in name if ch.isprintable())
+    return name[:255] or "file"
+
+
+def _content_type(request: Request, filename: str) -> str:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if not content_type or content_type.startswith("multipart/") or content_type == "application/x-www-form-urlencoded":
+        content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    return content_type
+
+
+@router.post(
+    "/text-channels/{text_channel_id}/attachments",
+    response_model=AttachmentSchema,
+    status_code=status.HTTP_201_CREATED
+)
+async def upload_attachment(
+    request: Request,
+    filename: str = Query(..., min_length=1, max_length=255),
+    text_channel: TextChannel = Depends(get_member_text_channel),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Потоковая загрузка файла: тело запроса пишется на диск частями, память не зависит от размера"""
+    declared_size = request.headers.get("content-length")
+    if declared_size and declared_size.isdigit() and int(declared_size) > settings.ATTACHMENT_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="File is too large"
+        )
+
+    filename = _clean_filename(filename)
+    content_type = _content_type(request, filename)
+    uploader_id, text_channel_id = current_user.id, text_channel.id
+    # Соединение с БД не держим, пока клиент передает файл
+    await db.close()
+
+    upload = storage.begin_upload()
+    try:
+        async for chunk in request.stream():
+            if upload.size + len(chunk) > settings.ATTACHMENT_MAX_SIZE:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail="File is too large"
+                )
+            await upload.write(chunk)
+        if upload.size == 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Empty file"
+            )
+        await upload.commit()
+    except BaseException:
+        await upload.abort()
+        raise
+
+    attachment = Attachment(
+        uploader_id=uploader_id,
+        text_channel_id=text_channel_id,
+        filename=filename,
+        content_type=content_type,
+        size=upload.size,
+        sha256=upload.sha256.hexdigest()
+    )
+    db.add(attachment)
+    await db.commit()
+    # Уменьшенные копии готовятся в фоне, пока пользователь дописывает сообщение
+    thumbnails.submit(attachment)
+    return attachment
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Один диапазон 'bytes=a-b' (включительно); None — отдать файл целиком"""
+    if not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[6:].strip().partition("-")
+    try:
+        if first == "":
+            suffix = int(last)
+            start, end = max(size - suffix, 0), size - 1
+            if suffix == 0:
+                start = size
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match: '*' или список ETag через запятую; сравнение слабое — W/ не учитывается"""
+    header = header.strip()
+    if header == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(",") if tag.strip())
+
+
+def file_response(request: Request, key: str, etag: str, size: int, content_type: str, filename: str) -> Response:
+    """Отдача файла из хранилища: ETag, Range и передача nginx (sendfile) при X-Accel-Redirect"""
+    disposition = "inline" if content_type.lower() in INLINE_TYPES else "attachment"
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "Content-Disposition": f"{disposition}; filename*=UTF-8''{quote(filename)}",
+        "X-Content-Type-Options": "nosniff",
+        # Даже открытый напрямую файл не получает ни скриптов, ни доступа к origin приложения
+        "Content-Security-Policy": "sandbox"
+    }
+
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if settings.ATTACHMENT_ACCEL_REDIRECT and storage.local_path(key):
+        # Файл отдает nginx из своего internal location — zero-copy sendfile, Range он обрабатывает сам
+        headers["X-Accel-Redirect"] = settings.ATTACHMENT_ACCEL_REDIRECT + key
+        return Response(headers=headers, media_type=content_type)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag:
+        byte_range = _parse_range(range_header, size)
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(storage.read(key), headers=headers, media_type=content_type)
+
+    start, end = byte_range
+    headers["Content-Length"] = str(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(
+        storage.read(key, start, end - start + 1),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        headers=headers,
+        media_type=content_type
+    )
+
+
+async def _get_visible_attachment(db: AsyncSession, attachment_id: int, user_id: int) -> Attachment:
+    result = await db.execute(
+        select(Attachment, TextChannel.channel_id)
+        .join(TextChannel, TextChannel.id == Attachment.text_channel_id)
+        .where(Attachment.id == attachment_id)
+    )
+    row = result.first()
+    # Не отправленное в сообщении вложение видит только загрузивший
+    if row is None or (row[0].message_id is None and row[0].uploader_id != user_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Attachment not found"
+        )
+    attachment, channel_id = row
+    await ensure_channel_member(db, channel_id, user_id)
+    return attachment
+
+
+@router.get("/attachments/{attachment_id}")
+async def download_attachment(
+    attachment_id: int,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Скачивание вложения участником сервера"""
+    attachment = await _get_visible_attachment(db, attachment_id, current_user.id)
+    await db.close()
+    return file_response(
+        request,
+        storage.content_key(attachment.sha256),
+        f'"{attachment.sha256}"',
+        attachment.size,
+        attachment.content_type,
+        attachment.filename
+    )
+
+
+@router.get("/attachments/{attachment_id}/thumbnails/{size}")
+async def download_thumbnail(
+    attachment_id: int,
+    size: int,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Уменьшенная копия изображения (WebP без метаданных)"""
+    attachment = await _get_visible_attachment(db, attachment_id, current_user.id)
+    await db.close()
+    thumbnail = next((item for item in attachment.thumbnails or [] if item["size"] == size), None)
+    if thumbnail is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Thumbnail not found"
+        )
+    return file_response(
+        request,
+        thumbnail_key(attachment.sha256, size),
+        f'"{attachment.sha256}-{size}"',
+        thumbnail["bytes"],
+        "image/webp",
+        f"{os.path.splitext(attachment.filename)[0]}.webp"
+    )
@@ -0,0 +1,85 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import List, Optional
+from app.db.database import get_db
+from app.models import Channel, TextChannel, User
+from app.core.dependencies import get_current_active_user, get_member_text_channel
+from app.services.export import MEDIA_TYPES, check_cursor, export_filename, stream_export
+
+router = APIRouter()
+
+FORMAT_PATTERN = "^(ndjson|csv)$"
+
+
+def _export_response(
+    name: str,
+    text_channel_ids: List[int],
+    fmt: str,
+    compress: bool,
+    after: Optional[int],
+    after_text_channel: Optional[int] = None
+):
+    # Курсор проверяется до начала ответа: ошибка внутри потока оборвала бы его на середине
+    try:
+        check_cursor(text_channel_ids, after, after_text_channel)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    headers = {
+        "Content-Disposition": f'attachment; filename="{export_filename(name, fmt, compress)}"',
+        # nginx не должен копить ответ целиком в буфере
+        "X-Accel-Buffering": "no"
+    }
+    return StreamingResponse(
+        stream_export(text_channel_ids, fmt, compress, after, after_text_channel),
+        media_type="application/gzip" if compress else MEDIA_TYPES[fmt],
+        headers=headers
+    )
+
+
+@router.get("/text-channels/{text_channel_id}/export")
+async def export_text_channel(
+    format: str = Query("ndjson", pattern=FORMAT_PATTERN),
+    gzip: bool = False,
+    after: Optional[int] = Query(None, description="Продолжить выгрузку после указанного id"),
+    text_channel: TextChannel = Depends(get_member_text_channel),
+    db: AsyncSession = Depends(get_db)
+):
+    """Потоковая выгрузка всей истории текстового канала (NDJSON или CSV)"""
+    text_channel_id = text_channel.id
+    await db.close()
+    return _export_response(f"text-channel-{text_channel_id}", [text_channel_id], format, gzip, after)
+
+
+@router.get("/channels/{channel_id}/export")
+async def export_channel(
+    channel_id: int,
+    format: str = Query("ndjson", pattern=FORMAT_PATTERN),
+    gzip: bool = False,
+    after: Optional[int] = Query(None, description="Продолжить выгрузку после указанного id"),
+    after_text_channel: Optional[int] = Query(None, description="Текстовый канал, которому принадлежит after"),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Потоковая выгрузка истории всех текстовых каналов сервера — только для владельца"""
+    result = await db.execute(select(Channel.owner_id).where(Channel.id == channel_id))
+    owner_id = result.scalar_one_or_none()
+    if owner_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Channel not found"
+        )
+    if owner_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only channel owner can export history"
+        )
+
+    result = await db.execute(
+        select(TextChannel.id).where(TextChannel.channel_id == channel_id).order_by(TextChannel.id)
+    )
+    text_channel_ids = list(result.scalars().all())
+    # Соединение сессии не держим на время передачи ответа
+    await db.close()
+    return _export_response(f"channel-{channel_id}", text_channel_ids, format, gzip, after, after_text_channel)
@@ -0,0 +1,161 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
+from app.db.database import get_db
+from app.models import Attachment, Channel, Message, TextChannel, User
+from app.schemas.message import Message as MessageSchema, MessageUpdate
+from app.core.dependencies import get_current_active_user, get_member_text_channel
+from app.services.message_cache import message_cache, serialize_message
+from app.services.read_state import read_states
+from app.websocket.connection_manager import manager
+
+router = APIRouter()
+
+def _history_query(text_channel_id: int):
+    """Базовый запрос истории: авторы и вложения подгружаются пакетными запросами"""
+    return (
+        select(Message)
+        .where(Message.text_channel_id == text_channel_id)
+        .options(selectinload(Message.author), selectinload(Message.attachments))
+    )
+
+async def _get_channel_message(db: AsyncSession, text_channel_id: int, message_id: int) -> Message:
+    result = await db.execute(
+        _history_query(text_channel_id).where(Message.id == message_id)
+    )
+    message = result.scalar_one_or_none()
+    if not message:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Message not found"
+        )
+    return message
+
+@router.get("/{text_channel_id}/messages", response_model=List[MessageSchema])
+async def get_message_history(
+    before: Optional[int] = Query(None, description="Сообщения старше указанного id"),
+    after: Optional[int] = Query(None, description="Сообщения новее указанного id"),
+    around: Optional[int] = Query(None, description="Сообщения вокруг указанного id"),
+    limit: int = Query(50, ge=1, le=100),
+    text_channel: TextChannel = Depends(get_member_text_channel),
+    db: AsyncSession = Depends(get_db)
+):
+    """История сообщений текстового канала с keyset-пагинацией (от старых к новым)"""
+    if sum(cursor is not None for cursor in (before, after, around)) > 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use only one of before, after, around"
+        )
+
+    query = _history_query(text_channel.id)
+
+    if after is not None:
+        result = await db.execute(
+            query.where(Message.id > after).order_by(Message.id.asc()).limit(limit)
+        )
+        return result.scalars().all()
+
+    if around is not None:
+        # Половина страницы до курсора, остальное — начиная с него
+        older = await db.execute(
+            query.where(Message.id < around).order_by(Message.id.desc()).limit(limit // 2)
+        )
+        newer = await db.execute(
+            query.where(Message.id >= around).order_by(Message.id.asc()).limit(limit - limit // 2)
+        )
+        return list(reversed(older.scalars().all())) + list(newer.scalars().all())
+
+    if before is not None:
+        result = await db.execute(
+            query.where(Message.id < before).order_by(Message.id.desc()).limit(limit)
+        )
+        return list(reversed(result.scalars().all()))
+
+    # Первая страница — самое частое чтение, отдаем готовый JSON из кэша
+    cached = await message_cache.get_latest(text_channel.id, limit)
+    if cached is not None:
+        return Response(content=b"[" + b",".join(cached) + b"]", media_type="application/json")
+
+    page_size = max(limit, message_cache.per_channel)
+    message_cache.begin_fill(text_channel.id)
+    result = await db.execute(query.order_by(Message.id.desc()).limit(page_size))
+    messages = list(reversed(result.scalars().all()))
+    await message_cache.fill(
+        text_channel.id,
+        [(message.id, serialize_message(message)) for message in messages],
+        complete=len(messages) < page_size
+    )
+    return messages[-limit:]
+
+@router.patch("/{text_channel_id}/messages/{message_id}", response_model=MessageSchema)
+async def edit_message(
+    message_id: int,
+    message_data: MessageUpdate,
+    text_channel: TextChannel = Depends(get_member_text_channel),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Редактирование сообщения автором"""
+    content = message_data.content.strip()
+    if not content:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Message content is empty"
+        )
+
+    message = await _get_channel_message(db, text_channel.id, message_id)
+    if message.author_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only the author can edit this message"
+        )
+
+    message.content = content
+    message.is_edited = True
+    await db.commit()
+    await db.refresh(message, attribute_names=["updated_at"])
+    await message_cache.invalidate(text_channel.id)
+
+    await manager.send_to_channel(text_channel.channel_id, {
+        "type": "message_update",
+        "id": str(message.id),
+        "content": message.content,
+        "text_channel_id": text_channel.id,
+        "edited_at": message.updated_at.isoformat() if message.updated_at else None
+    })
+    return message
+
+@router.delete("/{text_channel_id}/messages/{message_id}")
+async def delete_message(
+    message_id: int,
+    text_channel: TextChannel = Depends(get_member_text_channel),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Удаление сообщения автором или владельцем сервера"""
+    message = await _get_channel_message(db, text_channel.id, message_id)
+    if message.author_id != current_user.id:
+        owner_result = await db.execute(
+            select(Channel.owner_id).where(Channel.id == text_channel.channel_id)
+        )
+        if owner_result.scalar_one_or_none() != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Only the author or channel owner can delete this message"
+            )
+
+    await db.delete(message)
+    # Файлы в хранилище общие для одинакового содержимого — удаляются только записи вложений
+    await db.execute(delete(Attachment).where(Attachment.message_id == message_id))
+    await db.commit()
+    await message_cache.invalidate(text_channel.id)
+    await read_states.invalidate(text_channel.id)
+
+    await manager.send_to_channel(text_channel.channel_id, {
+        "type": "message_delete",
+        "id": str(message_id),
+        "text_channel_id": text_channel.id
+    })
+    return {"detail": "Message deleted"}
@@ -0,0 +1,103 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, cast, literal_column, tuple_, or_, REAL
+from sqlalchemy.orm import selectinload
+from datetime import datetime
+from typing import Optional
+from app.db.database import get_db
+from app.models import Message, TextChannel, User
+from app.schemas.message import MessageSearchPage
+from app.core.dependencies import get_current_active_user, ensure_channel_member
+from app.core.snowflake import snowflake_from_time, TIMESTAMP_SHIFT
+
+router = APIRouter()
+
+# Конфигурации должны совпадать с вычисляемой колонкой Message.search_vector
+RUSSIAN = literal_column("'russian'::regconfig")
+ENGLISH = literal_column("'english'::regconfig")
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, MaxFragments=2"
+# id сообщений до перехода на snowflake (последовательные) — все они в партиции messages_legacy
+LEGACY_ID_LIMIT = 1 << 31
+# Запас на расхождение времени в id и created_at (оба назначаются при приеме сообщения)
+ID_TIME_SLACK = 1000 << TIMESTAMP_SHIFT
+
+def _parse_cursor(cursor: str) -> tuple[float, int]:
+    """Курсор страницы: 'rank:id' последнего результата"""
+    try:
+        rank, message_id = cursor.split(":", 1)
+        return float(rank), int(message_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+@router.get("/{channel_id}/search", response_model=MessageSearchPage)
+async def search_messages(
+    channel_id: int,
+    q: str = Query(..., min_length=1, max_length=256),
+    text_channel_id: Optional[int] = None,
+    author_id: Optional[int] = None,
+    after: Optional[datetime] = None,
+    before: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(25, ge=1, le=100),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Полнотекстовый поиск по сообщениям сервера с ранжированием и подсветкой"""
+    await ensure_channel_member(db, channel_id, current_user.id)
+
+    tsquery = func.websearch_to_tsquery(RUSSIAN, q).op("||")(func.websearch_to_tsquery(ENGLISH, q))
+    rank = cast(func.ts_rank_cd(Message.search_vector, tsquery), REAL)
+
+    # Первый шаг — только id и ранг по GIN-индексу, без чтения текста
+    page_query = (
+        select(Message.id, rank.label("rank"))
+        .join(TextChannel, Message.text_channel_id == TextChannel.id)
+        .where(
+            TextChannel.channel_id == channel_id,
+            Message.search_vector.op("@@")(tsquery)
+        )
+    )
+    if text_channel_id is not None:
+        page_query = page_query.where(Message.text_channel_id == text_channel_id)
+    if author_id is not None:
+        page_query = page_query.where(Message.author_id == author_id)
+    # Границы по id дополняют фильтр по времени: планировщик отбрасывает лишние партиции
+    if after is not None:
+        page_query = page_query.where(
+            Message.created_at >= after,
+            or_(Message.id >= snowflake_from_time(after) - ID_TIME_SLACK, Message.id < LEGACY_ID_LIMIT)
+        )
+    if before is not None:
+        page_query = page_query.where(
+            Message.created_at < before,
+            Message.id < snowflake_from_time(before) + ID_TIME_SLACK
+        )
+    if cursor:
+        last_rank, last_id = _parse_cursor(cursor)
+        page_query = page_query.where(tuple_(rank, Message.id) < tuple_(last_rank, last_id))
+
+    page = (await db.execute(
+        page_query.order_by(rank.desc(), Message.id.desc()).limit(limit)
+    )).all()
+    if not page:
+        return {"results": [], "next_cursor": None}
+
+    # Второй шаг — подсветка и авторы только для строк страницы
+    ids = [row.id for row in page]
+    details = await db.execute(
+        select(Message, func.ts_headline(RUSSIAN, Message.content, tsquery, HEADLINE_OPTIONS))
+        .where(Message.id.in_(ids))
+        .options(selectinload(Message.author), selectinload(Message.attachments))
+    )
+    by_id = {message.id: (message, highlight) for message, highlight in details.all()}
+
+    results = []
+    for row in page:
+        message, highlight = by_id[row.id]
+        results.append({"message": message, "rank": row.rank, "highlight": highlight})
+
+    next_cursor = f"{page[-1].rank!r}:{page[-1].id}" if len(page) == limit else None
+    return {"results": results, "next_cursor": next_cursor}
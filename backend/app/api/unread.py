@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+from app.db.database import get_db
+from app.models import User
+from app.schemas.message import ChannelReadState
+from app.core.dependencies import get_current_active_user, ensure_channel_member
+from app.services.read_state import read_states
+
+router = APIRouter()
+
+@router.get("/{channel_id}/read-states", response_model=List[ChannelReadState])
+async def get_read_states(
+    channel_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Непрочитанное и упоминания по всем текстовым каналам сервера одним запросом"""
+    await ensure_channel_member(db, channel_id, current_user.id)
+    return await read_states.get_server_state(db, current_user.id, channel_id)
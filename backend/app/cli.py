@@ -0,0 +1,111 @@
+import argparse
+import asyncio
+import logging
+import sys
+from sqlalchemy import select
+from app.core.config import settings
+from app.db.database import engine
+from app.models import TextChannel
+from app.services.attachment_sweeper import attachment_sweeper
+from app.services.export import FORMATS, stream_export
+from app.services.partitions import archive_partitions, ensure_partitions
+
+
+async def _partitions_ensure(args):
+    created = await ensure_partitions(args.months_ahead)
+    print(f"Создано партиций: {len(created)}" + (f" ({', '.join(created)})" if created else ""))
+
+
+async def _partitions_archive(args):
+    archived = await archive_partitions(args.older_than, args.dir, include_legacy=args.include_legacy)
+    print(f"Перенесено в архив: {len(archived)}")
+    for path in archived:
+        print(f"  {path}")
+
+
+async def _attachments_sweep(args):
+    if args.older_than is not None:
+        attachment_sweeper.orphan_ttl = args.older_than * 3600
+    removed = await attachment_sweeper.sweep()
+    print(f"Удалено: строк {removed['rows']}, файлов {removed['files']}, брошенных загрузок {removed['uploads']}")
+
+
+async def _export(args):
+    if args.output == "-":
+        # echo движка печатает SQL в stdout — там же данные выгрузки
+        engine.sync_engine.echo = False
+    if args.text_channel is not None:
+        text_channel_ids = [args.text_channel]
+    else:
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                select(TextChannel.id).where(TextChannel.channel_id == args.channel).order_by(TextChannel.id)
+            )
+            text_channel_ids = list(result.scalars().all())
+
+    output = open(args.output, "wb") if args.output != "-" else sys.stdout.buffer
+    try:
+        async for chunk in stream_export(text_channel_ids, args.format, args.gzip, args.after, args.after_text_channel):
+            output.write(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Обслуживание Miscord")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    partitions = commands.add_parser("partitions", help="Партиции таблицы сообщений")
+    partition_commands = partitions.add_subparsers(dest="action", required=True)
+
+    ensure = partition_commands.add_parser("ensure", help="Создать партиции на текущий и следующие месяцы")
+    ensure.add_argument("--months-ahead", type=int, default=settings.MESSAGE_PARTITIONS_AHEAD)
+    ensure.set_defaults(handler=_partitions_ensure)
+
+    archive = partition_commands.add_parser("archive", help="Отсоединить старые партиции и выгрузить в csv.gz")
+    archive.add_argument("--older-than", type=int, required=True, help="Месяцев от начала текущего месяца")
+    archive.add_argument("--dir", default=settings.MESSAGE_ARCHIVE_PATH)
+    archive.add_argument("--include-legacy", action="store_true", help="Архивировать и messages_legacy")
+    archive.set_defaults(handler=_partitions_archive)
+
+    attachments = commands.add_parser("attachments", help="Файлы вложений")
+    attachment_commands = attachments.add_subparsers(dest="action", required=True)
+
+    sweep = attachment_commands.add_parser("sweep", help="Удалить неотправленные вложения и файлы без ссылок")
+    sweep.add_argument("--older-than", type=float, help="Часов; по умолчанию ATTACHMENT_ORPHAN_TTL")
+    sweep.set_defaults(handler=_attachments_sweep)
+
+    export = commands.add_parser("export", help="Выгрузить историю сообщений в NDJSON/CSV")
+    source = export.add_mutually_exclusive_group(required=True)
+    source.add_argument("--channel", type=int, help="Все текстовые каналы сервера")
+    source.add_argument("--text-channel", type=int, help="Один текстовый канал")
+    export.add_argument("--format", choices=FORMATS, default="ndjson")
+    export.add_argument("--gzip", action="store_true")
+    export.add_argument("--after", type=int, help="Продолжить после указанного id")
+    export.add_argument("--after-text-channel", type=int, help="Текстовый канал id из --after (нужен с --channel)")
+    export.add_argument("--output", "-o", default="-", help="Файл; '-' — stdout")
+    export.set_defaults(handler=_export)
+
+    return parser
+
+
+async def _run(args):
+    try:
+        await args.handler(args)
+    finally:
+        await engine.dispose()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.command == "export" and args.channel is not None and args.after is not None and args.after_text_channel is None:
+        # Каналы выгружаются по очереди: одного id недостаточно, чтобы понять, где остановились
+        parser.error("--after с --channel требует --after-text-channel")
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 import json
 import os
 
@@ -10,6 +10,93 @@ class Settings(BaseSettings):
     # Redis
     REDIS_URL: str = "redis://localhost:6379"
     
+    # Масштабирование WebSocket на несколько процессов/хостов
+    WS_NODE_ID: str = ""  # Пусто — идентификатор генерируется при старте
+    WS_CLUSTER_NODES: int = 1  # Больше 1 — рассылка идет через Redis pub/sub
+    
+    # Исходящие очереди WebSocket: переполнение или долгая отправка закрывают соединение
+    WS_SEND_QUEUE_SIZE: int = 256
+    WS_SEND_TIMEOUT: float = 10.0  # секунды
+    
+    # Heartbeat: ping после простоя, вытеснение без ответа за дедлайн
+    WS_HEARTBEAT_IDLE: float = 30.0  # секунды без входящего трафика до ping
+    WS_HEARTBEAT_DEADLINE: float = 20.0  # секунды на ответ после ping
+    WS_HEARTBEAT_TICK: float = 1.0  # шаг колеса таймеров
+    WS_HEARTBEAT_WHEEL_SLOTS: int = 64
+    
+    # Возобновление сессий: номера событий и кольцевые буферы по потокам
+    WS_REPLAY_BUFFER_SIZE: int = 200  # событий на поток
+    WS_REPLAY_MAX_STREAMS: int = 10000
+    WS_REPLAY_REDIS_MIRROR: bool = False  # Зеркалировать буферы в Redis (переживают рестарт)
+    WS_SESSION_TTL: int = 300  # секунды
+    
+    # Запись сообщений чата пакетами (write-behind)
+    MESSAGE_BATCH_SIZE: int = 500  # сообщений в одной транзакции
+    MESSAGE_FLUSH_INTERVAL: float = 0.005  # секунды ожидания добора пакета
+    MESSAGE_QUEUE_SIZE: int = 10000
+    MESSAGE_QUEUE_TIMEOUT: float = 1.0  # секунды ожидания места в очереди записи, затем сообщение отзывается
+    TEXT_CHANNEL_CACHE_TTL: float = 60.0  # секунды
+    
+    # Кэш последних сообщений горячих каналов
+    MESSAGE_CACHE_PER_CHANNEL: int = 100
+    MESSAGE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # общий лимит кэша в процессе
+    MESSAGE_CACHE_REDIS: bool = False  # Общий список в Redis вместо LRU в процессе
+    MESSAGE_CACHE_REDIS_TTL: int = 3600  # секунды
+    MESSAGE_CACHE_LOCAL_TTL: float = 300.0  # секунды жизни канала в LRU процесса, если рассылка сброса потерялась
+    
+    # Помесячные партиции таблицы сообщений
+    MESSAGE_PARTITIONS_AHEAD: int = 3  # месяцев вперед
+    MESSAGE_PARTITION_MAINTENANCE_INTERVAL: float = 6 * 3600  # секунды
+    MESSAGE_ARCHIVE_PATH: str = "archive/messages"
+    
+    # Выгрузка истории сообщений (NDJSON/CSV)
+    EXPORT_BATCH_SIZE: int = 2000  # строк за одно чтение серверного курсора
+    EXPORT_GZIP_LEVEL: int = 6
+    
+    # Вложения: хранилище по хэшу содержимого и отдача файлов
+    ATTACHMENT_STORAGE_PATH: str = "uploads/attachments"
+    ATTACHMENT_MAX_SIZE: int = 100 * 1024 * 1024  # байт, совпадает с client_max_body_size в nginx
+    ATTACHMENT_MAX_PER_MESSAGE: int = 10
+    ATTACHMENT_CHUNK_SIZE: int = 64 * 1024  # байт на чтение при отдаче без nginx
+    ATTACHMENT_ACCEL_REDIRECT: str = ""  # Префикс internal location nginx; пусто — файл отдает приложение
+    ATTACHMENT_ORPHAN_TTL: int = 24 * 3600  # секунды; неотправленные вложения и файлы без ссылок старше удаляются
+    ATTACHMENT_SWEEP_INTERVAL: float = 3600.0  # секунды между очистками
+    
+    # Уменьшенные копии изображений (пул процессов)
+    THUMBNAIL_SIZES: List[int] = [160, 480, 1280]  # по большей стороне, пикселей
+    THUMBNAIL_WORKERS: int = 2
+    THUMBNAIL_QUALITY: int = 80
+    THUMBNAIL_MAX_PIXELS: int = 50_000_000  # защита от «бомб распаковки»
+    
+    # Отметки о прочтении: запись пакетами, указатели на последние сообщения каналов
+    READ_STATE_FLUSH_INTERVAL: float = 1.0  # секунды
+    READ_STATE_REDIS: bool = False  # Указатели в Redis (общие для нескольких процессов)
+    
+    # Индикаторы «говорит»/«печатает»: изменения за такт уходят одним кадром на канал
+    INDICATOR_TICK_INTERVAL: float = 0.15  # секунды
+    TYPING_TTL: float = 8.0  # секунды; без повторного typing индикатор гаснет на сервере
+    
+    # Ограничение частоты событий WebSocket: [токенов в секунду, емкость корзины]
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_REDIS: bool = False  # Общие корзины в Redis для нескольких процессов
+    RATE_LIMIT_POLICIES: Dict[str, Dict[str, List[float]]] = {
+        "message": {"user": [5, 10], "channel": [50, 100]},
+        "ack": {"user": [10, 20]},
+        "typing": {"user": [1, 3]},
+        "resume": {"user": [1, 3]},
+        "signaling": {"user": [50, 100]},
+        "speaking": {"user": [10, 20], "channel": [100, 200]},
+        "mute": {"user": [2, 5]},
+        "deafen": {"user": [2, 5]},
+        "screen_share": {"user": [1, 3]},
+        "audio_mix": {"user": [1, 3]}
+    }
+    RATE_LIMIT_FLOOD_STRIKES: int = 30  # отклоненных событий подряд до закрытия соединения
+    RATE_LIMIT_FLOOD_WINDOW: float = 10.0  # секунды на восстановление всех попыток
+    
+    # Генератор id: -1 — уникальный worker_id арендуется в Redis
+    SNOWFLAKE_WORKER_ID: int = -1
+    
     # Безопасность
     SECRET_KEY: str = "your-secret-key-here-change-in-production"
     ALGORITHM: str = "HS256"
@@ -35,6 +122,19 @@ class Settings(BaseSettings):
         {"urls": ["stun:stun1.l.google.com:19302"]}
     ]
     
+    # Состояние голосовых комнат: в памяти (один процесс) или в Redis (несколько узлов)
+    VOICE_STATE_REDIS: bool = False
+    VOICE_NODE_TTL: int = 30  # секунды; участники узла без продления считаются призраками
+    VOICE_RECONCILE_INTERVAL: float = 60.0  # секунды между очистками призрачных участников (с Redis; без него — только при старте)
+    VOICE_FLAGS_FLUSH_INTERVAL: float = 2.0  # секунды; mute/deafen пишутся в БД не чаще
+    VOICE_ICE_BATCH_WINDOW: float = 0.01  # секунды сбора ICE-кандидатов в один кадр; 0 — выключено
+    VOICE_ICE_BATCH_MAX: int = 16  # кандидатов в кадре
+    # SFU пересылает медиа внутри процесса: при нескольких узлах комната должна обслуживаться одним узлом
+    VOICE_SFU_THRESHOLD: int = 0  # участников, с которых комната переходит на SFU; 0 — всегда mesh
+    # Сведение звука на сервере (MCU) для слушателей со слабым каналом; включает SFU в комнате
+    VOICE_MIX_WORKERS: int = 2  # потоков сведения
+    VOICE_MIX_MAX_SPEAKERS: int = 4  # самых громких голосов в миксе; 0 — все
+    
     class Config:
         env_file = ".env"
 
@@ -1,10 +1,11 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, and_
 from app.db.database import get_db
 from app.core.security import decode_access_token
 from app.models.user import User
+from app.models.channel import ChannelMember, TextChannel
 from app.schemas.user import TokenData
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
@@ -62,4 +63,39 @@ async def get_current_user_ws(token: str, db: AsyncSession) -> User | None:
     result = await db.execute(select(User).where(User.id == int(user_id)))
     user = result.scalar_one_or_none()
     
-    return user
\ No newline at end of file
+    return user
+
+async def ensure_channel_member(db: AsyncSession, channel_id: int, user_id: int):
+    """Проверка членства пользователя в канале (сервере)"""
+    result = await db.execute(
+        select(ChannelMember.id).where(
+            and_(
+                ChannelMember.channel_id == channel_id,
+                ChannelMember.user_id == user_id
+            )
+        )
+    )
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not a member of this channel"
+        )
+
+async def get_member_text_channel(
+    text_channel_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+) -> TextChannel:
+    """Текстовый канал, доступный текущему пользователю"""
+    result = await db.execute(
+        select(TextChannel).where(TextChannel.id == text_channel_id)
+    )
+    text_channel = result.scalar_one_or_none()
+    if not text_channel:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Text channel not found"
+        )
+    
+    await ensure_channel_member(db, text_channel.channel_id, current_user.id)
+    return text_channel
@@ -0,0 +1,38 @@
+from typing import Any
+from fastapi.responses import JSONResponse
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен, используем стандартный json
+    orjson = None
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+def dumps(data: Any) -> str:
+    """Сериализация в JSON-строку (orjson при наличии)"""
+    if orjson is not None:
+        return orjson.dumps(data, option=_ORJSON_OPTIONS).decode()
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def dumps_bytes(data: Any) -> bytes:
+    """Сериализация в JSON-байты (orjson при наличии)"""
+    if orjson is not None:
+        return orjson.dumps(data, option=_ORJSON_OPTIONS)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: str | bytes) -> Any:
+    """Разбор JSON (orjson при наличии)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON-ответ REST API, сериализуемый через orjson при наличии"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
@@ -0,0 +1,163 @@
+from datetime import datetime, timezone
+from typing import Any, Optional
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Раскладка 64-битного id: 41 бит времени (мс от эпохи) | 10 бит воркера | 12 бит счетчика
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+TIMESTAMP_SHIFT = WORKER_BITS + SEQUENCE_BITS
+
+
+class SnowflakeGenerator:
+    """Генератор упорядоченных по времени 64-битных id без обращения к БД"""
+
+    def __init__(self, worker_id: int = 0):
+        self.worker_id = worker_id
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    @property
+    def worker_id(self) -> int:
+        return self._worker_id
+
+    @worker_id.setter
+    def worker_id(self, value: int):
+        if not 0 <= value <= MAX_WORKER_ID:
+            raise ValueError(f"worker_id должен быть в диапазоне 0..{MAX_WORKER_ID}")
+        self._worker_id = value
+
+    def next_id(self) -> int:
+        with self._lock:
+            now_ms = int(time.time() * 1000)
+            if now_ms <= self._last_ms:
+                # Та же миллисекунда или часы ушли назад: продолжаем от последней метки
+                now_ms = self._last_ms
+                self._sequence = (self._sequence + 1) & SEQUENCE_MASK
+                if self._sequence == 0:
+                    # Счетчик миллисекунды исчерпан — занимаем следующую миллисекунду
+                    now_ms += 1
+            else:
+                self._sequence = 0
+            self._last_ms = now_ms
+            return ((now_ms - EPOCH_MS) << TIMESTAMP_SHIFT) | (self._worker_id << SEQUENCE_BITS) | self._sequence
+
+
+def snowflake_time(snowflake_id: int) -> datetime:
+    """Момент создания, закодированный в id"""
+    return datetime.fromtimestamp(((snowflake_id >> TIMESTAMP_SHIFT) + EPOCH_MS) / 1000, tz=timezone.utc)
+
+
+def parse_snowflake(value: Any) -> Optional[int]:
+    """id из входящего кадра: строка (так id уходят клиентам) или целое; None — не id"""
+    if isinstance(value, str) and value.isdigit() and len(value) <= 20:
+        value = int(value)
+    if isinstance(value, int) and not isinstance(value, bool) and 0 <= value < 1 << 63:
+        return value
+    return None
+
+
+def snowflake_from_time(moment: datetime) -> int:
+    """Наименьший id для момента времени — граница для курсоров и партиций"""
+    return max(int(moment.timestamp() * 1000) - EPOCH_MS, 0) << TIMESTAMP_SHIFT
+
+
+# Продление и освобождение только своей аренды: ключ мог истечь и достаться другому узлу
+_REFRESH_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class WorkerIdLease:
+    """Аренда уникального worker_id в Redis (SET NX с продлением TTL, пока ключ принадлежит узлу)"""
+
+    def __init__(self, generator: SnowflakeGenerator, ttl: int = 60):
+        self.generator = generator
+        self.ttl = ttl
+        self.redis_client = None
+        self.owner: str | None = None
+        self.key: str | None = None
+        self._refresh_script = None
+        self._release_script = None
+        self._task: asyncio.Task | None = None
+
+    async def acquire(self, redis_client, owner: str) -> bool:
+        """Захват свободного worker_id; False — Redis недоступен или все id заняты"""
+        if redis_client is None:
+            return False
+        self.redis_client = redis_client
+        self.owner = owner
+        self._refresh_script = redis_client.register_script(_REFRESH_SCRIPT)
+        self._release_script = redis_client.register_script(_RELEASE_SCRIPT)
+        if not await self._claim():
+            return False
+        self._task = asyncio.create_task(self._refresh())
+        return True
+
+    async def _claim(self) -> bool:
+        for worker_id in range(MAX_WORKER_ID + 1):
+            key = f"snowflake:worker:{worker_id}"
+            try:
+                if await self.redis_client.set(key, self.owner, nx=True, ex=self.ttl):
+                    self.key = key
+                    self.generator.worker_id = worker_id
+                    logger.info(f"❄️ Получен worker_id={worker_id} для генератора id")
+                    return True
+            except Exception as e:
+                logger.error(f"❌ Ошибка аренды worker_id в Redis: {e}")
+                return False
+        logger.error("❌ Все worker_id заняты")
+        return False
+
+    async def _refresh(self):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                if self.key is None:
+                    await self._claim()
+                elif not await self._refresh_script(keys=[self.key], args=[self.owner, self.ttl]):
+                    # Аренда истекла (например, Redis был недоступен дольше TTL) — id мог уже достаться другому узлу
+                    logger.error(f"❌ Аренда {self.key} потеряна, выбирается новый worker_id")
+                    self.key = None
+                    await self._claim()
+            except Exception as e:
+                logger.error(f"❌ Ошибка продления worker_id: {e}")
+
+    async def release(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._release_script is not None and self.key:
+            try:
+                await self._release_script(keys=[self.key], args=[self.owner])
+            except Exception:
+                pass
+            self.key = None
+
+
+# Глобальный генератор процесса
+snowflake = SnowflakeGenerator()
+worker_lease = WorkerIdLease(snowflake)
+
+
+def next_id() -> int:
+    """Новый id (используется как default для первичных ключей)"""
+    return snowflake.next_id()
@@ -1,6 +1,8 @@
 from app.models.user import User
 from app.models.channel import Channel, TextChannel, VoiceChannel, ChannelMember, VoiceChannelUser, ChannelType
 from app.models.message import Message
+from app.models.read_state import ReadState
+from app.models.attachment import Attachment
 
 __all__ = [
     "User",
@@ -10,5 +12,7 @@ __all__ = [
     "ChannelMember",
     "VoiceChannelUser",
     "ChannelType",
-    "Message"
+    "Message",
+    "ReadState",
+    "Attachment"
 ]
\ No newline at end of file
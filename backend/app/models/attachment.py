@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, JSON
+from sqlalchemy.sql import func
+from app.db.database import Base
+from app.core.snowflake import next_id
+
+class Attachment(Base):
+    __tablename__ = "attachments"
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=False, default=next_id)
+    # Без внешнего ключа: вложение привязывается при отправке, а строка сообщения пишется позже пакетом
+    message_id = Column(BigInteger, nullable=True, index=True)
+    uploader_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    text_channel_id = Column(Integer, ForeignKey("text_channels.id", ondelete="CASCADE"), nullable=False)
+    filename = Column(String(255), nullable=False)
+    content_type = Column(String(255), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    # sha256 содержимого — он же ключ в хранилище: одинаковые файлы хранятся один раз
+    sha256 = Column(String(64), nullable=False, index=True)
+    # Для изображений: размеры для раскладки и уменьшенные копии [{size, width, height, bytes, url}]
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    thumbnails = Column(JSON, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,12 +1,15 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Text, Index, Computed
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.db.database import Base
+from app.core.snowflake import next_id
 
 class Message(Base):
     __tablename__ = "messages"
     
-    id = Column(Integer, primary_key=True, index=True)
+    # Snowflake id: известен до вставки, упорядочен по времени
+    id = Column(BigInteger, primary_key=True, index=True, autoincrement=False, default=next_id)
     content = Column(Text, nullable=False)
     author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     text_channel_id = Column(Integer, ForeignKey("text_channels.id"), nullable=False)
@@ -14,6 +17,29 @@ class Message(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     is_edited = Column(Integer, default=False)
     
+    # Полнотекстовый поиск: русская и английская морфология в одном векторе
+    search_vector = Column(
+        TSVECTOR,
+        Computed(
+            "to_tsvector('russian', coalesce(content, '')) || to_tsvector('english', coalesce(content, ''))",
+            persisted=True
+        )
+    )
+    
     # Отношения
     author = relationship("User", back_populates="messages")
-    text_channel = relationship("TextChannel", back_populates="messages")
\ No newline at end of file
+    text_channel = relationship("TextChannel", back_populates="messages")
+    attachments = relationship(
+        "Attachment",
+        primaryjoin="Message.id == foreign(Attachment.message_id)",
+        order_by="Attachment.id",
+        viewonly=True
+    )
+    
+    # Составной индекс: история канала читается диапазонным сканированием по (канал, id)
+    # Помесячные партиции по id (snowflake монотонен по времени) — см. app/services/partitions.py
+    __table_args__ = (
+        Index("ix_messages_text_channel_id_id", "text_channel_id", "id"),
+        Index("ix_messages_search_vector", "search_vector", postgresql_using="gin"),
+        {"postgresql_partition_by": "RANGE (id)"},
+    )
\ No newline at end of file
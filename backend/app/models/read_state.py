@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, BigInteger, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from app.db.database import Base
+
+class ReadState(Base):
+    __tablename__ = "read_states"
+    
+    # Одна строка на пару (пользователь, текстовый канал); непрочитанное = последнее сообщение канала новее
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    text_channel_id = Column(Integer, ForeignKey("text_channels.id", ondelete="CASCADE"), primary_key=True)
+    last_read_message_id = Column(BigInteger, nullable=False, default=0)
+    mention_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,8 +1,11 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, PlainSerializer, computed_field
 from datetime import datetime
-from typing import Optional
+from typing import Annotated, Optional, List
 from app.schemas.user import User
 
+# Snowflake-id в JSON — строкой: Number в JavaScript точен только до 2^53, а id давно больше
+SnowflakeId = Annotated[int, PlainSerializer(lambda value: str(value), return_type=str, when_used="json")]
+
 class MessageBase(BaseModel):
     content: str
 
@@ -12,14 +15,38 @@ class MessageCreate(MessageBase):
 class MessageUpdate(BaseModel):
     content: str
 
+class AttachmentThumbnail(BaseModel):
+    size: int
+    width: int
+    height: int
+    url: str
+
+class Attachment(BaseModel):
+    id: SnowflakeId
+    filename: str
+    content_type: str
+    size: int
+    width: Optional[int] = None
+    height: Optional[int] = None
+    thumbnails: Optional[List[AttachmentThumbnail]] = None
+
+    @computed_field
+    @property
+    def url(self) -> str:
+        return f"/api/attachments/{self.id}"
+
+    class Config:
+        from_attributes = True
+
 class Message(MessageBase):
-    id: int
+    id: SnowflakeId
     author_id: int
     text_channel_id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
     is_edited: bool
     author: User
+    attachments: List[Attachment] = []
 
     class Config:
         from_attributes = True
@@ -27,5 +54,21 @@ class Message(MessageBase):
 class MessageEvent(BaseModel):
     type: str  # "new_message", "edit_message", "delete_message"
     message: Optional[Message] = None
-    message_id: Optional[int] = None
-    text_channel_id: int
\ No newline at end of file
+    message_id: Optional[SnowflakeId] = None
+    text_channel_id: int
+
+class MessageSearchResult(BaseModel):
+    message: Message
+    rank: float
+    highlight: str
+
+class MessageSearchPage(BaseModel):
+    results: List[MessageSearchResult]
+    next_cursor: Optional[str] = None
+
+class ChannelReadState(BaseModel):
+    text_channel_id: int
+    last_read_message_id: SnowflakeId
+    latest_message_id: SnowflakeId
+    unread: bool
+    mention_count: int
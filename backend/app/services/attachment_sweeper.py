@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+from sqlalchemy import delete, exists, or_, select
+import asyncio
+import logging
+import os
+from app.core.config import settings
+from app.core.snowflake import snowflake_from_time
+from app.db.database import AsyncSessionLocal
+from app.models import Attachment, Message
+from app.services.partitions import oldest_partition_lower
+from app.services.storage import ObjectStorage, storage
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_BATCH = 500  # sha256 на один запрос проверки ссылок
+
+
+class AttachmentSweeper:
+    """Удаление осиротевших вложений: неотправленных, от удаленных сообщений и файлов без строк"""
+
+    def __init__(self, storage: ObjectStorage, orphan_ttl: float, interval: float):
+        self.storage = storage
+        self.orphan_ttl = orphan_ttl
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+        self.rows_removed = 0
+        self.files_removed = 0
+        self.uploads_removed = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"❌ Ошибка очистки вложений: {e}")
+
+    async def sweep(self) -> dict:
+        """Один проход; младше orphan_ttl ничего не трогается — загрузка могла еще не дойти до сообщения"""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.orphan_ttl)
+        rows = await self._remove_rows(cutoff)
+        files = await self._remove_files(cutoff.timestamp())
+        uploads = await self.storage.sweep_uploads(self.orphan_ttl)
+        self.rows_removed += rows
+        self.files_removed += files
+        self.uploads_removed += uploads
+        if rows or files or uploads:
+            logger.info(f"🧹 Очистка вложений: строк {rows}, файлов {files}, брошенных загрузок {uploads}")
+        return {"rows": rows, "files": files, "uploads": uploads}
+
+    async def _remove_rows(self, cutoff: datetime) -> int:
+        """Не отправленные в сообщении и привязанные к сообщению, строки которого нет"""
+        async with AsyncSessionLocal() as db:
+            orphaned = [Attachment.message_id.is_(None) & (Attachment.created_at < cutoff)]
+            # Сообщения отсоединенных архивом партиций тоже без строк, но их вложения не сироты:
+            # проверяются только id не старше самой старой присоединенной месячной партиции
+            floor = await oldest_partition_lower(db)
+            if floor is not None:
+                # id сообщения — snowflake: старое сообщение без строки уже не будет записано пакетом
+                orphaned.append(
+                    (Attachment.message_id >= floor)
+                    & (Attachment.message_id < snowflake_from_time(cutoff))
+                    & ~exists().where(Message.id == Attachment.message_id)
+                )
+            result = await db.execute(
+                delete(Attachment)
+                .where(or_(*orphaned))
+                .returning(Attachment.id)
+            )
+            removed = len(result.all())
+            await db.commit()
+        return removed
+
+    async def _remove_files(self, cutoff: float) -> int:
+        """Оригиналы и уменьшенные копии, на содержимое которых не ссылается ни одно вложение"""
+        removed = 0
+        batch: Dict[str, List[str]] = {}  # sha256 -> ключи (оригинал и копии)
+        async for key, modified in self.storage.iter_keys():
+            if modified >= cutoff:
+                continue
+            batch.setdefault(os.path.basename(key).split(".")[0], []).append(key)
+            if len(batch) >= REFERENCE_BATCH:
+                removed += await self._remove_unreferenced(batch, cutoff)
+                batch = {}
+        if batch:
+            removed += await self._remove_unreferenced(batch, cutoff)
+        return removed
+
+    async def _remove_unreferenced(self, batch: Dict[str, List[str]], cutoff: float) -> int:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(Attachment.sha256).where(Attachment.sha256.in_(list(batch))).distinct())
+            referenced = set(result.scalars().all())
+        removed = 0
+        for sha256, keys in batch.items():
+            if sha256 in referenced:
+                continue
+            for key in keys:
+                # Повторная загрузка того же файла обновляет время — ее строка может быть еще не записана
+                modified = await self.storage.modified_at(key)
+                if modified is not None and modified < cutoff:
+                    await self.storage.delete(key)
+                    removed += 1
+        return removed
+
+    def get_stats(self) -> dict:
+        return {
+            "rows_removed": self.rows_removed,
+            "files_removed": self.files_removed,
+            "uploads_removed": self.uploads_removed
+        }
+
+
+# Глобальная очистка вложений
+attachment_sweeper = AttachmentSweeper(
+    storage=storage,
+    orphan_ttl=settings.ATTACHMENT_ORPHAN_TTL,
+    interval=settings.ATTACHMENT_SWEEP_INTERVAL
+)
@@ -0,0 +1,254 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+from av import AudioFrame, AudioResampler
+from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
+import asyncio
+import fractions
+import logging
+import time
+import numpy as np
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Кадр Opus в aiortc: 20 мс, 48 кГц, стерео s16 с чередованием каналов
+SAMPLE_RATE = 48000
+FRAME_SAMPLES = 960
+CHANNELS = 2
+FRAME_LENGTH = FRAME_SAMPLES * CHANNELS
+FRAME_TIME = FRAME_SAMPLES / SAMPLE_RATE
+TIME_BASE = fractions.Fraction(1, SAMPLE_RATE)
+SILENCE_RMS = 100.0  # ниже — участник молчит и в микс не попадает
+INPUT_BUFFER_FRAMES = 3  # кадров на источник; больше — старые отбрасываются, чтобы не копить задержку
+LISTENER_BUFFER_FRAMES = 3
+MAX_LAG_FRAMES = 5  # отставание такта, после которого часы микшера сбрасываются
+
+
+def mix_frames(frames: np.ndarray, listeners: np.ndarray, max_speakers: int) -> np.ndarray:
+    """Миксы для всех слушателей за один кадр.
+
+    frames — (источников, FRAME_LENGTH) int16; listeners — индекс источника каждого слушателя
+    или -1, если слушатель сам не говорит. Звучат не более max_speakers самых громких источников,
+    каждый слушатель получает их сумму без своего голоса, обрезанную до int16.
+    """
+    pcm = frames.astype(np.float32)
+    energy = np.einsum("ij,ij->i", pcm, pcm) / pcm.shape[1]
+    active = energy > SILENCE_RMS * SILENCE_RMS
+    if max_speakers > 0 and np.count_nonzero(active) > max_speakers:
+        quiet = np.argpartition(energy, -max_speakers)[:-max_speakers]
+        active[quiet] = False
+    gains = active.astype(np.float32)
+    total = gains @ pcm
+    mixes = np.repeat(total[np.newaxis, :], len(listeners), axis=0)
+    speaking = listeners >= 0
+    own = listeners[speaking]
+    mixes[speaking] -= pcm[own] * gains[own, np.newaxis]
+    np.clip(mixes, -32768, 32767, out=mixes)
+    return mixes.astype(np.int16)
+
+
+class MixInput:
+    """Декодированный звук участника: кадры складываются в короткий буфер до следующего такта"""
+
+    def __init__(self, track: MediaStreamTrack):
+        self.track = track
+        self._pending = np.zeros(0, dtype=np.int16)
+        self._resampler: Optional[AudioResampler] = None
+        self._task = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            while True:
+                frame = await self.track.recv()
+                if frame.format.name == "s16" and frame.layout.name == "stereo" and frame.sample_rate == SAMPLE_RATE:
+                    self._append(frame.to_ndarray())
+                    continue
+                # Opus aiortc декодирует сразу в нужный формат; другие кодеки приводятся к нему
+                if self._resampler is None:
+                    self._resampler = AudioResampler(format="s16", layout="stereo", rate=SAMPLE_RATE)
+                for converted in self._resampler.resample(frame):
+                    self._append(converted.to_ndarray())
+        except MediaStreamError:
+            pass
+
+    def _append(self, pcm: np.ndarray):
+        self._pending = np.concatenate((self._pending, pcm.reshape(-1)))[-INPUT_BUFFER_FRAMES * FRAME_LENGTH:]
+
+    def pop(self) -> Optional[np.ndarray]:
+        """Кадр для такта; None — источник не успел, в миксе он молчит"""
+        if len(self._pending) < FRAME_LENGTH:
+            return None
+        frame, self._pending = self._pending[:FRAME_LENGTH], self._pending[FRAME_LENGTH:]
+        return frame
+
+    def stop(self):
+        self._task.cancel()
+        self.track.stop()
+
+
+class MixedAudioTrack(MediaStreamTrack):
+    """Микс для одного слушателя; отправитель aiortc кодирует его в один поток Opus"""
+
+    kind = "audio"
+
+    def __init__(self):
+        super().__init__()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._pts = 0
+
+    def push(self, pcm: np.ndarray):
+        if self._queue.qsize() >= LISTENER_BUFFER_FRAMES:
+            self._queue.get_nowait()
+        self._queue.put_nowait(pcm)
+
+    async def recv(self):
+        if self.readyState != "live":
+            raise MediaStreamError
+        pcm = await self._queue.get()
+        if pcm is None:
+            raise MediaStreamError
+        frame = AudioFrame(format="s16", layout="stereo", samples=FRAME_SAMPLES)
+        frame.planes[0].update(pcm.tobytes())
+        frame.pts = self._pts
+        frame.sample_rate = SAMPLE_RATE
+        frame.time_base = TIME_BASE
+        self._pts += FRAME_SAMPLES
+        return frame
+
+    def stop(self):
+        if self.readyState == "live":
+            super().stop()
+            self._queue.put_nowait(None)
+
+
+class RoomMix:
+    """Сведение одной комнаты: каждые 20 мс кадры всех источников смешиваются в пуле потоков"""
+
+    def __init__(self, mixer: "AudioMixer", channel_id: int):
+        self.mixer = mixer
+        self.channel_id = channel_id
+        self.inputs: Dict[int, MixInput] = {}
+        self.listeners: Dict[int, MixedAudioTrack] = {}
+        self._task = asyncio.create_task(self._run())
+
+    def add_input(self, user_id: int, track: MediaStreamTrack):
+        self.remove_input(user_id)
+        self.inputs[user_id] = MixInput(track)
+
+    def remove_input(self, user_id: int):
+        source = self.inputs.pop(user_id, None)
+        if source is not None:
+            source.stop()
+
+    def add_listener(self, user_id: int) -> MixedAudioTrack:
+        self.remove_listener(user_id)
+        track = self.listeners[user_id] = MixedAudioTrack()
+        return track
+
+    def remove_listener(self, user_id: int):
+        track = self.listeners.pop(user_id, None)
+        if track is not None:
+            track.stop()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        ticks = 0
+        while True:
+            ticks += 1
+            delay = started + ticks * FRAME_TIME - loop.time()
+            if delay < -MAX_LAG_FRAMES * FRAME_TIME:
+                # Пул не успевал: догонять пачкой бессмысленно, отсчет начинается заново
+                self.mixer.late_ticks_total += 1
+                started, ticks = loop.time(), 0
+            await asyncio.sleep(max(delay, 0))
+            if not self.listeners:
+                continue
+            await self._tick(loop)
+
+    async def _tick(self, loop: asyncio.AbstractEventLoop):
+        sources: List[int] = []
+        frames: List[np.ndarray] = []
+        for user_id, source in self.inputs.items():
+            frame = source.pop()
+            if frame is not None:
+                sources.append(user_id)
+                frames.append(frame)
+        listener_ids = list(self.listeners)
+        if not frames:
+            silence = np.zeros(FRAME_LENGTH, dtype=np.int16)
+            for user_id in listener_ids:
+                self.listeners[user_id].push(silence)
+            return
+        index = {user_id: i for i, user_id in enumerate(sources)}
+        listeners = np.array([index.get(user_id, -1) for user_id in listener_ids], dtype=np.intp)
+        started = time.perf_counter()
+        mixes = await loop.run_in_executor(
+            self.mixer.executor, mix_frames, np.stack(frames), listeners, self.mixer.max_speakers
+        )
+        self.mixer.mix_seconds_total += time.perf_counter() - started
+        self.mixer.ticks_total += 1
+        for user_id, pcm in zip(listener_ids, mixes):
+            track = self.listeners.get(user_id)
+            if track is not None:
+                track.push(pcm)
+
+    def stop(self):
+        self._task.cancel()
+        for user_id in list(self.inputs):
+            self.remove_input(user_id)
+        for user_id in list(self.listeners):
+            self.remove_listener(user_id)
+
+
+class AudioMixer:
+    """Серверное сведение звука (MCU) для слушателей со слабым каналом: один поток Opus вместо потока на участника"""
+
+    def __init__(self, workers: int, max_speakers: int):
+        self.workers = workers
+        self.max_speakers = max_speakers
+        self.rooms: Dict[int, RoomMix] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.ticks_total = 0
+        self.late_ticks_total = 0
+        self.mix_seconds_total = 0.0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # Потоки, а не процессы: NumPy отпускает GIL, а кадры не нужно сериализовать каждые 20 мс
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="audio-mix")
+            logger.info(f"🎚️ Сведение звука: {self.workers} потоков, до {self.max_speakers} голосов в миксе")
+        return self._executor
+
+    def open(self, channel_id: int) -> RoomMix:
+        room = self.rooms.get(channel_id)
+        if room is None:
+            room = self.rooms[channel_id] = RoomMix(self, channel_id)
+        return room
+
+    def close(self, channel_id: int):
+        room = self.rooms.pop(channel_id, None)
+        if room is not None:
+            room.stop()
+
+    async def stop(self):
+        for channel_id in list(self.rooms):
+            self.close(channel_id)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def get_stats(self) -> dict:
+        return {
+            "rooms": len(self.rooms),
+            "listeners": sum(len(room.listeners) for room in self.rooms.values()),
+            "inputs": sum(len(room.inputs) for room in self.rooms.values()),
+            "ticks": self.ticks_total,
+            "late_ticks": self.late_ticks_total,
+            "avg_mix_us": round(self.mix_seconds_total / self.ticks_total * 1e6, 1) if self.ticks_total else 0.0
+        }
+
+
+# Глобальный микшер голосовых комнат
+audio_mixer = AudioMixer(settings.VOICE_MIX_WORKERS, settings.VOICE_MIX_MAX_SPEAKERS)
@@ -0,0 +1,128 @@
+from typing import AsyncIterator, Iterable, List, Optional, Sequence
+from sqlalchemy import select, tuple_
+import csv
+import io
+import zlib
+from app.core.config import settings
+from app.core.serialization import dumps_bytes
+from app.db.database import engine
+from app.models import Message, User
+
+FORMATS = ("ndjson", "csv")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+EXPORT_COLUMNS = ("id", "text_channel_id", "author_id", "author", "created_at", "updated_at", "is_edited", "content")
+# Порция ответа: мелкие строки склеиваются, чтобы не отправлять тысячи крошечных чанков
+FLUSH_BYTES = 256 * 1024
+
+
+def check_cursor(text_channel_ids: Sequence[int], after: Optional[int], after_text_channel: Optional[int]):
+    """Выгрузка идет по (канал, id): для нескольких каналов одного id недостаточно, чтобы продолжить"""
+    if after is not None and after_text_channel is None and len(text_channel_ids) > 1:
+        raise ValueError("Для нескольких каналов курсор — пара after_text_channel и after")
+
+
+def export_query(text_channel_ids: Sequence[int], after: Optional[int] = None, after_text_channel: Optional[int] = None):
+    """Только нужные колонки кортежами, без ORM-объектов; порядок совпадает с индексом (канал, id)"""
+    check_cursor(text_channel_ids, after, after_text_channel)
+    query = (
+        select(
+            Message.id,
+            Message.text_channel_id,
+            Message.author_id,
+            User.username,
+            Message.created_at,
+            Message.updated_at,
+            Message.is_edited,
+            Message.content
+        )
+        .join(User, User.id == Message.author_id)
+        .where(Message.text_channel_id.in_(text_channel_ids))
+        .order_by(Message.text_channel_id, Message.id)
+    )
+    if after is not None and after_text_channel is not None:
+        # Сравнение строк: остаток канала after_text_channel и все следующие каналы целиком
+        query = query.where(tuple_(Message.text_channel_id, Message.id) > tuple_(after_text_channel, after))
+    elif after is not None:
+        query = query.where(Message.id > after)
+    return query
+
+
+def _isoformat(value) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def encode_ndjson(rows: Iterable[Sequence]) -> bytes:
+    return b"".join(
+        dumps_bytes({
+            "id": str(row[0]),
+            "text_channel_id": row[1],
+            "author_id": row[2],
+            "author": row[3],
+            "created_at": _isoformat(row[4]),
+            "updated_at": _isoformat(row[5]),
+            "is_edited": bool(row[6]),
+            "content": row[7]
+        }) + b"\n"
+        for row in rows
+    )
+
+
+def encode_csv(rows: Iterable[Sequence], header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    writer.writerows(
+        (row[0], row[1], row[2], row[3], _isoformat(row[4]), _isoformat(row[5]), int(bool(row[6])), row[7])
+        for row in rows
+    )
+    return buffer.getvalue().encode("utf-8")
+
+
+def export_filename(name: str, fmt: str, compress: bool) -> str:
+    return f"{name}.{fmt}" + (".gz" if compress else "")
+
+
+async def stream_export(
+    text_channel_ids: List[int],
+    fmt: str,
+    compress: bool = False,
+    after: Optional[int] = None,
+    after_text_channel: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """Выгрузка сообщений серверным курсором: в памяти одновременно только одна порция строк"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+    compressor = zlib.compressobj(settings.EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31) if compress else None
+    pending: List[bytes] = []
+    pending_size = 0
+
+    def append(chunk: bytes) -> bool:
+        """Добавить порцию в буфер ответа; True — буфер пора отправить"""
+        nonlocal pending_size
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        pending.append(chunk)
+        pending_size += len(chunk)
+        return pending_size >= FLUSH_BYTES
+
+    if fmt == "csv":
+        append(encode_csv((), header=True))
+
+    if text_channel_ids:
+        # Отдельное соединение: сессия запроса закрывается до начала передачи ответа
+        async with engine.connect() as conn:
+            result = await conn.stream(
+                export_query(text_channel_ids, after, after_text_channel).execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+            )
+            async for rows in result.partitions():
+                if append(encode_ndjson(rows) if fmt == "ndjson" else encode_csv(rows)):
+                    yield b"".join(pending)
+                    pending.clear()
+                    pending_size = 0
+
+    if compressor is not None:
+        pending.append(compressor.flush())
+    body = b"".join(pending)
+    if body:
+        yield body
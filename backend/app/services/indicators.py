@@ -0,0 +1,132 @@
+from typing import Callable, Dict, Hashable, List, Tuple
+import asyncio
+import logging
+import math
+import time
+from app.core.config import settings
+from app.services.voice_state import voice_states
+from app.websocket.connection_manager import manager
+
+logger = logging.getLogger(__name__)
+
+SPEAKING = "speaking"
+TYPING = "typing"
+
+
+class IndicatorSet:
+    """Индикаторы одного канала: текущее состояние и то, что клиенты уже видели"""
+
+    def __init__(self):
+        # ключ -> (истекает, запись для started, запись для stopped)
+        self.current: Dict[Hashable, Tuple[float, object, object]] = {}
+        self.announced: Dict[Hashable, object] = {}  # ключ -> запись для stopped
+
+    def diff(self, now: float) -> Tuple[list, list]:
+        """Что изменилось с прошлого такта; включение и выключение внутри такта взаимно гасятся"""
+        for key, (expires, _, _) in list(self.current.items()):
+            if expires <= now:
+                del self.current[key]
+        started = [entry for key, (_, entry, _) in self.current.items() if key not in self.announced]
+        stopped = [entry for key, entry in self.announced.items() if key not in self.current]
+        self.announced = {key: entry for key, (_, _, entry) in self.current.items()}
+        return started, stopped
+
+
+class IndicatorEngine:
+    """Кто говорит и кто печатает: изменения копятся и уходят одним кадром на канал за такт"""
+
+    def __init__(self, tick_interval: float, typing_ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.tick_interval = tick_interval
+        self.typing_ttl = typing_ttl
+        self.clock = clock
+        self.speaking: Dict[int, IndicatorSet] = {}  # голосовой канал -> кто говорит
+        self.typing: Dict[int, IndicatorSet] = {}  # сервер -> кто печатает и в каком текстовом канале
+        self._task: asyncio.Task | None = None
+        self.events_total = 0
+        self.frames_total = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def set_speaking(self, channel_id: int, user_id: int, is_speaking: bool):
+        self.events_total += 1
+        indicators = self.speaking.setdefault(channel_id, IndicatorSet())
+        if is_speaking:
+            indicators.current[user_id] = (math.inf, user_id, user_id)
+        else:
+            indicators.current.pop(user_id, None)
+
+    def forget_speaking(self, channel_id: int, user_id: int):
+        """Выход из комнаты: о нем уже сообщает user_left_voice, отдельный кадр не нужен"""
+        indicators = self.speaking.get(channel_id)
+        if indicators is not None:
+            indicators.current.pop(user_id, None)
+            indicators.announced.pop(user_id, None)
+
+    def set_typing(self, channel_id: int, text_channel_id: int, user_id: int, username: str):
+        """Повторный typing только продлевает индикатор; без него индикатор гаснет через typing_ttl"""
+        self.events_total += 1
+        self.typing.setdefault(channel_id, IndicatorSet()).current[(user_id, text_channel_id)] = (
+            self.clock() + self.typing_ttl,
+            {"user": {"id": user_id, "username": username}, "text_channel_id": text_channel_id},
+            {"user_id": user_id, "text_channel_id": text_channel_id}
+        )
+
+    def stop_typing(self, channel_id: int, user_id: int, text_channel_id: int = None):
+        """Сообщение отправлено или соединение закрыто: индикатор гаснет, не дожидаясь истечения"""
+        indicators = self.typing.get(channel_id)
+        if indicators is None:
+            return
+        for key in list(indicators.current):
+            if key[0] == user_id and (text_channel_id is None or key[1] == text_channel_id):
+                del indicators.current[key]
+
+    def collect(self, now: float) -> List[Tuple[str, int, dict]]:
+        """Кадры такта: (вид, канал, сообщение) — не больше одного на канал"""
+        frames = []
+        for kind, channels in ((SPEAKING, self.speaking), (TYPING, self.typing)):
+            for channel_id, indicators in list(channels.items()):
+                started, stopped = indicators.diff(now)
+                if started or stopped:
+                    frames.append((kind, channel_id, {"type": f"{kind}_update", "started": started, "stopped": stopped}))
+                if not indicators.current and not indicators.announced:
+                    del channels[channel_id]
+        return frames
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            await self.flush()
+
+    async def flush(self):
+        for kind, channel_id, message in self.collect(self.clock()):
+            self.frames_total += 1
+            try:
+                if kind == SPEAKING:
+                    await voice_states.broadcast(channel_id, message)
+                else:
+                    await manager.send_to_channel(channel_id, message, ephemeral=True)
+            except Exception as e:
+                logger.error(f"❌ Ошибка рассылки индикаторов {kind} в канал {channel_id}: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            "speaking_channels": len(self.speaking),
+            "typing_channels": len(self.typing),
+            "events_total": self.events_total,
+            "frames_total": self.frames_total
+        }
+
+
+# Глобальный движок индикаторов
+indicators = IndicatorEngine(settings.INDICATOR_TICK_INTERVAL, settings.TYPING_TTL)
@@ -0,0 +1,233 @@
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+import logging
+import math
+import time
+from app.core.config import settings
+from app.core.serialization import dumps_bytes
+from app.models import User
+from app.schemas.message import Message as MessageSchema
+from app.schemas.user import User as UserSchema
+from app.websocket.connection_manager import manager
+
+logger = logging.getLogger(__name__)
+
+
+def serialize_message(message) -> bytes:
+    """Сообщение (ORM-объект с автором) в JSON схемы Message"""
+    return dumps_bytes(MessageSchema.model_validate(message).model_dump(mode="json"))
+
+
+def serialize_new_message(row: dict, author: User, attachments: List[dict]) -> bytes:
+    """Только что принятое сообщение в JSON схемы Message (без обращения к БД)"""
+    return dumps_bytes(MessageSchema(
+        **row,
+        updated_at=None,
+        is_edited=False,
+        author=UserSchema.model_validate(author),
+        attachments=attachments
+    ).model_dump(mode="json"))
+
+
+@dataclass
+class CachedChannel:
+    items: Deque[tuple] = field(default_factory=deque)  # (message_id, json) от старых к новым
+    size: int = 0
+    complete: bool = False  # в канале нет сообщений старше закэшированных
+    expires: float = math.inf  # после этого момента канал перечитывается из БД
+
+
+class RecentMessagesCache:
+    """Последние сообщения горячих текстовых каналов: LRU в процессе (лимит по байтам) или общий список в Redis"""
+
+    def __init__(self, per_channel: int, max_bytes: int, use_redis: bool, local_ttl: float):
+        self.per_channel = per_channel
+        self.max_bytes = max_bytes
+        self.use_redis = use_redis
+        self.local_ttl = local_ttl
+        self.redis_client = None
+        self.channels: "OrderedDict[int, CachedChannel]" = OrderedDict()
+        self.total_bytes = 0
+        self._filling: Dict[int, bool] = {}  # канал -> не было ли записей во время загрузки из БД
+        self.hits = 0
+        self.misses = 0
+        self.remote_updates = 0
+        # LRU есть у каждого процесса: новые сообщения и сбросы остальных узлов приходят через pub/sub
+        manager.register_redis_handler("message_cache", self._handle_remote)
+
+    def attach_redis(self, redis_client):
+        self.redis_client = redis_client if self.use_redis else None
+
+    async def get_latest(self, text_channel_id: int, limit: int) -> Optional[List[bytes]]:
+        """Последние limit сообщений (от старых к новым) или None при промахе"""
+        if self.redis_client is not None:
+            items = await self._redis_latest(text_channel_id, limit)
+        else:
+            items = self._local_latest(text_channel_id, limit)
+        if items is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return items
+
+    def _local_latest(self, text_channel_id: int, limit: int) -> Optional[List[bytes]]:
+        entry = self.channels.get(text_channel_id)
+        if entry is not None and entry.expires <= time.monotonic():
+            # Страховка от пропущенной рассылки: устаревший канал перечитывается из БД
+            self.invalidate_local(text_channel_id)
+            return None
+        if entry is None or (len(entry.items) < limit and not entry.complete):
+            return None
+        self.channels.move_to_end(text_channel_id)
+        return [item for _, item in list(entry.items)[-limit:]]
+
+    async def _redis_latest(self, text_channel_id: int, limit: int) -> Optional[List[bytes]]:
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.lrange(self._key(text_channel_id), -limit, -1)
+                pipe.exists(self._complete_key(text_channel_id))
+                items, complete = await pipe.execute()
+        except Exception as e:
+            logger.error(f"❌ Ошибка чтения кэша сообщений из Redis: {e}")
+            return None
+        if len(items) < limit and not complete:
+            return None
+        return items
+
+    def begin_fill(self, text_channel_id: int):
+        """Отметка перед чтением страницы из БД: запись в канал во время чтения отменит заполнение"""
+        self._filling[text_channel_id] = True
+
+    async def fill(self, text_channel_id: int, messages: List[tuple], complete: bool):
+        """Заполнение кэша страницей из БД: [(message_id, json)] от старых к новым"""
+        if not self._filling.pop(text_channel_id, False):
+            return
+        messages = messages[-self.per_channel:]
+        if self.redis_client is not None:
+            key = self._key(text_channel_id)
+            try:
+                async with self.redis_client.pipeline(transaction=True) as pipe:
+                    pipe.delete(key, self._complete_key(text_channel_id))
+                    if messages:
+                        pipe.rpush(key, *(item for _, item in messages))
+                        pipe.expire(key, settings.MESSAGE_CACHE_REDIS_TTL)
+                    if complete:
+                        pipe.set(self._complete_key(text_channel_id), 1, ex=settings.MESSAGE_CACHE_REDIS_TTL)
+                    await pipe.execute()
+            except Exception as e:
+                logger.error(f"❌ Ошибка заполнения кэша сообщений в Redis: {e}")
+            return
+
+        self.invalidate_local(text_channel_id)
+        entry = CachedChannel(complete=complete, expires=time.monotonic() + self.local_ttl)
+        for message_id, item in messages:
+            entry.items.append((message_id, item))
+            entry.size += len(item)
+        self.channels[text_channel_id] = entry
+        self.total_bytes += entry.size
+        self._evict()
+
+    async def append(self, text_channel_id: int, message_id: int, item: bytes):
+        """Новое сообщение — только в уже прогретый канал, иначе кэш был бы неполным"""
+        self._cancel_fill(text_channel_id)
+        if self.redis_client is not None:
+            key = self._key(text_channel_id)
+            try:
+                async with self.redis_client.pipeline(transaction=True) as pipe:
+                    pipe.rpushx(key, item)
+                    pipe.ltrim(key, -self.per_channel, -1)
+                    await pipe.execute()
+            except Exception as e:
+                logger.error(f"❌ Ошибка добавления в кэш сообщений Redis: {e}")
+            return
+
+        self._append_local(text_channel_id, message_id, item)
+        await manager.publish(
+            f"message_cache:{text_channel_id}",
+            {"op": "append", "id": str(message_id), "item": item.decode()}
+        )
+
+    def _append_local(self, text_channel_id: int, message_id: int, item: bytes):
+        entry = self.channels.get(text_channel_id)
+        if entry is None:
+            return
+        if entry.items and entry.items[-1][0] >= message_id:
+            # Пакеты разных узлов пришли не по порядку id — вставлять в середину дороже, чем перечитать
+            self.invalidate_local(text_channel_id)
+            return
+        entry.items.append((message_id, item))
+        entry.size += len(item)
+        self.total_bytes += len(item)
+        while len(entry.items) > self.per_channel:
+            _, dropped = entry.items.popleft()
+            entry.size -= len(dropped)
+            self.total_bytes -= len(dropped)
+            entry.complete = False
+        self._evict()
+
+    async def invalidate(self, text_channel_id: int):
+        """Сброс канала после редактирования или удаления сообщения"""
+        self._cancel_fill(text_channel_id)
+        if self.redis_client is not None:
+            try:
+                await self.redis_client.delete(self._key(text_channel_id), self._complete_key(text_channel_id))
+            except Exception as e:
+                logger.error(f"❌ Ошибка инвалидации кэша сообщений в Redis: {e}")
+            return
+        self.invalidate_local(text_channel_id)
+        await manager.publish(f"message_cache:{text_channel_id}", {"op": "invalidate"})
+
+    async def _handle_remote(self, key: str, data: Any):
+        """Новое сообщение или сброс канала на другом узле"""
+        text_channel_id = int(key)
+        self.remote_updates += 1
+        self._cancel_fill(text_channel_id)
+        if data.get("op") == "append":
+            self._append_local(text_channel_id, int(data["id"]), data["item"].encode())
+        else:
+            self.invalidate_local(text_channel_id)
+
+    def _cancel_fill(self, text_channel_id: int):
+        if text_channel_id in self._filling:
+            self._filling[text_channel_id] = False
+
+    def invalidate_local(self, text_channel_id: int):
+        entry = self.channels.pop(text_channel_id, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+
+    def _evict(self):
+        """Вытеснение давно не читавшихся каналов сверх лимита по байтам"""
+        while self.total_bytes > self.max_bytes and self.channels:
+            _, entry = self.channels.popitem(last=False)
+            self.total_bytes -= entry.size
+
+    @staticmethod
+    def _key(text_channel_id: int) -> str:
+        return f"recent_messages:{text_channel_id}"
+
+    @staticmethod
+    def _complete_key(text_channel_id: int) -> str:
+        return f"recent_messages_complete:{text_channel_id}"
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'backend': 'redis' if self.redis_client is not None else 'memory',
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+            'channels': len(self.channels),
+            'remote_updates': self.remote_updates,
+            'bytes': self.total_bytes
+        }
+
+
+# Глобальный экземпляр кэша
+message_cache = RecentMessagesCache(
+    per_channel=settings.MESSAGE_CACHE_PER_CHANNEL,
+    max_bytes=settings.MESSAGE_CACHE_MAX_BYTES,
+    use_redis=settings.MESSAGE_CACHE_REDIS,
+    local_ttl=settings.MESSAGE_CACHE_LOCAL_TTL
+)
@@ -0,0 +1,304 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from fastapi import WebSocket
+from sqlalchemy import select, insert, update
+from sqlalchemy.exc import DataError, IntegrityError
+import asyncio
+import logging
+import time
+from app.core.config import settings
+from app.core.serialization import dumps
+from app.core.snowflake import next_id, parse_snowflake
+from app.db.database import AsyncSessionLocal
+from app.models import Attachment, Message, TextChannel, User
+from app.schemas.message import Attachment as AttachmentSchema
+from app.websocket.connection_manager import manager
+from app.services.message_cache import message_cache, serialize_new_message
+from app.services.read_state import read_states
+
+logger = logging.getLogger(__name__)
+
+
+class TextChannelCache:
+    """Кэш метаданных текстовых каналов: text_channel_id -> channel_id сервера"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[int, Tuple[Optional[int], float]] = {}
+
+    async def get_server_id(self, text_channel_id: int) -> Optional[int]:
+        """id сервера канала или None, если канала нет"""
+        entry = self._entries.get(text_channel_id)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(TextChannel.channel_id).where(TextChannel.id == text_channel_id)
+            )
+            server_id = result.scalar_one_or_none()
+        self._entries[text_channel_id] = (server_id, time.monotonic() + self.ttl)
+        return server_id
+
+    def invalidate(self, text_channel_id: int):
+        self._entries.pop(text_channel_id, None)
+
+
+@dataclass
+class PendingMessage:
+    row: dict
+    author: User
+    server_id: int
+    sender: WebSocket
+    nonce: Optional[str]
+    attachments: List[dict] = field(default_factory=list)
+
+
+class MessageIngest:
+    """Прием сообщений чата: мгновенная рассылка и групповая запись в БД (write-behind)"""
+
+    def __init__(self, batch_size: int, flush_interval: float, queue_size: int, queue_timeout: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_timeout = queue_timeout
+        self.channels = TextChannelCache(settings.TEXT_CHANNEL_CACHE_TTL)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.persisted_total = 0
+        self.failed_total = 0
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        """Запуск фоновой записи"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"💾 Запись сообщений: пакет до {self.batch_size}, окно {self.flush_interval * 1000:.0f} мс")
+
+    async def stop(self):
+        """Остановка с записью всего, что осталось в очереди"""
+        if self._task is None:
+            return
+        if not self._task.done():
+            await self.queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(
+        self,
+        user: User,
+        server_id: int,
+        text_channel_id: int,
+        content: str,
+        sender: WebSocket,
+        nonce: Optional[str] = None,
+        attachment_ids: Optional[List[int]] = None
+    ) -> Optional[dict]:
+        """Проверка, назначение id, рассылка участникам и постановка в очередь записи"""
+        if not self.running or self.queue.full():
+            # Запись остановлена или не успевает: сообщение отклоняется до рассылки
+            return None
+        if await self.channels.get_server_id(text_channel_id) != server_id:
+            return None
+
+        message_id = next_id()
+        attachments = []
+        if attachment_ids:
+            attachments = await self._claim_attachments(message_id, user.id, text_channel_id, attachment_ids)
+        if not content and not attachments:
+            return None
+
+        created_at = datetime.now(timezone.utc)
+        row = {
+            "id": message_id,
+            "content": content,
+            "author_id": user.id,
+            "text_channel_id": text_channel_id,
+            "created_at": created_at
+        }
+        payload = {
+            "type": "message",
+            "id": str(message_id),
+            "content": content,
+            "author": {
+                "id": user.id,
+                "username": user.username
+            },
+            "timestamp": created_at.isoformat(),
+            "text_channel_id": text_channel_id,
+            "attachments": attachments
+        }
+        if nonce is not None:
+            payload["nonce"] = nonce
+
+        await manager.send_to_channel(server_id, payload)
+        pending = PendingMessage(row, user, server_id, sender, nonce, attachments)
+        try:
+            # Очередь могла заполниться за время рассылки — ждем места не дольше queue_timeout
+            await asyncio.wait_for(self.queue.put(pending), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"❌ Очередь записи сообщений заполнена, сообщение {message_id} отозвано")
+            self.failed_total += 1
+            await self._revoke([pending])
+        return payload
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def _claim_attachments(self, message_id: int, user_id: int, text_channel_id: int, attachment_ids: List[int]) -> List[dict]:
+        """Привязка загруженных пользователем вложений к сообщению (только свободных и из этого канала)"""
+        ids = [aid for aid in map(parse_snowflake, attachment_ids) if aid is not None][:settings.ATTACHMENT_MAX_PER_MESSAGE]
+        if not ids:
+            return []
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(Attachment)
+                .where(
+                    Attachment.id.in_(ids),
+                    Attachment.uploader_id == user_id,
+                    Attachment.text_channel_id == text_channel_id,
+                    Attachment.message_id.is_(None)
+                )
+                .values(message_id=message_id)
+                .returning(
+                    Attachment.id, Attachment.filename, Attachment.content_type, Attachment.size,
+                    Attachment.width, Attachment.height, Attachment.thumbnails
+                )
+                .execution_options(synchronize_session=False)
+            )
+            rows = sorted(result.all(), key=lambda row: row.id)
+            await db.commit()
+        return [AttachmentSchema.model_validate(row).model_dump(mode="json") for row in rows]
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            # Ждем первое сообщение, затем добираем пакет в пределах окна
+            pending = await self.queue.get()
+            if pending is None:
+                break
+            batch = [pending]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    pending = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        pending = await asyncio.wait_for(self.queue.get(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if pending is None:
+                    stopping = True
+                    break
+                batch.append(pending)
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                # Сбой после записи (рассылка, кэш) не должен останавливать прием сообщений
+                logger.error(f"❌ Ошибка обработки пакета из {len(batch)} сообщений: {e}")
+
+    async def _flush(self, batch: List[PendingMessage]):
+        """Одна транзакция и один bulk insert на весь пакет, затем подтверждения отправителям"""
+        if not batch:
+            return
+        persisted, failed = await self._insert(batch)
+        if failed:
+            self.failed_total += len(failed)
+            await self._revoke(failed)
+        if not persisted:
+            return
+
+        self.persisted_total += len(persisted)
+        try:
+            await read_states.messages_persisted([(pending.server_id, pending.row) for pending in persisted])
+        except Exception as e:
+            logger.error(f"❌ Ошибка обновления позиций прочтения: {e}")
+        for pending in persisted:
+            # В кэш последних сообщений попадает только записанное в БД
+            await message_cache.append(
+                pending.row["text_channel_id"],
+                pending.row["id"],
+                serialize_new_message(pending.row, pending.author, pending.attachments)
+            )
+            await manager.send_personal_message(dumps({
+                "type": "message_ack",
+                "id": str(pending.row["id"]),
+                "nonce": pending.nonce,
+                "text_channel_id": pending.row["text_channel_id"]
+            }), pending.sender)
+        logger.debug(f"💾 Записан пакет из {len(persisted)} сообщений")
+
+    async def _insert(self, batch: List[PendingMessage]) -> Tuple[List[PendingMessage], List[PendingMessage]]:
+        """Записанные и незаписанные сообщения пакета.
+
+        Ошибка отдельной строки (например, канал удален, пока пакет копился) не должна отзывать
+        остальные: пакет делится пополам, пока виновные строки не останутся по одной. Прочие ошибки
+        (база недоступна) проваливают пакет целиком — повторять по частям бессмысленно.
+        """
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(Message), [pending.row for pending in batch])
+                await db.commit()
+            return batch, []
+        except (IntegrityError, DataError) as e:
+            if len(batch) == 1:
+                logger.error(f"❌ Сообщение {batch[0].row['id']} не записано: {e.orig}")
+                return [], batch
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи пакета из {len(batch)} сообщений: {e}")
+            return [], batch
+        middle = len(batch) // 2
+        left_persisted, left_failed = await self._insert(batch[:middle])
+        right_persisted, right_failed = await self._insert(batch[middle:])
+        return left_persisted + right_persisted, left_failed + right_failed
+
+    async def _revoke(self, failed: List[PendingMessage]):
+        """Ошибка отправителю и отзыв у участников, которые уже получили сообщение"""
+        await self._release_attachments([pending.row["id"] for pending in failed if pending.attachments])
+        for pending in failed:
+            await manager.send_personal_message(dumps({
+                "type": "message_error",
+                "id": str(pending.row["id"]),
+                "nonce": pending.nonce,
+                "text_channel_id": pending.row["text_channel_id"]
+            }), pending.sender)
+            await manager.send_to_channel(pending.server_id, {
+                "type": "message_delete",
+                "id": str(pending.row["id"]),
+                "text_channel_id": pending.row["text_channel_id"]
+            })
+
+    async def _release_attachments(self, message_ids: List[int]):
+        """Вложения незаписанных сообщений снова доступны для отправки"""
+        if not message_ids:
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(Attachment)
+                    .where(Attachment.message_id.in_(message_ids))
+                    .values(message_id=None)
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"❌ Ошибка освобождения вложений: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            'queued': self.queue.qsize(),
+            'persisted_total': self.persisted_total,
+            'failed_total': self.failed_total
+        }
+
+
+# Глобальный экземпляр конвейера
+message_ingest = MessageIngest(
+    batch_size=settings.MESSAGE_BATCH_SIZE,
+    flush_interval=settings.MESSAGE_FLUSH_INTERVAL,
+    queue_size=settings.MESSAGE_QUEUE_SIZE,
+    queue_timeout=settings.MESSAGE_QUEUE_TIMEOUT
+)
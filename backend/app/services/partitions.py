@@ -0,0 +1,209 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from sqlalchemy import text
+import asyncio
+import gzip
+import logging
+import os
+import re
+import asyncpg
+from app.core.config import settings
+from app.core.snowflake import snowflake_from_time
+from app.db.database import engine
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "messages"
+PARTITION_PREFIX = "messages_p"
+LEGACY_PARTITION = "messages_legacy"
+PARTITION_NAME = re.compile(r"^messages_p(\d{4})(\d{2})$")
+PARTITION_UPPER = re.compile(r"TO \('?(-?\d+)'?\)")
+PARTITION_LOWER = re.compile(r"FROM \('?(-?\d+)'?\)")
+# Колонки архива: вычисляемый search_vector не выгружается
+ARCHIVE_COLUMNS = "id, content, author_id, text_channel_id, created_at, updated_at, is_edited"
+_LOCK_KEY = 7304516  # pg_advisory_xact_lock: партиции создает один процесс за раз
+
+
+def month_start(moment: datetime) -> datetime:
+    return moment.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARTITION_PREFIX}{month:%Y%m}"
+
+
+def partition_bounds(month: datetime) -> tuple[int, int]:
+    """Диапазон id месяца: snowflake-id монотонны по времени"""
+    return snowflake_from_time(month), snowflake_from_time(add_months(month, 1))
+
+
+def partition_month(name: str) -> Optional[datetime]:
+    match = PARTITION_NAME.match(name)
+    if not match:
+        return None
+    return datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+
+
+async def list_partitions(conn) -> Dict[str, str]:
+    """Партиции родительской таблицы: имя -> выражение границ (FOR VALUES FROM ... TO ...)"""
+    result = await conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST(:parent AS regclass) ORDER BY c.relname"
+    ), {"parent": PARENT_TABLE})
+    return dict(result.all())
+
+
+def _upper_bound(bound: str) -> Optional[int]:
+    match = PARTITION_UPPER.search(bound or "")
+    return int(match.group(1)) if match else None
+
+
+def _lower_bound(bound: str) -> Optional[int]:
+    match = PARTITION_LOWER.search(bound or "")
+    return int(match.group(1)) if match else None
+
+
+async def oldest_partition_lower(conn) -> Optional[int]:
+    """Нижняя граница самой старой присоединенной месячной партиции: id ниже нее могли уйти в архив"""
+    bounds = [_lower_bound(bound) for name, bound in (await list_partitions(conn)).items() if partition_month(name)]
+    return min((bound for bound in bounds if bound is not None), default=None)
+
+
+async def _attach(conn, name: str, bounds: str):
+    # CREATE ... PARTITION OF берет эксклюзивную блокировку родителя; ATTACH — только SHARE UPDATE EXCLUSIVE
+    await conn.execute(text(
+        f'CREATE TABLE "{name}" (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)'
+    ))
+    await conn.execute(text(f'ALTER TABLE {PARENT_TABLE} ATTACH PARTITION "{name}" FOR VALUES {bounds}'))
+
+
+async def ensure_partitions(months_ahead: int) -> List[str]:
+    """Партиции на текущий и следующие месяцы и messages_legacy для более ранних id;
+    новые таблицы присоединяются без блокировки записи"""
+    created = []
+    current = month_start(datetime.now(timezone.utc))
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _LOCK_KEY})
+        existing = await list_partitions(conn)
+        # Старая таблица после миграции покрывает id до конца месяца миграции
+        legacy_upper = _upper_bound(existing.get(LEGACY_PARTITION)) or 0
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            name = partition_name(month)
+            lower, upper = partition_bounds(month)
+            if name in existing or lower < legacy_upper:
+                continue
+            await _attach(conn, name, f"FROM ({lower}) TO ({upper})")
+            existing[name] = f"FOR VALUES FROM ({lower}) TO ({upper})"
+            created.append(name)
+        if not any("MINVALUE" in bound for bound in existing.values()):
+            # messages_legacy архивирована или ее не было: id раньше первой месячной
+            # партиции (импорт, сообщения с датой в прошлом) попадают в messages_legacy, а не в ошибку
+            if (await conn.execute(text("SELECT to_regclass(:name)"), {"name": LEGACY_PARTITION})).scalar():
+                logger.warning(f"⚠️ {LEGACY_PARTITION} отсоединена, но не удалена — id до первой партиции не принимаются")
+            else:
+                lowers = [_lower_bound(bound) for bound in existing.values()]
+                lowest = min(lower for lower in lowers if lower is not None)
+                await _attach(conn, LEGACY_PARTITION, f"FROM (MINVALUE) TO ({lowest})")
+                created.append(LEGACY_PARTITION)
+    for name in created:
+        logger.info(f"🗂️ Создана партиция сообщений {name}")
+    return created
+
+
+async def archive_partitions(older_than_months: int, directory: str, include_legacy: bool = False) -> List[str]:
+    """Отсоединение старых партиций (CONCURRENTLY), выгрузка в csv.gz и удаление таблиц"""
+    if older_than_months < 1:
+        raise ValueError("older_than_months должен быть не меньше 1")
+    cutoff = add_months(month_start(datetime.now(timezone.utc)), -older_than_months)
+    async with engine.connect() as conn:
+        names = list(await list_partitions(conn))
+    candidates = [
+        name for name in names
+        if (name == LEGACY_PARTITION and include_legacy)
+        or (partition_month(name) is not None and add_months(partition_month(name), 1) <= cutoff)
+    ]
+
+    archived = []
+    os.makedirs(directory, exist_ok=True)
+    # DETACH CONCURRENTLY нельзя выполнять в транзакции — нужно отдельное соединение в autocommit
+    conn = await asyncpg.connect(settings.DATABASE_URL)
+    try:
+        for name in candidates:
+            archived.append(await _archive_partition(conn, name, directory))
+    finally:
+        await conn.close()
+    return archived
+
+
+async def _archive_partition(conn: asyncpg.Connection, name: str, directory: str) -> str:
+    await conn.execute(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION "{name}" CONCURRENTLY')
+    expected = await conn.fetchval(f'SELECT count(*) FROM "{name}"')
+
+    path = os.path.join(directory, f"{name}.csv.gz")
+    temp_path = path + ".tmp"
+    with gzip.open(temp_path, "wb") as archive:
+        status = await conn.copy_from_query(
+            f'SELECT {ARCHIVE_COLUMNS} FROM "{name}" ORDER BY id',
+            output=archive,
+            format="csv",
+            header=True
+        )
+    copied = int(status.split()[-1])
+    if copied != expected:
+        # Таблица остается отсоединенной, но не удаляется — можно разобраться вручную
+        os.remove(temp_path)
+        raise RuntimeError(f"{name}: выгружено {copied} строк из {expected}")
+    os.replace(temp_path, path)
+
+    await conn.execute(f'DROP TABLE "{name}"')
+    logger.info(f"📦 Партиция {name} ({copied} сообщений) перенесена в {path}")
+    return path
+
+
+class PartitionMaintainer:
+    """Периодическое создание партиций сообщений на будущие месяцы"""
+
+    def __init__(self, months_ahead: int, interval: float):
+        self.months_ahead = months_ahead
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        """Первая проверка выполняется сразу: без партиции текущего месяца запись сообщений невозможна"""
+        await self._ensure()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._ensure()
+
+    async def _ensure(self):
+        try:
+            await ensure_partitions(self.months_ahead)
+        except Exception as e:
+            logger.error(f"❌ Ошибка создания партиций сообщений (выполнена ли `alembic upgrade head`?): {e}")
+
+
+# Глобальный планировщик
+partition_maintainer = PartitionMaintainer(
+    months_ahead=settings.MESSAGE_PARTITIONS_AHEAD,
+    interval=settings.MESSAGE_PARTITION_MAINTENANCE_INTERVAL
+)
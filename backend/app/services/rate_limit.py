@@ -0,0 +1,265 @@
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from fastapi import WebSocket, WebSocketDisconnect, status
+import asyncio
+import logging
+import time
+from app.core.config import settings
+from app.core.serialization import dumps
+from app.websocket.connection_manager import manager
+
+logger = logging.getLogger(__name__)
+
+# Атомарная проверка нескольких корзин: токен списывается, только если он есть во всех
+_TAKE_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'stamp')
+    local level = burst
+    if state[1] then
+        level = math.min(burst, tonumber(state[1]) + (now - tonumber(state[2])) * rate)
+    end
+    levels[i] = level
+    if level < 1 then
+        wait = math.max(wait, (1 - level) / rate)
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    redis.call('HSET', key, 'tokens', levels[i] - 1, 'stamp', now)
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+end
+return '0'
+"""
+
+
+@dataclass(frozen=True)
+class RatePolicy:
+    rate: float  # токенов в секунду
+    burst: float  # емкость корзины
+
+
+class RateLimiter:
+    """Token bucket на пользователя и на канал для каждого типа события (в процессе или в Redis)"""
+
+    def __init__(self, policies: Dict[str, Dict[str, List[float]]], use_redis: bool, flood_strikes: int, flood_window: float):
+        self.policies: Dict[str, Tuple[Optional[RatePolicy], Optional[RatePolicy]]] = {}
+        for event, scopes in policies.items():
+            self.policies[event] = (
+                RatePolicy(*scopes["user"]) if "user" in scopes else None,
+                RatePolicy(*scopes["channel"]) if "channel" in scopes else None
+            )
+        self.use_redis = use_redis
+        self.redis_client = None
+        self._take_script = None
+        self._buckets: Dict[tuple, List[float]] = {}  # ключ -> [токены, время пересчета]
+        # Корзина полностью восстанавливается за это время — дольше хранить ее незачем
+        self._idle_ttl = max(
+            (policy.burst / policy.rate for pair in self.policies.values() for policy in pair if policy),
+            default=60.0
+        )
+        self._next_sweep = time.monotonic() + self._idle_ttl
+        # Флуд: нарушения тоже идут через корзину, ее опустошение — повод закрыть соединение
+        self.flood_policy = RatePolicy(flood_strikes / flood_window, flood_strikes)
+        self._strikes: Dict[int, List[float]] = {}
+        # Отложенные переключатели состояния: (сокет, событие) -> последнее значение и ожидающая его задача
+        self._deferred: Dict[tuple, Callable[[], Awaitable[None]]] = {}
+        self._deferred_tasks: Dict[tuple, asyncio.Task] = {}
+        self.allowed_total = 0
+        self.limited_total = 0
+        self.coalesced_total = 0
+
+    def attach_redis(self, redis_client):
+        if self.use_redis and redis_client is not None:
+            self.redis_client = redis_client
+            self._take_script = redis_client.register_script(_TAKE_SCRIPT)
+
+    async def check(self, event: str, user_id: int, channel_id: Optional[int] = None) -> float:
+        """0 — событие разрешено (токен списан), иначе секунды до появления токена"""
+        pair = self.policies.get(event)
+        if pair is None:
+            return 0.0
+        if self._take_script is not None:
+            wait = await self._check_redis(event, pair, user_id, channel_id)
+        else:
+            wait = self._check_local(event, pair, user_id, channel_id, time.monotonic())
+        if wait:
+            self.limited_total += 1
+        else:
+            self.allowed_total += 1
+        return wait
+
+    def _check_local(self, event: str, pair: tuple, user_id: int, channel_id: Optional[int], now: float) -> float:
+        if now >= self._next_sweep:
+            self._sweep(now)
+        user_policy, channel_policy = pair
+        taken = []
+        wait = 0.0
+        if user_policy is not None:
+            wait = self._refill((event, "user", user_id), user_policy, now, taken)
+        if channel_policy is not None and channel_id is not None:
+            wait = max(wait, self._refill((event, "channel", channel_id), channel_policy, now, taken))
+        if wait:
+            return wait
+        for bucket in taken:
+            bucket[0] -= 1
+        return 0.0
+
+    def _refill(self, key: tuple, policy: RatePolicy, now: float, taken: list) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [policy.burst, now]
+        else:
+            bucket[0] = min(policy.burst, bucket[0] + (now - bucket[1]) * policy.rate)
+            bucket[1] = now
+        taken.append(bucket)
+        return 0.0 if bucket[0] >= 1 else (1 - bucket[0]) / policy.rate
+
+    async def _check_redis(self, event: str, pair: tuple, user_id: int, channel_id: Optional[int]) -> float:
+        user_policy, channel_policy = pair
+        keys, args = [], []
+        if user_policy is not None:
+            keys.append(f"ratelimit:{event}:user:{user_id}")
+            args += [user_policy.rate, user_policy.burst]
+        if channel_policy is not None and channel_id is not None:
+            keys.append(f"ratelimit:{event}:channel:{channel_id}")
+            args += [channel_policy.rate, channel_policy.burst]
+        if not keys:
+            return 0.0
+        try:
+            return float(await self._take_script(keys=keys, args=args))
+        except Exception as e:
+            # Redis недоступен — ограничиваем хотя бы в пределах процесса
+            logger.error(f"❌ Ошибка проверки лимита в Redis: {e}")
+            return self._check_local(event, pair, user_id, channel_id, time.monotonic())
+
+    async def enforce(self, websocket: WebSocket, event: str, user_id: int, channel_id: Optional[int] = None, **extra) -> bool:
+        """Проверка события из сокета: False — отклонено и клиенту отправлен rate_limited"""
+        retry_after = await self.check(event, user_id, channel_id)
+        if not retry_after:
+            return True
+
+        if self.record_violation(user_id):
+            logger.warning(f"🚫 Отключение за флуд user_id={user_id}, событие {event}")
+            try:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Rate limit exceeded")
+            except Exception:
+                pass
+            raise WebSocketDisconnect(code=status.WS_1008_POLICY_VIOLATION)
+
+        frame = dumps(rate_limited_frame(event, retry_after, **extra))
+        if websocket in manager.outboxes:
+            await manager.send_personal_message(frame, websocket)
+        else:
+            await websocket.send_text(frame)
+        return False
+
+    async def enforce_latest(
+        self,
+        websocket: WebSocket,
+        event: str,
+        user_id: int,
+        channel_id: Optional[int],
+        apply: Callable[[], Awaitable[None]]
+    ):
+        """Переключатель состояния (mute/deafen/speaking): сверх лимита не отбрасывается,
+        а откладывается — когда в корзине появится токен, применяется последнее значение"""
+        key = (websocket, event)
+        if key in self._deferred_tasks:
+            self._deferred[key] = apply
+            self.coalesced_total += 1
+            return
+        retry_after = await self.check(event, user_id, channel_id)
+        if not retry_after:
+            await apply()
+            return
+        self._deferred[key] = apply
+        self.coalesced_total += 1
+        self._deferred_tasks[key] = asyncio.create_task(
+            self._apply_deferred(key, event, user_id, channel_id, retry_after)
+        )
+
+    async def _apply_deferred(self, key: tuple, event: str, user_id: int, channel_id: Optional[int], wait: float):
+        try:
+            # Значения, пришедшие во время ожидания или применения, заменяют отложенное и ждут следующего токена
+            while key in self._deferred:
+                await asyncio.sleep(wait)
+                wait = await self.check(event, user_id, channel_id)
+                if not wait:
+                    await self._deferred.pop(key)()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Ошибка применения отложенного события {event} user_id={user_id}: {e}")
+        finally:
+            if self._deferred_tasks.get(key) is asyncio.current_task():
+                del self._deferred_tasks[key]
+                self._deferred.pop(key, None)
+
+    def discard_deferred(self, websocket: WebSocket):
+        """Соединение закрыто: его отложенные переключатели больше не применяются"""
+        for key in [key for key in self._deferred_tasks if key[0] is websocket]:
+            self._deferred_tasks.pop(key).cancel()
+            self._deferred.pop(key, None)
+
+    def record_violation(self, user_id: int) -> bool:
+        """Учет отклоненного события; True — пользователь флудит и соединение пора закрыть"""
+        now = time.monotonic()
+        policy = self.flood_policy
+        bucket = self._strikes.get(user_id)
+        if bucket is None:
+            bucket = self._strikes[user_id] = [policy.burst, now]
+        else:
+            bucket[0] = min(policy.burst, bucket[0] + (now - bucket[1]) * policy.rate)
+            bucket[1] = now
+        bucket[0] -= 1
+        return bucket[0] < 0
+
+    def _sweep(self, now: float):
+        """Удаление корзин, которые успели наполниться (их состояние совпадает с новой)"""
+        idle_before = now - self._idle_ttl
+        for key in [key for key, bucket in self._buckets.items() if bucket[1] < idle_before]:
+            del self._buckets[key]
+        flood_idle_before = now - self.flood_policy.burst / self.flood_policy.rate
+        for user_id in [uid for uid, bucket in self._strikes.items() if bucket[1] < flood_idle_before]:
+            del self._strikes[user_id]
+        self._next_sweep = now + self._idle_ttl
+
+    def get_stats(self) -> dict:
+        return {
+            'backend': 'redis' if self._take_script is not None else 'memory',
+            'allowed_total': self.allowed_total,
+            'limited_total': self.limited_total,
+            'coalesced_total': self.coalesced_total,
+            'deferred': len(self._deferred_tasks),
+            'local_buckets': len(self._buckets)
+        }
+
+
+def rate_limited_frame(event: str, retry_after: float, **extra) -> dict:
+    """Ответ клиенту на отклоненное событие"""
+    frame = {
+        "type": "rate_limited",
+        "event": event,
+        "retry_after": round(retry_after, 3)
+    }
+    frame.update(extra)
+    return frame
+
+
+# Глобальный экземпляр ограничителя
+rate_limiter = RateLimiter(
+    policies=settings.RATE_LIMIT_POLICIES if settings.RATE_LIMIT_ENABLED else {},
+    use_redis=settings.RATE_LIMIT_REDIS,
+    flood_strikes=settings.RATE_LIMIT_FLOOD_STRIKES,
+    flood_window=settings.RATE_LIMIT_FLOOD_WINDOW
+)
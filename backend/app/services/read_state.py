@@ -0,0 +1,319 @@
+from collections import defaultdict
+from typing import Any, Dict, List, Set, Tuple
+from sqlalchemy import select, and_, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import logging
+import re
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.models import ChannelMember, Message, ReadState, TextChannel, User
+from app.websocket.connection_manager import manager
+
+logger = logging.getLogger(__name__)
+
+MENTION_PATTERN = re.compile(r"@([\w.\-]{1,32})")
+LATEST_KEY = "text_channel_latest"
+
+# Указатель на последнее сообщение только растет (id сравниваются как строки: Lua теряет точность на 64 битах)
+_ADVANCE_SCRIPT = """
+for i = 1, #ARGV, 2 do
+    local current = redis.call('HGET', KEYS[1], ARGV[i])
+    local new = ARGV[i + 1]
+    if not current or #new > #current or (#new == #current and new > current) then
+        redis.call('HSET', KEYS[1], ARGV[i], new)
+    end
+end
+return 1
+"""
+
+
+class ReadStateTracker:
+    """Прочитанность каналов: указатели на последние сообщения и пакетная запись отметок пользователей"""
+
+    def __init__(self, flush_interval: float, use_redis: bool):
+        self.flush_interval = flush_interval
+        self.use_redis = use_redis
+        self.redis_client = None
+        self._advance_script = None
+        self.latest: Dict[int, int] = {}  # text_channel_id -> id последнего сообщения
+        # Каналы, указатель которых в Redis не удалось ни сдвинуть, ни сбросить: читаются из БД до сброса
+        self._stale: Set[int] = set()
+        self._pending_acks: Dict[Tuple[int, int], int] = {}  # (user_id, text_channel_id) -> id
+        self._pending_mentions: Dict[Tuple[int, int], int] = defaultdict(int)
+        self._task: asyncio.Task | None = None
+        self.acks_total = 0
+        self.mentions_total = 0
+        manager.register_redis_handler("read_state", self._handle_remote)
+
+    def attach_redis(self, redis_client):
+        if self.use_redis and redis_client is not None:
+            self.redis_client = redis_client
+            self._advance_script = redis_client.register_script(_ADVANCE_SCRIPT)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка с записью накопленных отметок"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if self._stale:
+                await self._drop_shared([])
+
+    async def ack(self, user_id: int, text_channel_id: int, message_id: int):
+        """Отметка о прочтении: запись в БД пакетом, остальным сессиям пользователя — сразу"""
+        key = (user_id, text_channel_id)
+        if message_id > self._pending_acks.get(key, 0):
+            self._pending_acks[key] = message_id
+        # Упоминания до отметки сброшены ею же
+        self._pending_mentions.pop(key, None)
+        self.acks_total += 1
+        await manager.send_to_user(user_id, {
+            "type": "read_state",
+            "text_channel_id": text_channel_id,
+            "last_read_message_id": str(message_id),
+            "mention_count": 0
+        })
+
+    async def messages_persisted(self, messages: List[Tuple[int, dict]]):
+        """Записанные сообщения [(server_id, row)]: сдвиг указателей и подсчет упоминаний"""
+        latest: Dict[int, int] = {}
+        for _, row in messages:
+            if row["id"] > latest.get(row["text_channel_id"], 0):
+                latest[row["text_channel_id"]] = row["id"]
+        await self._advance(latest)
+        if latest and self._advance_script is None:
+            # Без Redis-указателей остальные процессы сдвигают свои копии по публикации
+            await manager.publish("read_state:advance", {
+                "op": "advance",
+                "latest": {str(text_channel_id): str(message_id) for text_channel_id, message_id in latest.items()}
+            })
+
+        mentioned = [
+            (server_id, row, set(MENTION_PATTERN.findall(row["content"])))
+            for server_id, row in messages
+            if "@" in row["content"]
+        ]
+        mentioned = [entry for entry in mentioned if entry[2]]
+        if mentioned:
+            try:
+                await self._count_mentions(mentioned)
+            except Exception as e:
+                logger.error(f"❌ Ошибка подсчета упоминаний: {e}")
+
+    async def _count_mentions(self, mentioned: List[Tuple[int, dict, set]]):
+        """Одним запросом сопоставляем имена с участниками серверов пакета"""
+        names = set().union(*(names for _, _, names in mentioned))
+        server_ids = {server_id for server_id, _, _ in mentioned}
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(User.id, User.username, ChannelMember.channel_id)
+                .join(ChannelMember, ChannelMember.user_id == User.id)
+                .where(User.username.in_(names), ChannelMember.channel_id.in_(server_ids))
+            )
+        members = {(username, server_id): user_id for user_id, username, server_id in result.all()}
+
+        for server_id, row, names in mentioned:
+            for name in names:
+                user_id = members.get((name, server_id))
+                if user_id is None or user_id == row["author_id"]:
+                    continue
+                self._pending_mentions[(user_id, row["text_channel_id"])] += 1
+                self.mentions_total += 1
+                await manager.send_to_user(user_id, {
+                    "type": "mention",
+                    "channel_id": server_id,
+                    "text_channel_id": row["text_channel_id"],
+                    "message_id": str(row["id"])
+                })
+
+    async def _advance(self, latest: Dict[int, int]):
+        if not latest:
+            return
+        if self._advance_script is not None:
+            args = []
+            for text_channel_id, message_id in latest.items():
+                args += [str(text_channel_id), str(message_id)]
+            try:
+                await self._advance_script(keys=[LATEST_KEY], args=args)
+            except Exception as e:
+                logger.error(f"❌ Ошибка обновления указателей каналов в Redis: {e}")
+                # Старый указатель скрыл бы новые сообщения: сбрасываем, чтение возьмет max(id) из БД
+                await self._drop_shared(list(latest))
+            return
+        self._advance_local(latest)
+
+    def _advance_local(self, latest: Dict[int, int]):
+        for text_channel_id, message_id in latest.items():
+            if message_id > self.latest.get(text_channel_id, 0):
+                self.latest[text_channel_id] = message_id
+
+    async def _drop_shared(self, text_channel_ids: List[int]):
+        """Удаление указателей из Redis; при ошибке каналы читаются из БД, сброс повторяется в фоне"""
+        self._stale.update(text_channel_ids)
+        stale = set(self._stale)
+        try:
+            await self.redis_client.hdel(LATEST_KEY, *[str(text_channel_id) for text_channel_id in stale])
+        except Exception as e:
+            logger.error(f"❌ Ошибка сброса указателей каналов в Redis: {e}")
+            return
+        self._stale -= stale
+
+    async def invalidate(self, text_channel_id: int):
+        """Сброс указателя после удаления сообщения: последнее могло быть удаленным"""
+        if self._advance_script is not None:
+            await self._drop_shared([text_channel_id])
+            return
+        self.latest.pop(text_channel_id, None)
+        await manager.publish(f"read_state:{text_channel_id}", {"op": "invalidate"})
+
+    async def _handle_remote(self, key: str, data: Any):
+        """Указатели, сдвинутые или сброшенные другим процессом"""
+        if data.get("op") == "advance":
+            self._advance_local({
+                int(text_channel_id): int(message_id) for text_channel_id, message_id in data["latest"].items()
+            })
+        else:
+            self.latest.pop(int(key), None)
+
+    async def latest_for(self, db: AsyncSession, text_channel_ids: List[int]) -> Dict[int, int]:
+        """Последние сообщения каналов; неизвестные каналы дочитываются из БД одним запросом"""
+        if not text_channel_ids:
+            return {}
+        if self.redis_client is not None:
+            try:
+                values = await self.redis_client.hmget(LATEST_KEY, [str(tid) for tid in text_channel_ids])
+                known = {
+                    tid: int(value) for tid, value in zip(text_channel_ids, values)
+                    if value is not None and tid not in self._stale
+                }
+            except Exception as e:
+                logger.error(f"❌ Ошибка чтения указателей каналов из Redis: {e}")
+                known = {}
+        else:
+            known = {tid: self.latest[tid] for tid in text_channel_ids if tid in self.latest}
+
+        missing = [tid for tid in text_channel_ids if tid not in known]
+        if missing:
+            # max(id) по составному индексу (канал, id) — одно чтение индекса на канал
+            latest_id = (
+                select(func.coalesce(func.max(Message.id), 0))
+                .where(Message.text_channel_id == TextChannel.id)
+                .scalar_subquery()
+            )
+            result = await db.execute(
+                select(TextChannel.id, latest_id).where(TextChannel.id.in_(missing))
+            )
+            loaded = dict(result.all())
+            known.update(loaded)
+            await self._advance(loaded)
+        return known
+
+    async def get_server_state(self, db: AsyncSession, user_id: int, channel_id: int) -> List[dict]:
+        """Непрочитанное и упоминания по всем текстовым каналам сервера: без COUNT по сообщениям"""
+        result = await db.execute(
+            select(TextChannel.id, ReadState.last_read_message_id, ReadState.mention_count)
+            .outerjoin(ReadState, and_(
+                ReadState.text_channel_id == TextChannel.id,
+                ReadState.user_id == user_id
+            ))
+            .where(TextChannel.channel_id == channel_id)
+            .order_by(TextChannel.position, TextChannel.id)
+        )
+        rows = result.all()
+        latest = await self.latest_for(db, [row.id for row in rows])
+
+        states = []
+        for text_channel_id, last_read, mention_count in rows:
+            key = (user_id, text_channel_id)
+            last_read = last_read or 0
+            mention_count = mention_count or 0
+            # Отметки, еще не записанные в БД
+            if key in self._pending_acks:
+                last_read = max(last_read, self._pending_acks[key])
+                mention_count = 0
+            mention_count += self._pending_mentions.get(key, 0)
+            latest_id = latest.get(text_channel_id, 0)
+            states.append({
+                "text_channel_id": text_channel_id,
+                "last_read_message_id": last_read,
+                "latest_message_id": latest_id,
+                "unread": latest_id > last_read,
+                "mention_count": mention_count
+            })
+        return states
+
+    async def flush(self):
+        """Запись накопленных отметок и упоминаний: по одному upsert на вид"""
+        acks, self._pending_acks = self._pending_acks, {}
+        mentions, self._pending_mentions = self._pending_mentions, defaultdict(int)
+        if not acks and not mentions:
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                if acks:
+                    statement = pg_insert(ReadState).values([
+                        {"user_id": user_id, "text_channel_id": text_channel_id, "last_read_message_id": message_id}
+                        for (user_id, text_channel_id), message_id in acks.items()
+                    ])
+                    await db.execute(statement.on_conflict_do_update(
+                        index_elements=[ReadState.user_id, ReadState.text_channel_id],
+                        set_={
+                            "last_read_message_id": func.greatest(
+                                ReadState.last_read_message_id,
+                                statement.excluded.last_read_message_id
+                            ),
+                            "mention_count": 0,
+                            "updated_at": func.now()
+                        }
+                    ))
+                if mentions:
+                    statement = pg_insert(ReadState).values([
+                        {"user_id": user_id, "text_channel_id": text_channel_id, "mention_count": count}
+                        for (user_id, text_channel_id), count in mentions.items()
+                    ])
+                    await db.execute(statement.on_conflict_do_update(
+                        index_elements=[ReadState.user_id, ReadState.text_channel_id],
+                        set_={"mention_count": ReadState.mention_count + statement.excluded.mention_count}
+                    ))
+                await db.commit()
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи отметок о прочтении: {e}")
+            # Возвращаем в очередь, не затирая отметки, пришедшие во время записи
+            for key, message_id in acks.items():
+                if message_id > self._pending_acks.get(key, 0):
+                    self._pending_acks[key] = message_id
+            for key, count in mentions.items():
+                if key not in self._pending_acks:
+                    self._pending_mentions[key] += count
+
+    def get_stats(self) -> dict:
+        return {
+            'backend': 'redis' if self._advance_script is not None else 'memory',
+            'pending_acks': len(self._pending_acks),
+            'pending_mentions': len(self._pending_mentions),
+            'stale_pointers': len(self._stale),
+            'acks_total': self.acks_total,
+            'mentions_total': self.mentions_total
+        }
+
+
+# Глобальный экземпляр
+read_states = ReadStateTracker(
+    flush_interval=settings.READ_STATE_FLUSH_INTERVAL,
+    use_redis=settings.READ_STATE_REDIS
+)
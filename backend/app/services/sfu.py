@@ -0,0 +1,422 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from aiortc import (
+    RTCConfiguration, RTCIceServer, RTCPeerConnection, RTCRtpReceiver, RTCRtpTransceiver, RTCSessionDescription
+)
+from aiortc.contrib.media import MediaRelay
+from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
+from aiortc.sdp import candidate_from_sdp
+from fastapi import WebSocket
+import asyncio
+import logging
+from app.core.config import settings
+from app.core.serialization import dumps, loads
+from app.services.audio_mixer import audio_mixer
+from app.services.voice_state import voice_states
+from app.websocket.frames import EncodedFrame
+from app.websocket.signaling import relay_frame
+
+logger = logging.getLogger(__name__)
+
+MODE_MESH = "mesh"
+MODE_SFU = "sfu"
+# from_id/target_id сервера в сигнальных сообщениях режима SFU
+SFU_PEER_ID = 0
+# Что клиент отправляет серверу: микрофон и демонстрация экрана
+UPLINK_KINDS = ("audio", "video")
+KEYFRAME_REQUEST_INTERVAL = 0.5  # секунды между PLI, пока экран участника не начал декодироваться
+
+
+async def _request_keyframe(receiver: RTCRtpReceiver) -> bool:
+    """PLI отправителю; False — в этой версии aiortc запросить ключевой кадр нечем"""
+    # Публичного API у aiortc нет: закрытый метод может исчезнуть или поменять сигнатуру
+    send_pli = getattr(receiver, "_send_rtcp_pli", None)
+    if send_pli is None:
+        return False
+    try:
+        for source in receiver.getSynchronizationSources():
+            await send_pli(source.source)
+    except Exception as e:
+        logger.warning(f"⚠️ SFU: запрос ключевого кадра не поддерживается: {e}")
+        return False
+    return True
+
+
+def _ice_servers(servers: List[dict]) -> List[RTCIceServer]:
+    return [
+        RTCIceServer(urls=server["urls"], username=server.get("username"), credential=server.get("credential"))
+        for server in servers
+    ]
+
+
+class ForwardedTrack(MediaStreamTrack):
+    """Трек от сервера участнику: источник меняется без пересогласования, отправитель aiortc не завершается"""
+
+    def __init__(self, kind: str):
+        super().__init__()
+        self.kind = kind
+        self.user_id: Optional[int] = None
+        self._source: Optional[MediaStreamTrack] = None
+        self._attached = asyncio.Event()
+
+    def attach(self, user_id: int, source: MediaStreamTrack):
+        self.user_id = user_id
+        self._source = source
+        self._attached.set()
+
+    def detach(self):
+        if self._source is not None:
+            self._source.stop()
+        self.user_id = None
+        self._source = None
+        self._attached.clear()
+
+    async def recv(self):
+        while True:
+            source = self._source
+            if source is None:
+                await self._attached.wait()
+                continue
+            try:
+                return await source.recv()
+            except MediaStreamError:
+                # Источник ушел — ждем следующего, а не обрываем RTP-поток отправителя
+                if self._source is source:
+                    self.detach()
+
+
+class SfuPeer:
+    """Единственное соединение участника с сервером"""
+
+    def __init__(self, user_id: int, websocket: WebSocket, pc: RTCPeerConnection):
+        self.user_id = user_id
+        self.websocket = websocket
+        self.pc = pc
+        self.uplink: Dict[str, RTCRtpTransceiver] = {}  # вид -> трансивер, который принимает от клиента
+        self.forwarded: List[Tuple[RTCRtpTransceiver, ForwardedTrack]] = []
+        self.lock = asyncio.Lock()
+        self.renegotiate = False  # изменения пришли, пока ждали answer
+        self.mixing = False  # звук остальных приходит одним миксом сервера
+
+    def track_map(self) -> dict:
+        """Какие m-строки куда: клиент по mid находит свои исходящие и владельцев входящих треков (SFU_PEER_ID — микс)"""
+        return {
+            "uplink": {kind: transceiver.mid for kind, transceiver in self.uplink.items()},
+            "tracks": {
+                transceiver.mid: track.user_id
+                for transceiver, track in self.forwarded
+                if transceiver.mid is not None and track.user_id is not None
+            }
+        }
+
+
+class SfuRoom:
+    def __init__(self, channel_id: int):
+        self.channel_id = channel_id
+        self.peers: Dict[int, SfuPeer] = {}
+        self.sources: Dict[Tuple[int, str], MediaStreamTrack] = {}  # (user_id, вид) -> входящий трек
+        self.drains: Dict[Tuple[int, str], asyncio.Task] = {}
+
+
+class SfuManager:
+    """Пересылка медиа через сервер для больших голосовых комнат: у клиента одно соединение при любом размере комнаты"""
+
+    def __init__(
+        self,
+        threshold: int,
+        ice_servers: List[dict],
+        send: Callable[[WebSocket, EncodedFrame], Awaitable[None]]
+    ):
+        self.threshold = threshold
+        self.ice_servers = ice_servers
+        # Кадры клиентам — через исходящие очереди голосовых сокетов, в порядке событий комнаты
+        self._send = send
+        self.rooms: Dict[int, SfuRoom] = {}
+        self.relay = MediaRelay()
+        self._tasks: Set[asyncio.Task] = set()
+        self.switches_total = 0
+        self.offers_total = 0
+
+    def mode(self, channel_id: int) -> str:
+        return MODE_SFU if channel_id in self.rooms else MODE_MESH
+
+    async def admit(self, channel_id: int, user_id: int, participant_count: int, local: Dict[int, WebSocket]) -> str:
+        """Режим комнаты для входящего участника; при достижении порога комната переводится на SFU"""
+        if channel_id in self.rooms:
+            return MODE_SFU
+        if self.threshold <= 0 or participant_count < self.threshold:
+            return MODE_MESH
+        await self._switch(channel_id, local, f"{participant_count} участников", exclude_user_id=user_id)
+        return MODE_SFU
+
+    async def _switch(self, channel_id: int, local: Dict[int, WebSocket], reason: str, exclude_user_id: int = None):
+        # Обратно в mesh комната возвращается только опустев: без дребезга на границе порога
+        self.rooms[channel_id] = SfuRoom(channel_id)
+        self.switches_total += 1
+        logger.info(f"🎛️ Голосовой канал {channel_id} переходит на SFU ({reason})")
+        for uid, websocket in list(local.items()):
+            if uid != exclude_user_id:
+                await self._send(websocket, EncodedFrame.encode({"type": "media_mode", "mode": MODE_SFU}))
+                self.connect(channel_id, uid, websocket)
+
+    def connect(self, channel_id: int, user_id: int, websocket: WebSocket):
+        """Соединение с участником: сервер предлагает offer, клиент только отвечает (без встречных offer)"""
+        room = self.rooms.get(channel_id)
+        if room is None:
+            return
+        old = room.peers.get(user_id)
+        if old is not None:
+            # Переподключение: старое соединение закрывается в фоне
+            self._schedule(self._close_peer(old, self._remove_peer(room, old)))
+        pc = RTCPeerConnection(RTCConfiguration(iceServers=_ice_servers(self.ice_servers)))
+        peer = SfuPeer(user_id, websocket, pc)
+        for kind in UPLINK_KINDS:
+            peer.uplink[kind] = pc.addTransceiver(kind, direction="recvonly")
+        for (source_id, kind), track in room.sources.items():
+            self._forward(peer, source_id, kind, self.relay.subscribe(track, buffered=False))
+        room.peers[user_id] = peer
+        self._schedule(self._negotiate(peer))
+
+    async def disconnect(self, channel_id: int, user_id: int, websocket: WebSocket):
+        room = self.rooms.get(channel_id)
+        peer = room.peers.get(user_id) if room else None
+        if peer is None or peer.websocket is not websocket:
+            return
+        await self._close_peer(peer, self._remove_peer(room, peer))
+        if not room.peers:
+            del self.rooms[channel_id]
+            logger.info(f"🎛️ Голосовой канал {channel_id} опустел, SFU остановлен")
+
+    def _remove_peer(self, room: SfuRoom, peer: SfuPeer) -> Set[SfuPeer]:
+        """Убрать участника из комнаты; возвращает тех, у кого освободились m-строки"""
+        del room.peers[peer.user_id]
+        if peer.mixing:
+            self._stop_mixing(room, peer)
+        changed = set()
+        for kind in UPLINK_KINDS:
+            changed |= self._remove_source(room, peer.user_id, kind)
+        for _, track in peer.forwarded:
+            track.detach()
+        return changed
+
+    async def _close_peer(self, peer: SfuPeer, changed: Set[SfuPeer]):
+        await self._send_track_maps(changed)
+        await peer.pc.close()
+
+    def renegotiate(self, channel_id: int, user_id: int):
+        """Новый offer участнику: клиент меняет направление своих m-строк только в answer"""
+        room = self.rooms.get(channel_id)
+        peer = room.peers.get(user_id) if room else None
+        if peer is not None:
+            self._schedule(self._negotiate(peer))
+
+    async def set_mixing(
+        self, channel_id: int, user_id: int, websocket: WebSocket, enabled: bool, local: Dict[int, WebSocket]
+    ):
+        """Звук остальных одним миксом вместо трека на каждого; mesh-комната для этого переходит на SFU"""
+        if enabled and channel_id not in self.rooms:
+            await self._switch(channel_id, local, f"сведение звука для пользователя {user_id}")
+        room = self.rooms.get(channel_id)
+        peer = room.peers.get(user_id) if room else None
+        if peer is None or peer.websocket is not websocket or peer.mixing == enabled:
+            return
+        peer.mixing = enabled
+        if enabled:
+            mix = audio_mixer.rooms.get(channel_id)
+            if mix is None:
+                mix = audio_mixer.open(channel_id)
+                for (source_id, kind), track in room.sources.items():
+                    if kind == "audio":
+                        mix.add_input(source_id, self.relay.subscribe(track))
+            for _, forwarded in peer.forwarded:
+                if forwarded.kind == "audio" and forwarded.user_id is not None:
+                    forwarded.detach()
+            reused = self._forward(peer, SFU_PEER_ID, "audio", mix.add_listener(user_id))
+        else:
+            self._stop_mixing(room, peer)
+            reused = True
+            for (source_id, kind), track in room.sources.items():
+                if kind == "audio" and source_id != user_id:
+                    reused &= self._forward(peer, source_id, kind, self.relay.subscribe(track, buffered=False))
+        logger.info(f"🎚️ Пользователь {user_id} в канале {channel_id}: сведение звука {'включено' if enabled else 'выключено'}")
+        if reused:
+            await self._send_track_maps({peer})
+        else:
+            self._schedule(self._negotiate(peer))
+
+    def _stop_mixing(self, room: SfuRoom, peer: SfuPeer):
+        for _, forwarded in peer.forwarded:
+            if forwarded.user_id == SFU_PEER_ID:
+                forwarded.detach()
+        mix = audio_mixer.rooms.get(room.channel_id)
+        if mix is not None:
+            mix.remove_listener(peer.user_id)
+            if not mix.listeners:
+                audio_mixer.close(room.channel_id)
+
+    async def handle_signal(self, channel_id: int, user_id: int, signal_type: str, payload: str):
+        """answer и ICE-кандидаты клиента, адресованные серверу (target_id = SFU_PEER_ID)"""
+        room = self.rooms.get(channel_id)
+        peer = room.peers.get(user_id) if room else None
+        if peer is None:
+            return
+        try:
+            if signal_type == "answer":
+                await self._apply_answer(room, peer, loads(payload))
+            elif signal_type == "ice_candidate":
+                await self._add_candidate(peer, loads(payload))
+        except Exception as e:
+            logger.error(f"❌ SFU: ошибка сигнала {signal_type} от пользователя {user_id}: {e}")
+
+    async def _negotiate(self, peer: SfuPeer):
+        async with peer.lock:
+            if peer.pc.connectionState == "closed":
+                return
+            if peer.pc.signalingState != "stable":
+                peer.renegotiate = True
+                return
+            try:
+                # aiortc собирает все кандидаты в setLocalDescription: в offer они уже есть
+                await peer.pc.setLocalDescription(await peer.pc.createOffer())
+            except Exception as e:
+                logger.error(f"❌ SFU: не удалось создать offer для пользователя {peer.user_id}: {e}")
+                return
+            self.offers_total += 1
+            await self._send(peer.websocket, EncodedFrame.encode({"type": "sfu_tracks", **peer.track_map()}))
+            description = peer.pc.localDescription
+            await self._send(
+                peer.websocket,
+                relay_frame("offer", SFU_PEER_ID, dumps({"type": description.type, "sdp": description.sdp}))
+            )
+
+    async def _apply_answer(self, room: SfuRoom, peer: SfuPeer, answer: dict):
+        async with peer.lock:
+            if peer.pc.signalingState != "have-local-offer":
+                return
+            await peer.pc.setRemoteDescription(RTCSessionDescription(sdp=answer["sdp"], type="answer"))
+        await self._sync_uplink(room, peer)
+        if peer.renegotiate:
+            peer.renegotiate = False
+            self._schedule(self._negotiate(peer))
+
+    async def _add_candidate(self, peer: SfuPeer, candidate: Optional[dict]):
+        if not candidate or not candidate.get("candidate"):
+            return
+        ice = candidate_from_sdp(candidate["candidate"].split(":", 1)[1])
+        ice.sdpMid = candidate.get("sdpMid")
+        ice.sdpMLineIndex = candidate.get("sdpMLineIndex")
+        await peer.pc.addIceCandidate(ice)
+
+    async def _sync_uplink(self, room: SfuRoom, peer: SfuPeer):
+        """После answer: что клиент теперь отправляет (микрофон, экран) — то и раздается остальным"""
+        if room.peers.get(peer.user_id) is not peer:
+            return
+        changed: Set[SfuPeer] = set()
+        for kind, transceiver in peer.uplink.items():
+            receiving = transceiver.currentDirection in ("recvonly", "sendrecv")
+            sending = receiving and transceiver.receiver.track is not None
+            if sending and (peer.user_id, kind) not in room.sources:
+                changed |= self._add_source(room, peer.user_id, kind, transceiver.receiver)
+            elif not sending and (peer.user_id, kind) in room.sources:
+                changed |= self._remove_source(room, peer.user_id, kind)
+        await self._send_track_maps(changed)
+
+    async def _send_track_maps(self, peers: Set[SfuPeer]):
+        for peer in peers:
+            await self._send(peer.websocket, EncodedFrame.encode({"type": "sfu_tracks", **peer.track_map()}))
+
+    def _add_source(self, room: SfuRoom, user_id: int, kind: str, receiver: RTCRtpReceiver) -> Set[SfuPeer]:
+        """Подписка остальных на трек; возвращает участников, которым хватило свободной m-строки"""
+        track = receiver.track
+        room.sources[(user_id, kind)] = track
+        # Трек вычитывается всегда: иначе у одиночки в комнате кадры копятся в очереди приемника
+        room.drains[(user_id, kind)] = self._schedule(self._drain(receiver))
+        mix = audio_mixer.rooms.get(room.channel_id) if kind == "audio" else None
+        if mix is not None:
+            # Микшеру нужен каждый кадр: буферизованная подписка
+            mix.add_input(user_id, self.relay.subscribe(track))
+        remapped = set()
+        for other in room.peers.values():
+            if other.user_id == user_id or (kind == "audio" and other.mixing):
+                continue
+            if self._forward(other, user_id, kind, self.relay.subscribe(track, buffered=False)):
+                remapped.add(other)
+            else:
+                self._schedule(self._negotiate(other))
+        return remapped
+
+    def _remove_source(self, room: SfuRoom, user_id: int, kind: str) -> Set[SfuPeer]:
+        if room.sources.pop((user_id, kind), None) is None:
+            return set()
+        room.drains.pop((user_id, kind)).cancel()
+        mix = audio_mixer.rooms.get(room.channel_id) if kind == "audio" else None
+        if mix is not None:
+            mix.remove_input(user_id)
+        remapped = set()
+        for other in room.peers.values():
+            for _, forwarded in other.forwarded:
+                if forwarded.user_id == user_id and forwarded.kind == kind:
+                    forwarded.detach()
+                    remapped.add(other)
+        return remapped
+
+    def _forward(self, peer: SfuPeer, user_id: int, kind: str, source: MediaStreamTrack) -> bool:
+        """Трек источника участнику; True — переиспользована свободная m-строка, пересогласование не нужно"""
+        for transceiver, forwarded in peer.forwarded:
+            if forwarded.kind == kind and forwarded.user_id is None:
+                forwarded.attach(user_id, source)
+                return transceiver.mid is not None
+        forwarded = ForwardedTrack(kind)
+        forwarded.attach(user_id, source)
+        peer.forwarded.append((peer.pc.addTransceiver(forwarded, direction="sendonly"), forwarded))
+        return False
+
+    async def _drain(self, receiver: RTCRtpReceiver):
+        track = self.relay.subscribe(receiver.track, buffered=False)
+        try:
+            # Видео декодируется только с ключевого кадра: просим его сразу, а не после переполнения буфера приемника
+            while track.kind == "video":
+                try:
+                    await asyncio.wait_for(track.recv(), KEYFRAME_REQUEST_INTERVAL)
+                    break
+                except asyncio.TimeoutError:
+                    if not await _request_keyframe(receiver):
+                        break
+            while True:
+                await track.recv()
+        except MediaStreamError:
+            pass
+        finally:
+            track.stop()
+
+    def _schedule(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def stop(self):
+        """Закрытие всех соединений при остановке приложения"""
+        for room in list(self.rooms.values()):
+            for peer in list(room.peers.values()):
+                self._remove_peer(room, peer)
+                await peer.pc.close()
+        self.rooms.clear()
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def get_stats(self) -> dict:
+        return {
+            "threshold": self.threshold,
+            "rooms": len(self.rooms),
+            "peers": sum(len(room.peers) for room in self.rooms.values()),
+            "sources": sum(len(room.sources) for room in self.rooms.values()),
+            "mixing": sum(peer.mixing for room in self.rooms.values() for peer in room.peers.values()),
+            "switches": self.switches_total,
+            "offers": self.offers_total
+        }
+
+
+# Глобальный SFU голосовых комнат
+sfu = SfuManager(settings.VOICE_SFU_THRESHOLD, settings.ICE_SERVERS, send=voice_states._send)
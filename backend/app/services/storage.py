@@ -0,0 +1,196 @@
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, List, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+import aiofiles
+import aiofiles.os
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_utime = aiofiles.os.wrap(os.utime)
+
+
+class StorageUpload(ABC):
+    """Незавершенная загрузка: данные пишутся частями, хэш считается на лету"""
+
+    def __init__(self):
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    @abstractmethod
+    async def write(self, chunk: bytes):
+        ...
+
+    @abstractmethod
+    async def commit(self) -> str:
+        """Фиксация под ключом по содержимому; возвращает ключ"""
+
+    @abstractmethod
+    async def abort(self):
+        ...
+
+
+class ObjectStorage(ABC):
+    """Интерфейс хранилища файлов (локальный диск или объектное хранилище)"""
+
+    @abstractmethod
+    def begin_upload(self) -> StorageUpload:
+        ...
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def read(self, key: str, start: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Потоковое чтение диапазона частями фиксированного размера"""
+
+    @abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    async def modified_at(self, key: str) -> Optional[float]:
+        """Время последней записи (unix); повторная загрузка того же содержимого его обновляет"""
+
+    @abstractmethod
+    def iter_keys(self) -> AsyncIterator[Tuple[str, float]]:
+        """Все сохраненные ключи с временем последней записи — для очистки осиротевших файлов"""
+
+    @abstractmethod
+    async def sweep_uploads(self, older_than: float) -> int:
+        """Удаление загрузок, брошенных без commit/abort (падение процесса); возвращает их число"""
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Путь на диске для отдачи через sendfile; None для удаленных хранилищ"""
+        return None
+
+    @staticmethod
+    def content_key(digest: str) -> str:
+        return f"{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+class LocalUpload(StorageUpload):
+    def __init__(self, storage: "LocalStorage"):
+        super().__init__()
+        self.storage = storage
+        self.temp_path = os.path.join(storage.temp_dir, uuid.uuid4().hex)
+        self._file = None
+
+    async def write(self, chunk: bytes):
+        if self._file is None:
+            self._file = await aiofiles.open(self.temp_path, "wb")
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+        await self._file.write(chunk)
+
+    async def commit(self) -> str:
+        if self._file is None:
+            self._file = await aiofiles.open(self.temp_path, "wb")
+        await self._file.close()
+        key = self.storage.content_key(self.sha256.hexdigest())
+        path = self.storage.local_path(key)
+        if await aiofiles.os.path.exists(path):
+            # Такой файл уже есть — вторая копия не нужна; свежее время защищает его от очистки,
+            # пока строка вложения еще не записана
+            await aiofiles.os.remove(self.temp_path)
+            await _utime(path)
+        else:
+            await aiofiles.os.makedirs(os.path.dirname(path), exist_ok=True)
+            await aiofiles.os.replace(self.temp_path, path)
+        return key
+
+    async def abort(self):
+        if self._file is not None:
+            await self._file.close()
+            try:
+                await aiofiles.os.remove(self.temp_path)
+            except FileNotFoundError:
+                pass
+
+
+class LocalStorage(ObjectStorage):
+    """Хранилище на локальном диске с раскладкой по хэшу содержимого"""
+
+    def __init__(self, root: str, chunk_size: int):
+        self.root = os.path.abspath(root)
+        self.temp_dir = os.path.join(self.root, "tmp")
+        self.chunk_size = chunk_size
+        os.makedirs(self.temp_dir, exist_ok=True)
+
+    def begin_upload(self) -> LocalUpload:
+        return LocalUpload(self)
+
+    async def exists(self, key: str) -> bool:
+        return await aiofiles.os.path.exists(self.local_path(key))
+
+    async def read(self, key: str, start: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        async with aiofiles.open(self.local_path(key), "rb") as file:
+            await file.seek(start)
+            remaining = length
+            while remaining is None or remaining > 0:
+                size = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+                chunk = await file.read(size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    async def delete(self, key: str):
+        try:
+            await aiofiles.os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    async def modified_at(self, key: str) -> Optional[float]:
+        try:
+            return (await aiofiles.os.stat(self.local_path(key))).st_mtime
+        except FileNotFoundError:
+            return None
+
+    async def iter_keys(self) -> AsyncIterator[Tuple[str, float]]:
+        # Обход по каталогам первого уровня (ab/): в память не попадает список всего хранилища
+        for name in sorted(await aiofiles.os.listdir(self.root)):
+            directory = os.path.join(self.root, name)
+            if directory == self.temp_dir or not await aiofiles.os.path.isdir(directory):
+                continue
+            for entry in await asyncio.to_thread(self._scan, directory):
+                yield entry
+
+    def _scan(self, directory: str) -> List[Tuple[str, float]]:
+        entries = []
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    modified = os.stat(path).st_mtime
+                except FileNotFoundError:
+                    continue
+                entries.append((os.path.relpath(path, self.root).replace(os.sep, "/"), modified))
+        return entries
+
+    async def sweep_uploads(self, older_than: float) -> int:
+        cutoff = time.time() - older_than
+        removed = 0
+        for name in await aiofiles.os.listdir(self.temp_dir):
+            path = os.path.join(self.temp_dir, name)
+            try:
+                if (await aiofiles.os.stat(path)).st_mtime < cutoff:
+                    await aiofiles.os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+
+# Глобальное хранилище вложений
+storage: ObjectStorage = LocalStorage(settings.ATTACHMENT_STORAGE_PATH, settings.ATTACHMENT_CHUNK_SIZE)
@@ -0,0 +1,45 @@
+# Выполняется в дочерних процессах: модуль не импортирует приложение
+from typing import List
+import os
+import uuid
+from PIL import Image, ImageOps
+
+
+def derivative_suffix(size: int) -> str:
+    """Суффикс ключа уменьшенной копии рядом с оригиналом"""
+    return f".t{size}.webp"
+
+
+def render_derivatives(source_path: str, sizes: List[int], quality: int, max_pixels: int) -> dict:
+    """Размеры оригинала и уменьшенные копии в WebP без метаданных (EXIF, GPS, ICC не копируются)"""
+    # Pillow отказывает только свыше 2 × MAX_IMAGE_PIXELS, а до этого лишь предупреждает
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    with Image.open(source_path) as original:
+        # open читает только заголовок: размер проверяется до распаковки пикселей
+        if original.width * original.height > max_pixels:
+            raise Image.DecompressionBombError(
+                f"{original.width}x{original.height} больше допустимых {max_pixels} пикселей"
+            )
+        original.seek(0)  # у анимаций — первый кадр
+        image = ImageOps.exif_transpose(original)
+        width, height = image.size
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+
+        thumbnails = []
+        for size in sorted(sizes):
+            if size >= max(width, height) and thumbnails:
+                break
+            thumbnail = image.copy()
+            thumbnail.thumbnail((size, size), Image.Resampling.LANCZOS)
+            path = source_path + derivative_suffix(size)
+            temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            thumbnail.save(temp_path, "WEBP", quality=quality, method=4)
+            os.replace(temp_path, path)
+            thumbnails.append({
+                "size": size,
+                "width": thumbnail.width,
+                "height": thumbnail.height,
+                "bytes": os.path.getsize(path)
+            })
+    return {"width": width, "height": height, "thumbnails": thumbnails}
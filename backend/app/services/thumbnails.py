@@ -0,0 +1,149 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Set
+from sqlalchemy import select, update
+import asyncio
+import logging
+import multiprocessing
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.models import Attachment
+from app.schemas.message import Attachment as AttachmentSchema
+from app.services.storage import storage
+from app.services.thumbnail_worker import derivative_suffix, render_derivatives
+from app.services.message_cache import message_cache
+from app.services.message_ingest import message_ingest
+from app.websocket.connection_manager import manager
+
+logger = logging.getLogger(__name__)
+
+IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif", "image/bmp"}
+
+
+def thumbnail_key(sha256: str, size: int) -> str:
+    return storage.content_key(sha256) + derivative_suffix(size)
+
+
+class ThumbnailPipeline:
+    """Уменьшенные копии изображений в пуле процессов: CPU-работа не попадает в цикл событий"""
+
+    def __init__(self, workers: int, sizes: List[int], quality: int, max_pixels: int):
+        self.workers = workers
+        self.sizes = sizes
+        self.quality = quality
+        self.max_pixels = max_pixels
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.processed_total = 0
+        self.failed_total = 0
+
+    def start(self):
+        if self._executor is None:
+            # spawn: дочерние процессы не наследуют цикл событий и соединения родителя
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"🖼️ Обработка изображений: {self.workers} процессов, размеры {self.sizes}")
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, attachment: Attachment):
+        """Постановка загруженного изображения в обработку (не ждет результата)"""
+        if self._executor is None or attachment.content_type not in IMAGE_TYPES:
+            return
+        if storage.local_path(storage.content_key(attachment.sha256)) is None:
+            return
+        task = asyncio.create_task(self._process(attachment.id, attachment.sha256, attachment.text_channel_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, attachment_id: int, sha256: str, text_channel_id: int):
+        try:
+            metadata = await self._existing_metadata(sha256)
+            if metadata is None:
+                loop = asyncio.get_running_loop()
+                metadata = await loop.run_in_executor(
+                    self._executor,
+                    render_derivatives,
+                    storage.local_path(storage.content_key(sha256)),
+                    self.sizes,
+                    self.quality,
+                    self.max_pixels
+                )
+        except Exception as e:
+            self.failed_total += 1
+            logger.warning(f"⚠️ Не удалось обработать изображение {attachment_id}: {e}")
+            return
+
+        thumbnails = [
+            {**thumbnail, "url": f"/api/attachments/{attachment_id}/thumbnails/{thumbnail['size']}"}
+            for thumbnail in metadata["thumbnails"]
+        ]
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(Attachment)
+                .where(Attachment.id == attachment_id)
+                .values(width=metadata["width"], height=metadata["height"], thumbnails=thumbnails)
+                .returning(Attachment.message_id)
+                .execution_options(synchronize_session=False)
+            )
+            message_id = result.scalar_one_or_none()
+            await db.commit()
+
+            if message_id is None:
+                # Сообщение еще не отправлено — метаданные попадут в него при привязке
+                self.processed_total += 1
+                return
+            attachments = (await db.execute(
+                select(Attachment).where(Attachment.message_id == message_id).order_by(Attachment.id)
+            )).scalars().all()
+        self.processed_total += 1
+
+        await message_cache.invalidate(text_channel_id)
+        server_id = await message_ingest.channels.get_server_id(text_channel_id)
+        if server_id is not None:
+            await manager.send_to_channel(server_id, {
+                "type": "message_update",
+                "id": str(message_id),
+                "text_channel_id": text_channel_id,
+                "attachments": [
+                    AttachmentSchema.model_validate(attachment).model_dump(mode="json")
+                    for attachment in attachments
+                ]
+            })
+
+    async def _existing_metadata(self, sha256: str) -> Optional[dict]:
+        """Такой же файл уже обрабатывался — копии лежат рядом с общим оригиналом"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Attachment.width, Attachment.height, Attachment.thumbnails)
+                .where(Attachment.sha256 == sha256, Attachment.thumbnails.is_not(None))
+                .limit(1)
+            )
+            row = result.first()
+        if row is None:
+            return None
+        return {"width": row.width, "height": row.height, "thumbnails": row.thumbnails}
+
+    def get_stats(self) -> dict:
+        return {
+            'running': len(self._tasks),
+            'processed_total': self.processed_total,
+            'failed_total': self.failed_total
+        }
+
+
+# Глобальный конвейер
+thumbnails = ThumbnailPipeline(
+    workers=settings.THUMBNAIL_WORKERS,
+    sizes=settings.THUMBNAIL_SIZES,
+    quality=settings.THUMBNAIL_QUALITY,
+    max_pixels=settings.THUMBNAIL_MAX_PIXELS
+)
@@ -0,0 +1,596 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+from fastapi import WebSocket, status
+from sqlalchemy import select, delete, update, bindparam, func, Boolean
+import asyncio
+import logging
+from app.core.config import settings
+from app.core.serialization import dumps, loads
+from app.db.database import AsyncSessionLocal
+from app.models import VoiceChannelUser
+from app.websocket.connection_manager import manager
+from app.websocket.frames import EncodedFrame
+from app.websocket.outbox import ConnectionOutbox
+from app.websocket.signaling import ICE_BATCHING, SIGNAL_FIELDS, SUPPORTED_FEATURES, IceCandidateBatcher, relay_frame
+
+logger = logging.getLogger(__name__)
+
+CHANNELS_KEY = "voice:channels"  # множество голосовых каналов, в которых есть участники
+SLOT_CHANNELS_KEY = "voice:slot_channels"  # каналы с занятыми местами
+PUBLIC_FIELDS = ("user_id", "username", "is_muted", "is_deafened", "is_screen_sharing")
+
+# Запись участника меняет и удаляет только подключение, которое ее создало:
+# повторный вход того же пользователя не затирается выходом старой вкладки
+_UPDATE_SCRIPT = """
+local raw = redis.call('HGET', KEYS[1], ARGV[1])
+if not raw then return 0 end
+local participant = cjson.decode(raw)
+if participant['connection_id'] ~= ARGV[2] then return 0 end
+for field, value in pairs(cjson.decode(ARGV[3])) do
+    participant[field] = value
+end
+redis.call('HSET', KEYS[1], ARGV[1], cjson.encode(participant))
+return 1
+"""
+
+_LEAVE_SCRIPT = """
+local raw = redis.call('HGET', KEYS[1], ARGV[1])
+if not raw then return 0 end
+if cjson.decode(raw)['connection_id'] ~= ARGV[2] then return 0 end
+redis.call('HDEL', KEYS[1], ARGV[1])
+if redis.call('HLEN', KEYS[1]) == 0 then
+    redis.call('SREM', KEYS[2], ARGV[3])
+end
+return 1
+"""
+
+# Места в канале: множество '<узел>:<подключение>', проверка лимита и захват одной операцией (SCARD — O(1))
+_RESERVE_SCRIPT = """
+if redis.call('SISMEMBER', KEYS[1], ARGV[1]) == 1 then return 1 end
+local limit = tonumber(ARGV[2])
+if limit > 0 and redis.call('SCARD', KEYS[1]) >= limit then return 0 end
+redis.call('SADD', KEYS[1], ARGV[1])
+redis.call('SADD', KEYS[2], ARGV[3])
+return 1
+"""
+
+_RELEASE_SCRIPT = """
+local removed = redis.call('SREM', KEYS[1], ARGV[1])
+if redis.call('SCARD', KEYS[1]) == 0 then
+    redis.call('SREM', KEYS[2], ARGV[2])
+end
+return removed
+"""
+
+
+def _channel_key(channel_id: int) -> str:
+    return f"voice:channel:{channel_id}"
+
+
+def _slots_key(channel_id: int) -> str:
+    return f"voice:slots:{channel_id}"
+
+
+def _node_key(node_id: str) -> str:
+    return f"voice:node:{node_id}"
+
+
+def public_participant(participant: dict) -> dict:
+    """Участник в виде для клиентов: без узла и идентификатора подключения"""
+    return {field: participant.get(field, False) for field in PUBLIC_FIELDS}
+
+
+class VoiceStateStore:
+    """Участники голосовых комнат: общее состояние (память или Redis) и локальные сокеты узла"""
+
+    def __init__(
+        self,
+        use_redis: bool,
+        single_node: bool,
+        node_ttl: int,
+        reconcile_interval: float,
+        flags_flush_interval: float,
+        ice_batch_window: float,
+        ice_batch_max: int
+    ):
+        self.use_redis = use_redis
+        self.single_node = single_node
+        self.node_ttl = node_ttl
+        self.reconcile_interval = reconcile_interval
+        self.flags_flush_interval = flags_flush_interval
+        self.redis_client = None
+        self._update_script = None
+        self._leave_script = None
+        self._reserve_script = None
+        self._release_script = None
+        self.node_id = manager.node_id
+        # Строки VoiceChannelUser старше запуска процесса без Redis принадлежат только упавшему процессу
+        self.started_at = datetime.now(timezone.utc)
+        # Состояние комнат в памяти процесса (без Redis)
+        self.channels: Dict[int, Dict[int, dict]] = {}
+        # Занятые места в каналах (без Redis) и места, занятые подключениями этого узла
+        self.slots: Dict[int, Set[str]] = {}
+        self.reserved: Dict[str, int] = {}  # connection_id -> voice_channel_id
+        # Сокеты участников, подключенных к этому узлу, и включенные ими возможности протокола
+        self.local: Dict[int, Dict[int, WebSocket]] = {}
+        self.features: Dict[WebSocket, Set[str]] = {}
+        # Исходящие очереди локальных сокетов: медленный участник не задерживает рассылку комнате
+        self.outboxes: Dict[WebSocket, ConnectionOutbox] = {}
+        # Окно 0 — пакетная отправка ICE-кандидатов выключена
+        self.ice_batcher = (
+            IceCandidateBatcher(ice_batch_window, ice_batch_max, send=self._send) if ice_batch_window > 0 else None
+        )
+        # mute/deafen, ожидающие записи в VoiceChannelUser: (канал, пользователь) -> поля
+        self._pending_flags: Dict[Tuple[int, int], Dict[str, bool]] = {}
+        self._task: asyncio.Task | None = None
+        self._flush_task: asyncio.Task | None = None
+        self.flag_changes = 0
+        self.flag_writes = 0
+        self.forwarded_total = 0
+        self.ghosts_removed = 0
+        self.rejected_total = 0
+        manager.register_redis_handler("voice_room", self._handle_room_message)
+        manager.register_redis_handler("voice_user", self._handle_user_message)
+
+    def attach_redis(self, redis_client):
+        if self.use_redis and redis_client is not None:
+            self.redis_client = redis_client
+            self._update_script = redis_client.register_script(_UPDATE_SCRIPT)
+            self._leave_script = redis_client.register_script(_LEAVE_SCRIPT)
+            self._reserve_script = redis_client.register_script(_RESERVE_SCRIPT)
+            self._release_script = redis_client.register_script(_RELEASE_SCRIPT)
+        elif self.use_redis:
+            logger.warning("⚠️ VOICE_STATE_REDIS включен, но Redis недоступен: голосовые комнаты видны только этому процессу")
+
+    async def start(self):
+        """Отметка узла живым и очистка участников, оставшихся после падения процессов"""
+        await self._touch_node()
+        try:
+            await self.reconcile()
+        except Exception as e:
+            logger.error(f"❌ Ошибка сверки голосовых участников: {e}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Остановка с записью накопленных mute/deafen"""
+        for task in (self._task, self._flush_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._flush_task = None
+        await self.flush_flags()
+        # Участники этого узла больше не обслуживаются — остальные узлы не должны их видеть
+        if self.redis_client is not None:
+            try:
+                await self._remove_node(self.node_id)
+                for connection_id, channel_id in list(self.reserved.items()):
+                    await self.release(channel_id, connection_id)
+                await self.redis_client.delete(_node_key(self.node_id))
+            except Exception as e:
+                logger.error(f"❌ Ошибка очистки голосового состояния узла: {e}")
+
+    async def _run(self):
+        elapsed = 0.0
+        step = self.node_ttl / 3
+        while True:
+            await asyncio.sleep(step)
+            await self._touch_node()
+            elapsed += step
+            if elapsed >= self.reconcile_interval:
+                elapsed = 0.0
+                try:
+                    await self.reconcile()
+                except Exception as e:
+                    logger.error(f"❌ Ошибка сверки голосовых участников: {e}")
+
+    async def _touch_node(self):
+        if self.redis_client is None:
+            return
+        try:
+            await self.redis_client.set(_node_key(self.node_id), 1, ex=self.node_ttl)
+        except Exception as e:
+            logger.error(f"❌ Ошибка продления голосового узла: {e}")
+
+    # Места в каналах
+
+    async def reserve(self, channel_id: int, connection_id: str, max_users: Optional[int]) -> bool:
+        """Захват места до accept(): проверка лимита и увеличение счетчика атомарны"""
+        limit = max_users or 0  # 0 — без ограничения
+        # Отметка до вызова скрипта: сверка не должна принять свежее место за осиротевшее
+        self.reserved[connection_id] = channel_id
+        if self.redis_client is None:
+            slots = self.slots.setdefault(channel_id, set())
+            admitted = connection_id in slots or limit <= 0 or len(slots) < limit
+            if admitted:
+                slots.add(connection_id)
+            elif not slots:
+                del self.slots[channel_id]
+        else:
+            try:
+                admitted = bool(await self._reserve_script(
+                    keys=[_slots_key(channel_id), SLOT_CHANNELS_KEY],
+                    args=[f"{self.node_id}:{connection_id}", limit, channel_id]
+                ))
+            except BaseException:
+                del self.reserved[connection_id]
+                raise
+        if not admitted:
+            del self.reserved[connection_id]
+            self.rejected_total += 1
+        return admitted
+
+    async def release(self, channel_id: int, connection_id: str):
+        """Освобождение места; повторный вызов ничего не меняет"""
+        if self.reserved.pop(connection_id, None) is None:
+            return
+        if self.redis_client is None:
+            slots = self.slots.get(channel_id)
+            if slots is not None:
+                slots.discard(connection_id)
+                if not slots:
+                    del self.slots[channel_id]
+            return
+        try:
+            await self._release_script(
+                keys=[_slots_key(channel_id), SLOT_CHANNELS_KEY],
+                args=[f"{self.node_id}:{connection_id}", channel_id]
+            )
+        except Exception as e:
+            # Место вернет сверка: подключения нет в self.reserved
+            logger.error(f"❌ Ошибка освобождения места в голосовом канале {channel_id}: {e}")
+
+    async def _release_orphan_slots(self, alive: Dict[str, bool]) -> int:
+        """Места упавших узлов и подключений этого узла, которые уже закрыты"""
+        released = 0
+        for channel_id in await self.redis_client.smembers(SLOT_CHANNELS_KEY):
+            channel_id = int(channel_id)
+            for member in await self.redis_client.smembers(_slots_key(channel_id)):
+                member = member.decode() if isinstance(member, bytes) else member
+                node_id, _, connection_id = member.rpartition(":")
+                if node_id not in alive:
+                    alive[node_id] = bool(await self.redis_client.exists(_node_key(node_id)))
+                if node_id == self.node_id:
+                    orphan = connection_id not in self.reserved
+                else:
+                    orphan = not alive[node_id]
+                if orphan:
+                    released += await self._release_script(
+                        keys=[_slots_key(channel_id), SLOT_CHANNELS_KEY],
+                        args=[member, channel_id]
+                    )
+        return released
+
+    # Состояние комнат
+
+    async def join(self, channel_id: int, participant: dict):
+        """Добавление участника; запись нового подключения заменяет прежнюю"""
+        participant = {**participant, "node_id": self.node_id}
+        # Новая строка VoiceChannelUser создается с флагами по умолчанию — старые изменения к ней не относятся
+        self._pending_flags.pop((channel_id, participant["user_id"]), None)
+        if self.redis_client is None:
+            self.channels.setdefault(channel_id, {})[participant["user_id"]] = participant
+            return
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(_channel_key(channel_id), str(participant["user_id"]), dumps(participant))
+            pipe.sadd(CHANNELS_KEY, channel_id)
+            await pipe.execute()
+
+    async def update(self, channel_id: int, user_id: int, connection_id: str, **fields) -> bool:
+        """Изменение mute/deafen/демонстрации экрана участника"""
+        if self.redis_client is None:
+            participant = self.channels.get(channel_id, {}).get(user_id)
+            if participant is None or participant["connection_id"] != connection_id:
+                return False
+            participant.update(fields)
+            return True
+        return bool(await self._update_script(
+            keys=[_channel_key(channel_id)],
+            args=[user_id, connection_id, dumps(fields)]
+        ))
+
+    async def leave(self, channel_id: int, user_id: int, connection_id: str) -> bool:
+        """Удаление участника; False — запись уже принадлежит другому подключению"""
+        if self.redis_client is None:
+            participants = self.channels.get(channel_id, {})
+            participant = participants.get(user_id)
+            if participant is None or participant["connection_id"] != connection_id:
+                return False
+            del participants[user_id]
+            if not participants:
+                del self.channels[channel_id]
+            left = True
+        else:
+            left = bool(await self._leave_script(
+                keys=[_channel_key(channel_id), CHANNELS_KEY],
+                args=[user_id, connection_id, channel_id]
+            ))
+        if left:
+            # Строка VoiceChannelUser удаляется при выходе — ожидающие mute/deafen писать некуда
+            self._pending_flags.pop((channel_id, user_id), None)
+        return left
+
+    async def set_flags(self, channel_id: int, user_id: int, connection_id: str, **flags: bool) -> bool:
+        """mute/deafen: сразу в общем состоянии, в БД — пакетом, не чаще раза за интервал"""
+        if not await self.update(channel_id, user_id, connection_id, **flags):
+            return False
+        self._pending_flags.setdefault((channel_id, user_id), {}).update(flags)
+        self.flag_changes += 1
+        return True
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flags_flush_interval)
+            await self.flush_flags()
+
+    async def flush_flags(self):
+        pending, self._pending_flags = self._pending_flags, {}
+        if pending:
+            await self._write_flags(pending)
+
+    async def _write_flags(self, pending: Dict[Tuple[int, int], Dict[str, bool]]):
+        """Один executemany на пакет; не менявшееся поле (None) остается прежним"""
+        table = VoiceChannelUser.__table__
+        statement = (
+            update(table)
+            .where(
+                table.c.voice_channel_id == bindparam("b_channel_id"),
+                table.c.user_id == bindparam("b_user_id")
+            )
+            .values(
+                is_muted=func.coalesce(bindparam("b_is_muted", type_=Boolean), table.c.is_muted),
+                is_deafened=func.coalesce(bindparam("b_is_deafened", type_=Boolean), table.c.is_deafened)
+            )
+        )
+        params = [
+            {
+                "b_channel_id": channel_id,
+                "b_user_id": user_id,
+                "b_is_muted": flags.get("is_muted"),
+                "b_is_deafened": flags.get("is_deafened")
+            }
+            for (channel_id, user_id), flags in pending.items()
+        ]
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(statement, params)
+                await db.commit()
+            self.flag_writes += len(params)
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи mute/deafen в БД: {e}")
+            # Возвращаем в очередь, не затирая изменения, пришедшие во время записи
+            for key, flags in pending.items():
+                self._pending_flags[key] = {**flags, **self._pending_flags.get(key, {})}
+
+    async def participants(self, channel_id: int) -> Dict[int, dict]:
+        """Участники комнаты со всех узлов"""
+        if self.redis_client is None:
+            return dict(self.channels.get(channel_id, {}))
+        raw = await self.redis_client.hgetall(_channel_key(channel_id))
+        return {int(user_id): loads(value) for user_id, value in raw.items()}
+
+    async def _all_participants(self) -> List[Tuple[int, dict]]:
+        if self.redis_client is None:
+            return [
+                (channel_id, participant)
+                for channel_id, participants in self.channels.items()
+                for participant in participants.values()
+            ]
+        result = []
+        for channel_id in await self.redis_client.smembers(CHANNELS_KEY):
+            channel_id = int(channel_id)
+            for participant in (await self.participants(channel_id)).values():
+                result.append((channel_id, participant))
+        return result
+
+    # Доставка событий участникам
+
+    def add_local(self, channel_id: int, user_id: int, websocket: WebSocket):
+        self.local.setdefault(channel_id, {})[user_id] = websocket
+        if websocket not in self.outboxes:
+            self.outboxes[websocket] = ConnectionOutbox(
+                websocket,
+                self._evict_slow_socket,
+                max_size=settings.WS_SEND_QUEUE_SIZE,
+                send_timeout=settings.WS_SEND_TIMEOUT
+            )
+
+    def remove_local(self, channel_id: int, user_id: int, websocket: WebSocket):
+        self.features.pop(websocket, None)
+        outbox = self.outboxes.pop(websocket, None)
+        if outbox is not None:
+            outbox.close()
+        if self.ice_batcher is not None:
+            self.ice_batcher.discard(websocket)
+        sockets = self.local.get(channel_id)
+        if sockets and sockets.get(user_id) is websocket:
+            del sockets[user_id]
+            if not sockets:
+                del self.local[channel_id]
+
+    async def _deliver(self, channel_id: int, frame: EncodedFrame, exclude_user_id: Optional[int] = None):
+        for user_id, websocket in list(self.local.get(channel_id, {}).items()):
+            if user_id != exclude_user_id:
+                await self._send(websocket, frame)
+
+    async def _send(self, websocket: WebSocket, frame: EncodedFrame):
+        """Постановка кадра в очередь сокета; сокеты вне комнат (до входа) — напрямую"""
+        outbox = self.outboxes.get(websocket)
+        if outbox is not None:
+            outbox.enqueue(frame.text)
+            return
+        try:
+            await frame.send(websocket)
+        except Exception:
+            pass
+
+    async def _evict_slow_socket(self, websocket: WebSocket, reason: str):
+        """Участник не успевает принимать события комнаты: закрытие, выход обработает цикл сокета"""
+        logger.warning(f"🐢 Отключение медленного голосового клиента: {reason}")
+        try:
+            await asyncio.wait_for(
+                websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Slow consumer"),
+                timeout=settings.WS_SEND_TIMEOUT
+            )
+        except Exception:
+            pass
+
+    async def broadcast(self, channel_id: int, message: dict, exclude_user_id: Optional[int] = None):
+        """Рассылка события комнате: локальным сокетам сразу, остальным узлам через Redis"""
+        frame = EncodedFrame.encode(message)
+        await self._deliver(channel_id, frame, exclude_user_id)
+        await manager.publish(
+            f"voice_room:{channel_id}",
+            {"exclude": exclude_user_id, "message": message},
+            shared_state=self.redis_client is not None
+        )
+
+    def supported_features(self) -> List[str]:
+        return [feature for feature in SUPPORTED_FEATURES if feature != ICE_BATCHING or self.ice_batcher is not None]
+
+    def negotiate(self, websocket: WebSocket, requested: List[str]) -> List[str]:
+        """Включение возможностей протокола, которые клиент запросил и которые поддерживает узел"""
+        supported = self.supported_features()
+        enabled = [feature for feature in requested if feature in supported]
+        self.features[websocket] = set(enabled)
+        return enabled
+
+    async def relay_signal(self, channel_id: int, target_id: int, from_id: int, signal_type: str, payload: str):
+        """offer/answer/ICE-кандидат (payload — готовый JSON) участнику комнаты, на каком бы узле он ни был"""
+        websocket = self.local.get(channel_id, {}).get(target_id)
+        if websocket is not None:
+            await self._deliver_signal(websocket, from_id, signal_type, payload)
+            return
+        # Узел получателя сам проверяет, что тот подключен к этой комнате
+        await manager.publish(
+            f"voice_user:{channel_id}:{target_id}",
+            relay_frame(signal_type, from_id, payload),
+            shared_state=self.redis_client is not None
+        )
+        self.forwarded_total += 1
+
+    async def _deliver_signal(self, websocket: WebSocket, from_id: int, signal_type: str, payload: str):
+        if self.ice_batcher is not None and ICE_BATCHING in self.features.get(websocket, ()):
+            if signal_type == "ice_candidate":
+                await self.ice_batcher.add(websocket, from_id, payload)
+                return
+            # Кандидаты прежнего согласования не должны прийти после нового offer/answer
+            await self.ice_batcher.flush(websocket, from_id)
+        await self._send(websocket, relay_frame(signal_type, from_id, payload))
+
+    async def _handle_room_message(self, key: str, data: Any):
+        await self._deliver(int(key), EncodedFrame.encode(data["message"]), data.get("exclude"))
+
+    async def _handle_user_message(self, key: str, data: Any):
+        channel_id, _, user_id = key.partition(":")
+        websocket = self.local.get(int(channel_id), {}).get(int(user_id))
+        if websocket is not None:
+            signal_type = data["type"]
+            await self._deliver_signal(websocket, data["from_id"], signal_type, dumps(data[SIGNAL_FIELDS[signal_type]]))
+
+    # Сверка с БД
+
+    async def _remove_node(self, node_id: str) -> List[Tuple[int, dict]]:
+        """Удаление из общего состояния всех участников узла"""
+        removed = []
+        for channel_id, participant in await self._all_participants():
+            if participant.get("node_id") == node_id and await self.leave(
+                channel_id, participant["user_id"], participant["connection_id"]
+            ):
+                removed.append((channel_id, participant))
+        return removed
+
+    async def _remove_orphans(self, alive: Dict[str, bool]) -> List[Tuple[int, dict]]:
+        """Участники узлов, переставших продлевать свою отметку, и записи этого узла без сокета"""
+        removed = []
+        for channel_id, participant in await self._all_participants():
+            node_id = participant.get("node_id")
+            if node_id not in alive:
+                alive[node_id] = bool(await self.redis_client.exists(_node_key(node_id)))
+            if node_id == self.node_id:
+                orphan = participant["user_id"] not in self.local.get(channel_id, {})
+            else:
+                orphan = not alive[node_id]
+            if orphan and await self.leave(channel_id, participant["user_id"], participant["connection_id"]):
+                removed.append((channel_id, participant))
+        return removed
+
+    async def _remove_stale_rows(self, before: datetime, live: Set[Tuple[int, int]]) -> int:
+        """Строки VoiceChannelUser старше before, которых нет среди живых участников"""
+        async with AsyncSessionLocal() as db:
+            # Строки моложе начала сверки не трогаем: участник мог войти, пока она шла
+            result = await db.execute(
+                select(VoiceChannelUser.id, VoiceChannelUser.voice_channel_id, VoiceChannelUser.user_id)
+                .where(VoiceChannelUser.joined_at < before)
+            )
+            stale = [row.id for row in result.all() if (row.voice_channel_id, row.user_id) not in live]
+            if stale:
+                await db.execute(delete(VoiceChannelUser).where(VoiceChannelUser.id.in_(stale)))
+                await db.commit()
+        return len(stale)
+
+    async def reconcile(self):
+        """Удаление призрачных участников: из общего состояния (упавшие узлы) и строк VoiceChannelUser"""
+        if self.redis_client is None:
+            # Без Redis процесс видит только своих участников: строки остальных воркеров он принял бы
+            # за призраков. Единственный процесс при старте удаляет строки, оставшиеся от прошлого запуска
+            if self.single_node and self._task is None:
+                stale = await self._remove_stale_rows(self.started_at, set())
+                self.ghosts_removed += stale
+                if stale:
+                    logger.info(f"👻 Удалены голосовые участники прошлого запуска: строк {stale}")
+            return
+        started = datetime.now(timezone.utc)
+        alive: Dict[str, bool] = {self.node_id: True}
+        ghosts = await self._remove_orphans(alive)
+        released = await self._release_orphan_slots(alive)
+        live = {(channel_id, participant["user_id"]) for channel_id, participant in await self._all_participants()}
+        stale = await self._remove_stale_rows(started, live)
+
+        for channel_id, participant in ghosts:
+            await self.broadcast(channel_id, {"type": "user_left_voice", "user_id": participant["user_id"]})
+            await manager.broadcast_to_all({
+                "type": "voice_channel_leave",
+                "user_id": participant["user_id"],
+                "username": participant.get("username"),
+                "voice_channel_id": channel_id
+            })
+        self.ghosts_removed += stale
+        if stale or ghosts or released:
+            logger.info(
+                f"👻 Удалены призрачные голосовые участники: строк {stale}, "
+                f"записей без подключения {len(ghosts)}, мест {released}"
+            )
+
+    def get_stats(self) -> dict:
+        return {
+            "backend": "redis" if self.redis_client is not None else "memory",
+            "local_channels": len(self.local),
+            "local_participants": sum(len(sockets) for sockets in self.local.values()),
+            "queued_frames": sum(outbox.queue.qsize() for outbox in self.outboxes.values()),
+            "reserved_slots": len(self.reserved),
+            "rejected_joins": self.rejected_total,
+            "flag_changes": self.flag_changes,
+            "flag_writes": self.flag_writes,
+            "pending_flags": len(self._pending_flags),
+            "forwarded_signals": self.forwarded_total,
+            "ice_batching": self.ice_batcher.get_stats() if self.ice_batcher is not None else None,
+            "ghosts_removed": self.ghosts_removed
+        }
+
+
+# Глобальное хранилище голосовых комнат
+voice_states = VoiceStateStore(
+    use_redis=settings.VOICE_STATE_REDIS,
+    single_node=settings.WS_CLUSTER_NODES == 1,
+    node_ttl=settings.VOICE_NODE_TTL,
+    reconcile_interval=settings.VOICE_RECONCILE_INTERVAL,
+    flags_flush_interval=settings.VOICE_FLAGS_FLUSH_INTERVAL,
+    ice_batch_window=settings.VOICE_ICE_BATCH_WINDOW,
+    ice_batch_max=settings.VOICE_ICE_BATCH_MAX
+)
@@ -9,7 +9,11 @@ from app.schemas.message import MessageCreate, Message as MessageSchema
 from app.core.security import decode_access_token
 from app.websocket.connection_manager import manager
 from app.core.dependencies import get_current_user_ws
-import asyncio
+from app.services.message_ingest import message_ingest
+from app.services.rate_limit import rate_limiter
+from app.services.read_state import read_states
+from app.services.indicators import indicators
+from app.core.snowflake import parse_snowflake
 
 
 
@@ -17,79 +21,86 @@ async def websocket_chat_endpoint(
     websocket: WebSocket,
     channel_id: int,
     token: str = Query(...),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    session_id: str = None
 ):
     """WebSocket эндпоинт для чата в текстовых каналах"""
     try:
-        # Аутентификация пользователя
-        user = await get_current_user_ws(token, db)
+        # Аутентификация пользователя (сессия БД нужна только здесь — дальше работает конвейер записи)
+        async with AsyncSessionLocal() as db:
+            user = await get_current_user_ws(token, db)
         if not user:
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
             return
 
         # Подключение к WebSocket
-        await manager.connect(websocket, user.id, channel_id)
+        await manager.connect(websocket, user.id, channel_id, session_id=session_id)
         
         try:
             while True:
                 # Получение сообщения от клиента
                 data = await websocket.receive_text()
+                manager.heartbeat.touch(websocket)
                 message_data = json.loads(data)
                 
-                if message_data.get("type") == "message":
+                if message_data.get("type") == "ping":
+                    await manager.send_pong(websocket)
+                
+                elif message_data.get("type") == "resume":
+                    # Досылка событий, пропущенных за время обрыва
+                    if await rate_limiter.enforce(websocket, "resume", user.id):
+                        await manager.resume(websocket, message_data.get("session_id"), message_data.get("last_seq"))
+                
+                elif message_data.get("type") == "message":
                     # Обработка текстового сообщения
                     content = message_data.get("content", "").strip()
                     text_channel_id = message_data.get("text_channel_id")
+                    attachment_ids = message_data.get("attachment_ids") or []
                     
-                    if content and text_channel_id:
-                        # Проверяем существование текстового канала
-                        text_channel_result = await db.execute(
-                            select(TextChannel).where(TextChannel.id == text_channel_id)
+                    if (content or attachment_ids) and text_channel_id and await rate_limiter.enforce(
+                        websocket, "message", user.id, channel_id,
+                        nonce=message_data.get("nonce"),
+                        text_channel_id=text_channel_id
+                    ):
+                        # Рассылка сразу, запись в БД — пакетом в фоне с подтверждением отправителю
+                        accepted = await message_ingest.submit(
+                            user, channel_id, text_channel_id, content,
+                            sender=websocket,
+                            nonce=message_data.get("nonce"),
+                            attachment_ids=attachment_ids if isinstance(attachment_ids, list) else []
                         )
-                        text_channel = text_channel_result.scalar_one_or_none()
-                        
-                        if text_channel:
-                            # Создаем сообщение
-                            db_message = Message(
-                                content=content,
-                                author_id=user.id,
-                                text_channel_id=text_channel_id
-                            )
-                            db.add(db_message)
-                            await db.commit()
-                            await db.refresh(db_message)
-                            
-                            # Отправляем сообщение всем участникам канала
-                            await manager.send_to_channel(channel_id, {
-                                "type": "message",
-                                "id": db_message.id,
-                                "content": db_message.content,
-                                "author": {
-                                    "id": user.id,
-                                    "username": user.username
-                                },
-                                "timestamp": db_message.created_at.isoformat(),
-                                "text_channel_id": text_channel_id
-                            })
+                        indicators.stop_typing(channel_id, user.id, text_channel_id)
+                        if accepted is None:
+                            await manager.send_personal_message(json.dumps({
+                                "type": "message_error",
+                                "nonce": message_data.get("nonce"),
+                                "text_channel_id": text_channel_id,
+                                "detail": "Text channel not found, message is empty or server is busy"
+                            }), websocket)
+                
+                elif message_data.get("type") == "ack":
+                    # Отметка о прочтении канала до указанного сообщения
+                    text_channel_id = message_data.get("text_channel_id")
+                    message_id = parse_snowflake(message_data.get("message_id"))
+                    if (
+                        isinstance(text_channel_id, int) and message_id is not None
+                        and await rate_limiter.enforce(websocket, "ack", user.id, channel_id)
+                        and await message_ingest.channels.get_server_id(text_channel_id) == channel_id
+                    ):
+                        await read_states.ack(user.id, text_channel_id, message_id)
                 
                 elif message_data.get("type") == "typing":
-                    # Обработка индикатора печати
+                    # Индикатор печати: начало и конец уходят кадром typing_update, повтор только продлевает
                     text_channel_id = message_data.get("text_channel_id")
-                    if text_channel_id:
-                        await manager.send_to_channel(channel_id, {
-                            "type": "typing",
-                            "user": {
-                                "id": user.id,
-                                "username": user.username
-                            },
-                            "text_channel_id": text_channel_id
-                        })
+                    if text_channel_id and await rate_limiter.enforce(websocket, "typing", user.id, channel_id):
+                        indicators.set_typing(channel_id, text_channel_id, user.id, user.username)
                         
         except WebSocketDisconnect:
             pass
         except Exception as e:
             print(f"Ошибка в WebSocket чата: {e}")
         finally:
+            indicators.stop_typing(channel_id, user.id)
             await manager.disconnect(websocket, user.id, channel_id)
             
     except Exception as e:
@@ -99,7 +110,8 @@ async def websocket_chat_endpoint(
 
 async def websocket_notifications_endpoint(
     websocket: WebSocket,
-    token: str = Query(...)
+    token: str = Query(...),
+    session_id: str = None
 ):
     """WebSocket эндпоинт для уведомлений (приглашения, синхронизация)"""
     async with AsyncSessionLocal() as db:
@@ -111,21 +123,22 @@ async def websocket_notifications_endpoint(
                 return
 
             # Подключение к WebSocket (без привязки к каналу)
-            await manager.connect(websocket, user.id)
+            await manager.connect(websocket, user.id, session_id=session_id)
             
             try:
                 while True:
-                    # Ожидаем сообщения от клиента (например, keepalive)
-                    try:
-                        data = await asyncio.wait_for(websocket.receive_text(), timeout=30.0)
-                        message_data = json.loads(data)
-                        
-                        if message_data.get("type") == "ping":
-                            await websocket.send_text(json.dumps({"type": "pong"}))
-                            
-                    except asyncio.TimeoutError:
-                        # Отправляем ping для поддержания соединения
-                        await websocket.send_text(json.dumps({"type": "ping"}))
+                    # Любой входящий кадр продлевает жизнь соединения; ping по простою шлет heartbeat
+                    data = await websocket.receive_text()
+                    manager.heartbeat.touch(websocket)
+                    message_data = json.loads(data)
+                    
+                    if message_data.get("type") == "ping":
+                        await manager.send_pong(websocket)
+                    
+                    elif message_data.get("type") == "resume":
+                        # Досылка событий, пропущенных за время обрыва
+                        if await rate_limiter.enforce(websocket, "resume", user.id):
+                            await manager.resume(websocket, message_data.get("session_id"), message_data.get("last_seq"))
                         
             except WebSocketDisconnect:
                 pass
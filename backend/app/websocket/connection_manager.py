@@ -1,14 +1,37 @@
-from typing import Dict, List, Set
-from fastapi import WebSocket
-import json
+from typing import Any, Awaitable, Callable, Dict, List, Set
+from fastapi import WebSocket, status
+import uuid
 import redis.asyncio as redis
 import asyncio
 import logging
 from app.core.config import settings
+from app.core.serialization import dumps, loads
+from app.websocket.frames import EncodedFrame
+from app.websocket.heartbeat import HeartbeatMonitor
+from app.websocket.outbox import ConnectionOutbox
+from app.websocket.replay import ReplayStore
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
+# Шаблоны Redis-каналов, на которые подписывается каждый узел
+REDIS_PATTERNS = ("channel:*", "user:*", "broadcast", "voice_*", "message_cache:*", "read_state:*")
+
+# Кадры heartbeat уровня приложения (Starlette WebSocket не умеет протокольный ping)
+PING_FRAME = EncodedFrame.encode({"type": "ping"})
+PONG_FRAME = EncodedFrame.encode({"type": "pong"})
+
+
+def _is_seq_map(last_seq: Any) -> bool:
+    """Номера от клиента: словарь 'поток' -> неотрицательное целое (None — номеров нет)"""
+    if last_seq is None:
+        return True
+    return isinstance(last_seq, dict) and all(
+        isinstance(stream, str) and isinstance(seq, int) and not isinstance(seq, bool) and seq >= 0
+        for stream, seq in last_seq.items()
+    )
+
+
 class ConnectionManager:
     def __init__(self):
         # Активные WebSocket соединения по user_id
@@ -17,15 +40,49 @@ class ConnectionManager:
         self.channel_connections: Dict[int, Dict[int, WebSocket]] = {}
         self.redis_client = None
         
+        # Идентификатор узла, чтобы не доставлять собственные сообщения повторно
+        self.node_id = settings.WS_NODE_ID or uuid.uuid4().hex
+        self.pubsub_task: asyncio.Task | None = None
+        # Обработчики межузловых сообщений других подсистем: префикс Redis-канала -> (ключ, данные)
+        self.redis_handlers: Dict[str, Callable[[str, Any], Awaitable[None]]] = {}
+        
         # Новые структуры для лучшего отслеживания
         self.connection_metadata: Dict[WebSocket, Dict] = {}
         self.user_channels: Dict[int, Set[int]] = {}  # user_id -> set of channel_ids
         
+        # Исходящие очереди соединений: медленный клиент не задерживает остальных
+        self.outboxes: Dict[WebSocket, ConnectionOutbox] = {}
+        
+        # Счетчики статистики, обновляемые в connect/disconnect (чтение за O(1))
+        self.total_connections = 0
+        self.connections_by_type: Dict[str, int] = {'voice': 0, 'notifications': 0, 'unknown': 0}
+        self.users_by_type: Dict[str, int] = {'voice': 0, 'notifications': 0, 'unknown': 0}
+        self.user_type_counts: Dict[int, Dict[str, int]] = {}  # user_id -> {type -> число соединений}
+        
+        # Единый heartbeat для чата, уведомлений и голоса вместо таймера на каждый сокет
+        self.heartbeat = HeartbeatMonitor(
+            send_ping=self._send_heartbeat_ping,
+            on_dead=self._evict_dead_connection,
+            idle_timeout=settings.WS_HEARTBEAT_IDLE,
+            deadline=settings.WS_HEARTBEAT_DEADLINE,
+            tick_interval=settings.WS_HEARTBEAT_TICK,
+            slots=settings.WS_HEARTBEAT_WHEEL_SLOTS
+        )
+        
+        # Номера событий по потокам и буферы для возобновления сессий после обрыва
+        self.replay = ReplayStore(
+            capacity=settings.WS_REPLAY_BUFFER_SIZE,
+            max_streams=settings.WS_REPLAY_MAX_STREAMS,
+            session_ttl=settings.WS_SESSION_TTL,
+            redis_mirror=settings.WS_REPLAY_REDIS_MIRROR
+        )
+        
     async def init_redis(self):
         """Инициализация Redis для pub/sub"""
         try:
-            self.redis_client = redis.from_url("redis://redis:6379")
+            self.redis_client = redis.from_url(settings.REDIS_URL)
             await self.redis_client.ping()
+            self.replay.attach_redis(self.redis_client, shared_sequence=settings.WS_CLUSTER_NODES > 1)
             logger.info("✅ Redis подключен успешно")
             print("✅ Redis connected successfully")
         except Exception as e:
@@ -33,7 +90,71 @@ class ConnectionManager:
             print(f"❌ Redis connection failed: {e}")
             self.redis_client = None
     
-    async def connect(self, websocket: WebSocket, user_id: int, channel_id: int = None):
+    @property
+    def cluster_enabled(self) -> bool:
+        """Рассылка через Redis нужна только при нескольких узлах"""
+        return settings.WS_CLUSTER_NODES > 1 and self.redis_client is not None
+    
+    async def start_pubsub(self):
+        """Запуск фонового подписчика Redis для межузловой рассылки"""
+        if not self.redis_client:
+            logger.warning("⚠️ Redis недоступен, межузловая рассылка отключена")
+            return
+        if self.pubsub_task is None:
+            self.pubsub_task = asyncio.create_task(self._pubsub_loop())
+    
+    async def stop_pubsub(self):
+        """Остановка фонового подписчика Redis"""
+        if self.pubsub_task is None:
+            return
+        self.pubsub_task.cancel()
+        try:
+            await self.pubsub_task
+        except asyncio.CancelledError:
+            pass
+        self.pubsub_task = None
+    
+    async def _pubsub_loop(self):
+        """Цикл чтения Redis pub/sub с переподключением при ошибках"""
+        while True:
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(*REDIS_PATTERNS)
+                logger.info(f"📡 Узел {self.node_id} подписан на Redis: {', '.join(REDIS_PATTERNS)}")
+                async for message in pubsub.listen():
+                    await self.handle_redis_message(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка подписчика Redis, переподключение: {e}")
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.reset()
+                except Exception:
+                    pass
+    
+    async def _publish(self, redis_channel: str, frame: EncodedFrame):
+        """Публикация сообщения для остальных узлов"""
+        # Готовый текст кадра вставляется в конверт без повторной сериализации
+        payload = f'{{"origin":{dumps(self.node_id)},"data":{frame.text}}}'
+        try:
+            await self.redis_client.publish(redis_channel, payload)
+            logger.debug(f"📡 Сообщение опубликовано в Redis канал {redis_channel}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка отправки в Redis: {e}")
+    
+    def register_redis_handler(self, prefix: str, handler: Callable[[str, Any], Awaitable[None]]):
+        """Маршрутизация Redis-каналов вида '<prefix>:<ключ>' в обработчик подсистемы"""
+        self.redis_handlers[prefix] = handler
+    
+    async def publish(self, redis_channel: str, message: dict | EncodedFrame, shared_state: bool = False):
+        """Публикация для остальных узлов: в кластере или для подсистемы с общим состоянием в Redis"""
+        # Участники комнаты из общего состояния могут быть на других процессах и при WS_CLUSTER_NODES=1
+        if self.cluster_enabled or (shared_state and self.redis_client is not None):
+            await self._publish(redis_channel, EncodedFrame.encode(message))
+    
+    async def connect(self, websocket: WebSocket, user_id: int, channel_id: int = None, session_id: str = None):
         """Подключение WebSocket с улучшенным отслеживанием"""
         await websocket.accept()
         
@@ -44,6 +165,14 @@ class ConnectionManager:
             'connected_at': asyncio.get_event_loop().time(),
             'type': 'voice' if channel_id else 'notifications'
         }
+        self._count_connection(user_id, self.connection_metadata[websocket]['type'], 1)
+        self.heartbeat.register(websocket)
+        self.outboxes[websocket] = ConnectionOutbox(
+            websocket,
+            self._evict_slow_connection,
+            max_size=settings.WS_SEND_QUEUE_SIZE,
+            send_timeout=settings.WS_SEND_TIMEOUT
+        )
         
         # Добавляем соединение для пользователя
         if user_id not in self.active_connections:
@@ -64,8 +193,17 @@ class ConnectionManager:
         logger.info(f"🔗 WebSocket подключен: user_id={user_id}, channel_id={channel_id}, "
                    f"тип={'голосовой' if channel_id else 'уведомления'}")
         
+        # Сообщаем клиенту сессию и текущие номера потоков для последующего возобновления
+        session_id = await self.replay.open_session(user_id, session_id)
+        self.connection_metadata[websocket]['session_id'] = session_id
+        self._enqueue(websocket, dumps({
+            "type": "session",
+            "session_id": session_id,
+            "streams": {stream: self.replay.current_seq(stream) for stream in self._streams_for(websocket)}
+        }))
+        
         # Логируем статистику
-        self._log_connection_stats()
+        self._log_connection_stats(user_id)
     
     async def disconnect(self, websocket: WebSocket, user_id: int = None, channel_id: int = None):
         """Отключение WebSocket с автоматическим определением параметров"""
@@ -92,9 +230,9 @@ class ConnectionManager:
                 del self.active_connections[user_id]
                 logger.debug(f"🔌 Удален пользователь {user_id} из активных соединений")
         
-        # Удаляем из канальных соединений
+        # Удаляем из канальных соединений (только если там это же соединение)
         if channel_id and channel_id in self.channel_connections:
-            if user_id in self.channel_connections[channel_id]:
+            if self.channel_connections[channel_id].get(user_id) is websocket:
                 del self.channel_connections[channel_id][user_id]
                 logger.debug(f"🔌 Удален пользователь {user_id} из канала {channel_id}")
             if not self.channel_connections[channel_id]:
@@ -109,151 +247,227 @@ class ConnectionManager:
                 
         # Удаляем метаданные
         if websocket in self.connection_metadata:
-            del self.connection_metadata[websocket]
+            removed = self.connection_metadata.pop(websocket)
+            self._count_connection(removed['user_id'], removed.get('type', 'unknown'), -1)
+            if removed.get('session_id'):
+                await self.replay.refresh_session(removed['session_id'], removed['user_id'])
+        
+        self.heartbeat.unregister(websocket)
+        
+        # Останавливаем писателя очереди
+        outbox = self.outboxes.pop(websocket, None)
+        if outbox:
+            outbox.close()
             
         # Логируем статистику
-        self._log_connection_stats()
+        self._log_connection_stats(user_id)
+    
+    def _streams_for(self, websocket: WebSocket) -> List[str]:
+        """Потоки событий, которые получает соединение"""
+        metadata = self.connection_metadata.get(websocket, {})
+        streams = [f"user:{metadata.get('user_id')}", "broadcast"]
+        if metadata.get('channel_id'):
+            streams.append(f"channel:{metadata['channel_id']}")
+        return streams
+    
+    async def resume(self, websocket: WebSocket, session_id: str, last_seq: Dict[str, int]):
+        """Досылка пропущенных событий по номерам, предъявленным клиентом"""
+        metadata = self.connection_metadata.get(websocket, {})
+        if not _is_seq_map(last_seq):
+            # Досылать не от чего: клиент перечитывает все свои потоки
+            self._enqueue(websocket, dumps({"type": "resync_required", "streams": self._streams_for(websocket)}))
+            return
+        if not session_id or await self.replay.session_owner(session_id) != metadata.get('user_id'):
+            self._enqueue(websocket, dumps({"type": "resync_required", "streams": list(last_seq or {})}))
+            return
+        
+        replay = []
+        resync = []
+        allowed = set(self._streams_for(websocket))
+        for stream, seq in (last_seq or {}).items():
+            if stream not in allowed:
+                continue
+            events = await self.replay.since(stream, seq)
+            if events is None:
+                resync.append(stream)
+            else:
+                replay.extend(events)
+        
+        # Слишком большой разрыв дешевле закрыть полной ресинхронизацией, чем переполнить очередь
+        if len(replay) > settings.WS_SEND_QUEUE_SIZE // 2:
+            resync = [stream for stream in (last_seq or {}) if stream in allowed]
+            replay = []
+        
+        for text in replay:
+            self._enqueue(websocket, text)
+        self._enqueue(websocket, dumps({"type": "resumed", "replayed": len(replay), "resync": resync}))
+        logger.info(f"🔁 Сессия {session_id} возобновлена: дослано {len(replay)}, ресинхронизация {resync}")
+    
+    def _count_connection(self, user_id: int, conn_type: str, delta: int):
+        """Инкрементальное обновление счетчиков статистики"""
+        self.total_connections += delta
+        self.connections_by_type[conn_type] = self.connections_by_type.get(conn_type, 0) + delta
+        
+        user_counts = self.user_type_counts.setdefault(user_id, {})
+        before = user_counts.get(conn_type, 0)
+        after = before + delta
+        if after > 0:
+            user_counts[conn_type] = after
+        else:
+            user_counts.pop(conn_type, None)
+            if not user_counts:
+                del self.user_type_counts[user_id]
+        
+        # Пользователь учитывается в типе, пока у него есть хотя бы одно соединение этого типа
+        if before == 0 and after > 0:
+            self.users_by_type[conn_type] = self.users_by_type.get(conn_type, 0) + 1
+        elif before > 0 and after <= 0:
+            self.users_by_type[conn_type] -= 1
+    
+    def _enqueue(self, websocket: WebSocket, message_str: str) -> bool:
+        """Постановка сообщения в исходящую очередь соединения"""
+        outbox = self.outboxes.get(websocket)
+        if outbox is None:
+            return False
+        return outbox.enqueue(message_str)
+    
+    async def _evict_slow_connection(self, websocket: WebSocket, reason: str):
+        """Закрытие соединения, которое не успевает принимать сообщения"""
+        metadata = self.connection_metadata.get(websocket, {})
+        logger.warning(f"🐢 Отключение медленного клиента user_id={metadata.get('user_id')}: {reason}")
+        await self._close_and_cleanup(websocket, status.WS_1008_POLICY_VIOLATION, "Slow consumer")
+    
+    async def _evict_dead_connection(self, websocket: WebSocket, reason: str):
+        """Закрытие соединения, не ответившего на heartbeat"""
+        metadata = self.connection_metadata.get(websocket, {})
+        logger.warning(f"💀 Отключение неактивного клиента user_id={metadata.get('user_id')}: {reason}")
+        await self._close_and_cleanup(websocket, status.WS_1001_GOING_AWAY, "Heartbeat timeout")
+    
+    async def _close_and_cleanup(self, websocket: WebSocket, code: int, reason: str):
+        """Закрытие сокета с ограничением по времени и очистка его состояния"""
+        try:
+            await asyncio.wait_for(websocket.close(code=code, reason=reason), timeout=settings.WS_SEND_TIMEOUT)
+        except Exception:
+            pass
+        await self._handle_broken_connection(websocket)
+    
+    async def _send_heartbeat_ping(self, websocket: WebSocket) -> bool:
+        """Отправка ping через исходящую очередь (или напрямую для сокетов вне менеджера)"""
+        if websocket in self.outboxes:
+            return self._enqueue(websocket, PING_FRAME.text)
+        await PING_FRAME.send(websocket)
+        return True
+    
+    async def send_pong(self, websocket: WebSocket):
+        """Ответ на ping клиента"""
+        if not self._enqueue(websocket, PONG_FRAME.text):
+            await PONG_FRAME.send(websocket)
     
     async def send_personal_message(self, message: str, websocket: WebSocket):
         """Отправка личного сообщения"""
-        try:
-            await websocket.send_text(message)
+        if self._enqueue(websocket, message):
             logger.debug(f"📤 Отправлено личное сообщение")
-        except Exception as e:
-            logger.error(f"❌ Ошибка отправки личного сообщения: {e}")
-            await self._handle_broken_connection(websocket)
+        else:
+            logger.warning("⚠️ Личное сообщение не поставлено в очередь")
     
-    async def send_to_channel(self, channel_id: int, message: dict):
+    async def send_to_channel(self, channel_id: int, message: dict | EncodedFrame, ephemeral: bool = False):
         """Отправка сообщения всем участникам канала"""
+        frame = EncodedFrame.encode(message)
+        # Эфемерные кадры (индикаторы) после обрыва уже неактуальны: без номера и вне буфера возобновления
+        if not ephemeral:
+            frame = await self.replay.stamp(f"channel:{channel_id}", frame)
+        await self._deliver_to_channel(channel_id, frame)
+        if self.cluster_enabled:
+            await self._publish(f"channel:{channel_id}", frame)
+    
+    async def _deliver_to_channel(self, channel_id: int, message: dict | EncodedFrame):
+        """Доставка сообщения локальным участникам канала"""
         if channel_id not in self.channel_connections:
             logger.debug(f"📤 Канал {channel_id} не найден для отправки сообщения")
             return
             
-        message_str = json.dumps(message)
-        disconnected = []
-        sent_count = 0
-        
-        for user_id, websocket in self.channel_connections[channel_id].items():
-            try:
-                await websocket.send_text(message_str)
-                sent_count += 1
-                logger.debug(f"📤 Сообщение отправлено пользователю {user_id} в канале {channel_id}")
-            except Exception as e:
-                logger.warning(f"⚠️ Ошибка отправки сообщения пользователю {user_id}: {e}")
-                disconnected.append(user_id)
-        
-        # Удаляем отключенные соединения
-        for user_id in disconnected:
-            if user_id in self.channel_connections[channel_id]:
-                broken_ws = self.channel_connections[channel_id][user_id]
-                del self.channel_connections[channel_id][user_id]
-                await self._handle_broken_connection(broken_ws)
+        frame = EncodedFrame.encode(message)
+        recipients = list(self.channel_connections[channel_id].values())
+        sent_count = sum(1 for websocket in recipients if self._enqueue(websocket, frame.text))
                 
-        logger.info(f"📤 Сообщение отправлено {sent_count} пользователям в канале {channel_id}, "
-                   f"отключено: {len(disconnected)}")
+        logger.info(f"📤 Сообщение поставлено в очередь {sent_count} пользователям в канале {channel_id}, "
+                   f"отклонено: {len(recipients) - sent_count}")
     
-    async def send_to_user(self, user_id: int, message: dict):
+    async def send_to_user(self, user_id: int, message: dict | EncodedFrame):
         """Отправка сообщения конкретному пользователю"""
+        frame = await self.replay.stamp(f"user:{user_id}", EncodedFrame.encode(message))
+        await self._deliver_to_user(user_id, frame)
+        if self.cluster_enabled:
+            await self._publish(f"user:{user_id}", frame)
+    
+    async def _deliver_to_user(self, user_id: int, message: dict | EncodedFrame):
+        """Доставка сообщения локальным соединениям пользователя"""
         if user_id not in self.active_connections:
             logger.debug(f"📤 Пользователь {user_id} не найден для отправки сообщения")
             return
             
-        message_str = json.dumps(message)
-        disconnected = []
-        sent_count = 0
-        
-        for websocket in self.active_connections[user_id]:
-            try:
-                await websocket.send_text(message_str)
-                sent_count += 1
-                logger.debug(f"📤 Сообщение отправлено пользователю {user_id}")
-            except Exception as e:
-                logger.warning(f"⚠️ Ошибка отправки сообщения пользователю {user_id}: {e}")
-                disconnected.append(websocket)
-        
-        # Удаляем отключенные соединения
-        for websocket in disconnected:
-            if websocket in self.active_connections[user_id]:
-                self.active_connections[user_id].remove(websocket)
-                await self._handle_broken_connection(websocket)
+        frame = EncodedFrame.encode(message)
+        recipients = list(self.active_connections[user_id])
+        sent_count = sum(1 for websocket in recipients if self._enqueue(websocket, frame.text))
                 
-        logger.info(f"📤 Сообщение отправлено пользователю {user_id} ({sent_count} соединений), "
-                   f"отключено: {len(disconnected)}")
+        logger.info(f"📤 Сообщение поставлено в очередь пользователю {user_id} ({sent_count} соединений), "
+                   f"отклонено: {len(recipients) - sent_count}")
     
-    async def broadcast_to_all(self, message: dict):
+    async def broadcast_to_all(self, message: dict | EncodedFrame):
         """Отправка сообщения всем подключенным пользователям"""
-        message_str = json.dumps(message)
-        disconnected_users = []
-        total_sent = 0
-        total_disconnected = 0
-        
-        for user_id, connections in self.active_connections.items():
-            disconnected_connections = []
-            user_sent = 0
-            
-            for websocket in connections:
-                try:
-                    await websocket.send_text(message_str)
-                    user_sent += 1
-                    total_sent += 1
-                except Exception as e:
-                    logger.warning(f"⚠️ Ошибка отправки broadcast сообщения пользователю {user_id}: {e}")
-                    disconnected_connections.append(websocket)
-                    total_disconnected += 1
-            
-            # Удаляем отключенные соединения
-            for websocket in disconnected_connections:
-                connections.remove(websocket)
-                await self._handle_broken_connection(websocket)
-            
-            # Если у пользователя не осталось соединений, помечаем для удаления
-            if not connections:
-                disconnected_users.append(user_id)
-        
-        # Удаляем пользователей без соединений
-        for user_id in disconnected_users:
-            del self.active_connections[user_id]
-            if user_id in self.user_channels:
-                del self.user_channels[user_id]
-                
-        logger.info(f"📡 Broadcast сообщение отправлено {total_sent} соединениям, "
-                   f"отключено: {total_disconnected}, удалено пользователей: {len(disconnected_users)}")
+        frame = await self.replay.stamp("broadcast", EncodedFrame.encode(message))
+        await self._deliver_to_all(frame)
+        if self.cluster_enabled:
+            await self._publish("broadcast", frame)
     
-    async def broadcast_to_text_channel(self, text_channel_id: int, message: dict):
-        """Рассылка сообщения в текстовый канал"""
-        if self.redis_client:
-            try:
-                await self.redis_client.publish(
-                    f"text_channel:{text_channel_id}",
-                    json.dumps(message)
-                )
-                logger.debug(f"📡 Сообщение отправлено в Redis канал text_channel:{text_channel_id}")
-            except Exception as e:
-                logger.error(f"❌ Ошибка отправки в Redis: {e}")
-        else:
-            logger.warning("⚠️ Redis недоступен для отправки в текстовый канал")
+    async def _deliver_to_all(self, message: dict | EncodedFrame):
+        """Доставка сообщения всем локальным соединениям"""
+        frame = EncodedFrame.encode(message)
+        recipients = list(self.outboxes.values())
+        total_sent = sum(1 for outbox in recipients if outbox.enqueue(frame.text))
+                
+        logger.info(f"📡 Broadcast сообщение поставлено в очередь {total_sent} соединениям, "
+                   f"отклонено: {len(recipients) - total_sent}")
     
     async def handle_redis_message(self, message):
         """Обработка сообщений из Redis"""
-        if message["type"] == "message":
-            try:
-                channel = message["channel"].decode()
-                data = json.loads(message["data"])
+        if message["type"] not in ("message", "pmessage"):
+            return
+        try:
+            channel = message["channel"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            envelope = loads(message["data"])
+            
+            # Собственные публикации уже доставлены локально
+            if isinstance(envelope, dict) and "origin" in envelope and "data" in envelope:
+                if envelope["origin"] == self.node_id:
+                    return
+                data = envelope["data"]
+            else:
+                data = envelope
+            
+            prefix, _, key = channel.partition(":")
+            if prefix in self.redis_handlers:
+                await self.redis_handlers[prefix](key, data)
+                return
+            
+            # Кадр уже пронумерован узлом-источником — сохраняем его для возобновления сессий
+            frame = EncodedFrame.encode(data)
+            if isinstance(data, dict) and "stream" in data and "seq" in data:
+                self.replay.record(data["stream"], data["seq"], frame.text)
+            
+            # Маршрутизация по названию Redis-канала
+            if prefix == "channel":
+                await self._deliver_to_channel(int(key), frame)
+            elif prefix == "user":
+                await self._deliver_to_user(int(key), frame)
+            elif channel == "broadcast":
+                await self._deliver_to_all(frame)
                 
-                # Извлечение channel_id из названия канала
-                if channel.startswith("channel:"):
-                    channel_id = int(channel.split(":")[1])
-                    # Рассылка локальным подключениям
-                    if channel_id in self.channel_connections:
-                        for user_id, connection in self.channel_connections[channel_id].items():
-                            try:
-                                await connection.send_json(data)
-                            except Exception as e:
-                                logger.warning(f"⚠️ Ошибка отправки Redis сообщения пользователю {user_id}: {e}")
-                                
-                logger.debug(f"📨 Обработано Redis сообщение для канала {channel}")
-            except Exception as e:
-                logger.error(f"❌ Ошибка обработки Redis сообщения: {e}")
+            logger.debug(f"📨 Обработано Redis сообщение для канала {channel}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработки Redis сообщения: {e}")
                 
     async def _handle_broken_connection(self, websocket: WebSocket):
         """Обработка сломанного соединения"""
@@ -271,79 +485,33 @@ class ConnectionManager:
             if websocket in self.connection_metadata:
                 del self.connection_metadata[websocket]
                 
-    def _log_connection_stats(self):
+    def _log_connection_stats(self, user_id: int = None):
         """Логирование статистики соединений"""
-        total_connections = sum(len(connections) for connections in self.active_connections.values())
-        total_channels = len(self.channel_connections)
-        total_users = len(self.active_connections)
-        
-        logger.info(f"📊 Статистика соединений: пользователей={total_users}, "
-                   f"соединений={total_connections}, каналов={total_channels}")
+        logger.info(f"📊 Статистика соединений: пользователей={len(self.active_connections)}, "
+                   f"соединений={self.total_connections}, каналов={len(self.channel_connections)}")
         
-        # Детальная статистика для отладки
-        if logger.isEnabledFor(logging.DEBUG):
-            for user_id, connections in self.active_connections.items():
-                connection_types = []
-                for ws in connections:
-                    metadata = self.connection_metadata.get(ws, {})
-                    connection_types.append(metadata.get('type', 'unknown'))
-                logger.debug(f"📊 Пользователь {user_id}: {len(connections)} соединений {connection_types}")
+        # Детальная статистика для отладки (только по затронутому пользователю)
+        if user_id is not None and logger.isEnabledFor(logging.DEBUG):
+            connection_types = self.user_type_counts.get(user_id, {})
+            logger.debug(f"📊 Пользователь {user_id}: {sum(connection_types.values())} соединений {connection_types}")
     
     def get_connection_stats(self) -> dict:
         """Получение статистики соединений для API"""
-        total_connections = sum(len(connections) for connections in self.active_connections.values())
-        
-        users_by_type = {'voice': 0, 'notifications': 0, 'unknown': 0}
-        connections_by_type = {'voice': 0, 'notifications': 0, 'unknown': 0}
-        
-        for user_id, connections in self.active_connections.items():
-            user_types = set()
-            for ws in connections:
-                metadata = self.connection_metadata.get(ws, {})
-                conn_type = metadata.get('type', 'unknown')
-                connections_by_type[conn_type] += 1
-                user_types.add(conn_type)
-            
-            # Пользователь может иметь соединения разных типов
-            for user_type in user_types:
-                users_by_type[user_type] += 1
-        
         return {
             'total_users': len(self.active_connections),
-            'total_connections': total_connections,
+            'total_connections': self.total_connections,
             'active_channels': len(self.channel_connections),
-            'users_by_type': users_by_type,
-            'connections_by_type': connections_by_type,
-            'redis_connected': self.redis_client is not None
+            'users_by_type': dict(self.users_by_type),
+            'connections_by_type': dict(self.connections_by_type),
+            'redis_connected': self.redis_client is not None,
+            'heartbeat': self.heartbeat.get_stats(),
+            'replay': self.replay.get_stats()
         }
     
     async def cleanup_stale_connections(self):
-        """Очистка устаревших соединений"""
-        logger.info("🧹 Начинаем очистку устаревших соединений")
-        
-        current_time = asyncio.get_event_loop().time()
-        stale_threshold = 300  # 5 минут
-        
-        stale_connections = []
-        
-        # Находим устаревшие соединения
-        for websocket, metadata in self.connection_metadata.items():
-            connected_at = metadata.get('connected_at', current_time)
-            if current_time - connected_at > stale_threshold:
-                # Проверяем, активно ли соединение
-                try:
-                    await websocket.ping()
-                except Exception:
-                    stale_connections.append(websocket)
-        
-        # Удаляем устаревшие соединения
-        for websocket in stale_connections:
-            await self._handle_broken_connection(websocket)
-            
-        if stale_connections:
-            logger.info(f"🧹 Удалено {len(stale_connections)} устаревших соединений")
-        else:
-            logger.debug("🧹 Устаревших соединений не найдено")
+        """Внеочередная проверка простаивающих соединений через heartbeat"""
+        logger.info("🧹 Начинаем проверку простаивающих соединений")
+        await self.heartbeat.sweep()
 
 # Глобальный экземпляр менеджера
 manager = ConnectionManager()
\ No newline at end of file
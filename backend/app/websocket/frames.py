@@ -0,0 +1,22 @@
+from fastapi import WebSocket
+from app.core.serialization import dumps
+
+
+class EncodedFrame:
+    """Событие, сериализованное один раз и отправляемое многим получателям без повторного json.dumps"""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        self.text = text
+
+    @classmethod
+    def encode(cls, message: "dict | EncodedFrame") -> "EncodedFrame":
+        """Кодирование словаря; уже закодированный кадр возвращается как есть"""
+        if isinstance(message, EncodedFrame):
+            return message
+        return cls(dumps(message))
+
+    async def send(self, websocket: WebSocket):
+        """Отправка готового текста кадра"""
+        await websocket.send_text(self.text)
@@ -0,0 +1,188 @@
+from typing import Awaitable, Callable, Dict, Hashable, List
+from fastapi import WebSocket
+import asyncio
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TimingWheel:
+    """Хешированное колесо таймеров: O(1) на постановку/отмену, один тик обслуживает все таймеры"""
+
+    def __init__(self, tick_interval: float, slots: int):
+        self.tick_interval = tick_interval
+        self.slots = slots
+        self.position = 0
+        # В каждой ячейке: ключ -> сколько полных оборотов колеса осталось
+        self.buckets: List[Dict[Hashable, int]] = [{} for _ in range(slots)]
+        self._slot_of: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def schedule(self, key: Hashable, delay: float):
+        """Постановка (или перепостановка) таймера через delay секунд"""
+        self.cancel(key)
+        ticks = max(1, math.ceil(delay / self.tick_interval))
+        slot = (self.position + ticks) % self.slots
+        self.buckets[slot][key] = (ticks - 1) // self.slots
+        self._slot_of[key] = slot
+
+    def cancel(self, key: Hashable):
+        """Отмена таймера"""
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            self.buckets[slot].pop(key, None)
+
+    def advance(self) -> List[Hashable]:
+        """Сдвиг колеса на один тик; возвращает сработавшие ключи"""
+        self.position = (self.position + 1) % self.slots
+        bucket = self.buckets[self.position]
+        expired = []
+        for key, rounds in list(bucket.items()):
+            if rounds == 0:
+                expired.append(key)
+                del bucket[key]
+                del self._slot_of[key]
+            else:
+                bucket[key] = rounds - 1
+        return expired
+
+
+class HeartbeatMonitor:
+    """Централизованный heartbeat для всех WebSocket: ping только простаивающим, вытеснение мертвых"""
+
+    def __init__(
+        self,
+        send_ping: Callable[[WebSocket], Awaitable[bool]],
+        on_dead: Callable[[WebSocket, str], Awaitable[None]],
+        idle_timeout: float,
+        deadline: float,
+        tick_interval: float,
+        slots: int
+    ):
+        self.wheel = TimingWheel(tick_interval, slots)
+        self.idle_timeout = idle_timeout
+        self.deadline = deadline
+        self.last_seen: Dict[WebSocket, float] = {}
+        self.awaiting_pong: Dict[WebSocket, float] = {}
+        self.evicted_total = 0
+        self._send_ping = send_ping
+        self._on_dead = on_dead
+        self._task: asyncio.Task | None = None
+
+    def register(self, websocket: WebSocket):
+        """Начало отслеживания соединения"""
+        self.last_seen[websocket] = time.monotonic()
+        self.wheel.schedule(websocket, self.idle_timeout)
+
+    def unregister(self, websocket: WebSocket):
+        """Прекращение отслеживания соединения"""
+        self.last_seen.pop(websocket, None)
+        self.awaiting_pong.pop(websocket, None)
+        self.wheel.cancel(websocket)
+
+    def touch(self, websocket: WebSocket):
+        """Отметка входящего трафика; таймер не переставляется, проверка ленивая"""
+        if websocket in self.last_seen:
+            self.last_seen[websocket] = time.monotonic()
+            self.awaiting_pong.pop(websocket, None)
+
+    def start(self):
+        """Запуск фонового тикера"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"💓 Heartbeat запущен: простой {self.idle_timeout} с, дедлайн ответа {self.deadline} с")
+
+    async def stop(self):
+        """Остановка фонового тикера"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.wheel.tick_interval)
+            try:
+                expired = self.wheel.advance()
+                if expired:
+                    await self._check(expired)
+            except Exception as e:
+                logger.error(f"❌ Ошибка heartbeat: {e}")
+
+    async def sweep(self):
+        """Внеочередная проверка всех простаивающих соединений"""
+        now = time.monotonic()
+        idle = [ws for ws, seen in self.last_seen.items() if now - seen >= self.idle_timeout]
+        for websocket in idle:
+            self.wheel.cancel(websocket)
+        await self._check(idle, force=True)
+
+    async def _check(self, expired: List[WebSocket], force: bool = False):
+        """Пакетная проверка соединений, чьи таймеры сработали"""
+        now = time.monotonic()
+        to_ping = []
+        dead = []
+
+        for websocket in expired:
+            last_seen = self.last_seen.get(websocket)
+            if last_seen is None:
+                continue
+            if websocket in self.awaiting_pong:
+                # Ping отправлен, но входящего трафика за дедлайн не было
+                if not force or now - self.awaiting_pong[websocket] >= self.deadline:
+                    dead.append(websocket)
+                else:
+                    self.wheel.schedule(websocket, self.deadline - (now - self.awaiting_pong[websocket]))
+                continue
+            idle = now - last_seen
+            if idle < self.idle_timeout:
+                # Соединение было активно — просто переносим проверку
+                self.wheel.schedule(websocket, self.idle_timeout - idle)
+                continue
+            to_ping.append(websocket)
+
+        # Ping простаивающим соединениям одновременно
+        if to_ping:
+            results = await asyncio.gather(
+                *(asyncio.wait_for(self._send_ping(ws), timeout=self.deadline) for ws in to_ping),
+                return_exceptions=True
+            )
+            for websocket, result in zip(to_ping, results):
+                if websocket not in self.last_seen:
+                    continue
+                if result is True:
+                    self.awaiting_pong[websocket] = now
+                    self.wheel.schedule(websocket, self.deadline)
+                else:
+                    dead.append(websocket)
+
+        # Закрытие мертвых сокетов одновременно: каждое может ждать таймаута TCP
+        for websocket in dead:
+            self.unregister(websocket)
+            self.evicted_total += 1
+        results = await asyncio.gather(
+            *(self._on_dead(ws, "нет ответа на heartbeat") for ws in dead),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"❌ Ошибка вытеснения мертвого соединения: {result}")
+
+        if dead:
+            logger.info(f"💓 Heartbeat: ping {len(to_ping)}, вытеснено {len(dead)} мертвых соединений")
+
+    def get_stats(self) -> dict:
+        """Статистика heartbeat для API"""
+        return {
+            'tracked_connections': len(self.last_seen),
+            'awaiting_pong': len(self.awaiting_pong),
+            'evicted_total': self.evicted_total
+        }
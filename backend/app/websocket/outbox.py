@@ -0,0 +1,62 @@
+from typing import Awaitable, Callable
+from fastapi import WebSocket
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionOutbox:
+    """Ограниченная очередь исходящих сообщений одного WebSocket с собственной задачей-писателем"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        on_failure: Callable[[WebSocket, str], Awaitable[None]],
+        max_size: int,
+        send_timeout: float
+    ):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.closed = False
+        self._on_failure = on_failure
+        self._send_timeout = send_timeout
+        self._failure_task: asyncio.Task | None = None
+        self._writer_task = asyncio.create_task(self._writer())
+
+    def enqueue(self, message: str) -> bool:
+        """Неблокирующая постановка сообщения в очередь"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            self._fail(f"очередь переполнена ({self.queue.maxsize} сообщений)")
+            return False
+
+    async def _writer(self):
+        """Последовательная отправка сообщений из очереди с ограничением по времени"""
+        try:
+            while True:
+                message = await self.queue.get()
+                await asyncio.wait_for(self.websocket.send_text(message), timeout=self._send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self._fail(f"отправка дольше {self._send_timeout} с")
+        except Exception as e:
+            self._fail(f"ошибка отправки: {e}")
+
+    def _fail(self, reason: str):
+        """Однократный вызов обработчика сбоя соединения"""
+        if self.closed:
+            return
+        self.closed = True
+        self._failure_task = asyncio.create_task(self._on_failure(self.websocket, reason))
+
+    def close(self):
+        """Остановка писателя и сброс неотправленных сообщений"""
+        self.closed = True
+        if self._writer_task is not asyncio.current_task():
+            self._writer_task.cancel()
@@ -0,0 +1,229 @@
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import time
+import uuid
+from app.core.serialization import loads
+from app.websocket.frames import EncodedFrame
+
+logger = logging.getLogger(__name__)
+
+# Номера для пакета кадров одним вызовом: по блоку подряд идущих номеров на поток
+# (KEYS — пары счетчик/зеркало) и, при зеркалировании, запись кадров в списки потоков.
+# ARGV: зеркалировать, емкость, TTL, затем для каждого потока число кадров и их пары префикс/суффикс
+_STAMP_SCRIPT = """
+local mirror = ARGV[1] == '1'
+local capacity = tonumber(ARGV[2])
+local arg = 4
+local result = {}
+for i = 1, #KEYS / 2 do
+    local count = tonumber(ARGV[arg])
+    arg = arg + 1
+    local last = redis.call('INCRBY', KEYS[i * 2 - 1], count)
+    if mirror then
+        for j = 0, count - 1 do
+            local seq = last - count + 1 + j
+            redis.call('RPUSH', KEYS[i * 2], ARGV[arg + j * 2] .. seq .. ARGV[arg + j * 2 + 1])
+        end
+        redis.call('LTRIM', KEYS[i * 2], -capacity, -1)
+        redis.call('EXPIRE', KEYS[i * 2], ARGV[3])
+        arg = arg + count * 2
+    end
+    result[i] = last
+end
+return result
+"""
+
+
+class ReplayBuffer:
+    """Кольцевой буфер последних кадров одного потока"""
+
+    def __init__(self, capacity: int):
+        self.events: Deque[Tuple[int, str]] = deque(maxlen=capacity)
+        self.last_seq = 0
+
+    def append(self, seq: int, text: str):
+        self.events.append((seq, text))
+        if seq > self.last_seq:
+            self.last_seq = seq
+
+    def since(self, last_seq: int) -> Optional[List[str]]:
+        """Кадры после last_seq; None, если часть пропущенных уже вытеснена"""
+        if last_seq > self.last_seq:
+            # Клиент видел номера новее буфера — счетчик был сброшен (рестарт без Redis)
+            return None
+        if last_seq == self.last_seq:
+            return []
+        if not self.events or self.events[0][0] > last_seq + 1:
+            return None
+        return [text for seq, text in self.events if seq > last_seq]
+
+
+class ReplayStore:
+    """Порядковые номера событий по потокам (channel:{id}, user:{id}, broadcast) и буферы для возобновления сессий"""
+
+    def __init__(self, capacity: int, max_streams: int, session_ttl: int, redis_mirror: bool):
+        self.capacity = capacity
+        self.max_streams = max_streams
+        self.session_ttl = session_ttl
+        self.redis_mirror = redis_mirror
+        self.buffers: "OrderedDict[str, ReplayBuffer]" = OrderedDict()
+        self.sessions: Dict[str, Tuple[int, float]] = {}  # session_id -> (user_id, истекает)
+        self.redis_client = None
+        self.shared_sequence = False
+        self._stamp_script = None
+        # Кадры, ждущие общего номера: поток -> [(префикс, суффикс, future)]
+        self._pending_stamps: Dict[str, List[Tuple[str, str, asyncio.Future]]] = {}
+        self._stamp_task: Optional[asyncio.Task] = None
+        self.stamped_total = 0
+        self.stamp_round_trips = 0
+
+    def attach_redis(self, redis_client, shared_sequence: bool):
+        """Общие номера через Redis нужны при нескольких узлах или зеркалировании буферов"""
+        self.redis_client = redis_client
+        self.shared_sequence = shared_sequence or self.redis_mirror
+        if redis_client is not None and self.shared_sequence:
+            self._stamp_script = redis_client.register_script(_STAMP_SCRIPT)
+
+    def _buffer(self, stream: str) -> ReplayBuffer:
+        """Буфер потока с вытеснением давно неиспользуемых потоков"""
+        buffer = self.buffers.get(stream)
+        if buffer is None:
+            buffer = self.buffers[stream] = ReplayBuffer(self.capacity)
+            if len(self.buffers) > self.max_streams:
+                self.buffers.popitem(last=False)
+        else:
+            self.buffers.move_to_end(stream)
+        return buffer
+
+    async def stamp(self, stream: str, frame: EncodedFrame) -> EncodedFrame:
+        """Присвоение кадру следующего номера потока и запись в буфер"""
+        prefix = f'{{"stream":"{stream}","seq":'
+        body = frame.text[1:].lstrip()
+        # У пустого объекта нет полей — запятая после номера дала бы невалидный JSON
+        suffix = body if body == "}" else "," + body
+        self.stamped_total += 1
+
+        seq = None
+        if self._stamp_script is not None:
+            seq = await self._shared_seq(stream, prefix, suffix)
+        buffer = self._buffer(stream)
+        if seq is None:
+            seq = buffer.last_seq + 1
+
+        stamped = EncodedFrame(f"{prefix}{seq}{suffix}")
+        buffer.append(seq, stamped.text)
+        return stamped
+
+    async def _shared_seq(self, stream: str, prefix: str, suffix: str) -> Optional[int]:
+        """Номер из общего счетчика; None — Redis недоступен"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending_stamps.setdefault(stream, []).append((prefix, suffix, future))
+        if self._stamp_task is None:
+            self._stamp_task = asyncio.create_task(self._flush_stamps())
+        return await future
+
+    async def _flush_stamps(self):
+        """Кадры, накопившиеся за время предыдущего вызова, получают номера следующим одним вызовом"""
+        pending: Dict[str, List[Tuple[str, str, asyncio.Future]]] = {}
+        try:
+            while self._pending_stamps:
+                pending, self._pending_stamps = self._pending_stamps, {}
+                keys, args = [], ["1" if self.redis_mirror else "0", self.capacity, self.session_ttl]
+                for stream, entries in pending.items():
+                    keys += [f"ws_seq:{stream}", f"ws_replay:{stream}"]
+                    args.append(len(entries))
+                    if self.redis_mirror:
+                        for prefix, suffix, _ in entries:
+                            args += [prefix, suffix]
+                try:
+                    self.stamp_round_trips += 1
+                    lasts = await self._stamp_script(keys=keys, args=args)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка получения номеров из Redis для {len(pending)} потоков: {e}")
+                    lasts = [None] * len(pending)
+                for entries, last in zip(pending.values(), lasts):
+                    for i, (_, _, future) in enumerate(entries):
+                        if not future.done():
+                            future.set_result(None if last is None else int(last) - len(entries) + 1 + i)
+        finally:
+            self._stamp_task = None
+            # Остановка посреди вызова: ожидающие нумеруются локально, а не висят
+            for entries in (*pending.values(), *self._pending_stamps.values()):
+                for _, _, future in entries:
+                    if not future.done():
+                        future.set_result(None)
+            self._pending_stamps = {}
+
+    def record(self, stream: str, seq: int, text: str):
+        """Запись кадра, пронумерованного другим узлом"""
+        self._buffer(stream).append(seq, text)
+
+    async def since(self, stream: str, last_seq: int) -> Optional[List[str]]:
+        """Пропущенные кадры потока; None — нужна полная ресинхронизация"""
+        buffer = self.buffers.get(stream)
+        if buffer is None and last_seq == 0 and not self.redis_mirror:
+            return []
+        events = buffer.since(last_seq) if buffer else None
+        if events is not None or not (self.redis_mirror and self.redis_client):
+            return events
+
+        # Локального буфера нет (например, после рестарта) — читаем зеркало в Redis
+        try:
+            mirrored = await self.redis_client.lrange(f"ws_replay:{stream}", 0, -1)
+        except Exception as e:
+            logger.error(f"❌ Ошибка чтения буфера {stream} из Redis: {e}")
+            return None
+        restored = ReplayBuffer(self.capacity)
+        for raw in mirrored:
+            text = raw.decode() if isinstance(raw, bytes) else raw
+            restored.append(loads(text)["seq"], text)
+        self.buffers[stream] = restored
+        return restored.since(last_seq)
+
+    def current_seq(self, stream: str) -> int:
+        buffer = self.buffers.get(stream)
+        return buffer.last_seq if buffer else 0
+
+    async def open_session(self, user_id: int, session_id: str = None) -> str:
+        """Выдача (или продление) идентификатора сессии пользователя"""
+        if not session_id or await self.session_owner(session_id) != user_id:
+            session_id = uuid.uuid4().hex
+        if len(self.sessions) > self.max_streams:
+            now = time.monotonic()
+            self.sessions = {sid: entry for sid, entry in self.sessions.items() if entry[1] > now}
+        self.sessions[session_id] = (user_id, time.monotonic() + self.session_ttl)
+        if self.redis_mirror and self.redis_client:
+            try:
+                await self.redis_client.set(f"ws_session:{session_id}", user_id, ex=self.session_ttl)
+            except Exception as e:
+                logger.error(f"❌ Ошибка сохранения сессии в Redis: {e}")
+        return session_id
+
+    async def refresh_session(self, session_id: str, user_id: int):
+        """Продление сессии при отключении: TTL отсчитывается от обрыва"""
+        await self.open_session(user_id, session_id)
+
+    async def session_owner(self, session_id: str) -> Optional[int]:
+        """Пользователь, которому выдана сессия (None — неизвестна или истекла)"""
+        entry = self.sessions.get(session_id)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        self.sessions.pop(session_id, None)
+        if self.redis_mirror and self.redis_client:
+            try:
+                owner = await self.redis_client.get(f"ws_session:{session_id}")
+                return int(owner) if owner is not None else None
+            except Exception as e:
+                logger.error(f"❌ Ошибка чтения сессии из Redis: {e}")
+        return None
+
+    def get_stats(self) -> dict:
+        return {
+            'streams': len(self.buffers),
+            'sessions': len(self.sessions),
+            'redis_mirror': self.redis_mirror,
+            'stamped': self.stamped_total,
+            'stamp_round_trips': self.stamp_round_trips
+        }
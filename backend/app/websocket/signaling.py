@@ -0,0 +1,139 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from fastapi import WebSocket
+import asyncio
+import re
+from app.websocket.frames import EncodedFrame
+
+# Возможности протокола, которые клиент включает сообщением hello
+ICE_BATCHING = "ice_batching"
+SUPPORTED_FEATURES = (ICE_BATCHING,)
+
+# Поле полезной нагрузки для каждого типа сигнального сообщения
+SIGNAL_FIELDS = {"offer": "offer", "answer": "answer", "ice_candidate": "candidate"}
+
+# Конверт в начале кадра в том виде, в каком его пишет клиент: {"type":...,"target_id":...,"<поле>":
+_ENVELOPE = re.compile(
+    r'\{\s*"type"\s*:\s*"(offer|answer|ice_candidate)"\s*,'
+    r'\s*"target_id"\s*:\s*(\d{1,18})\s*,'
+    r'\s*"(offer|answer|candidate)"\s*:'
+)
+
+# Полезная нагрузка без скобок и кавычек: null (конец кандидатов), true/false или число
+_LITERAL = re.compile(r'null|true|false|-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?')
+_CLOSERS = {"{": "}", "[": "]", '"': '"'}
+
+
+def is_enclosed_value(payload: str) -> bool:
+    """Проверка только границ: значение закрывается тем же, чем открылось, или это литерал.
+
+    Полный проход по SDP стоит столько же, сколько orjson.loads, поэтому середина не проверяется:
+    подменить from_id и type не выйдет и с битым JSON внутри — relay_frame пишет их последними.
+    """
+    closer = _CLOSERS.get(payload[:1])
+    if closer is None:
+        return _LITERAL.fullmatch(payload) is not None
+    return len(payload) > 1 and payload[-1] == closer
+
+
+def split_signal(text: str) -> Optional[Tuple[str, int, str]]:
+    """Тип, получатель и нетронутый JSON полезной нагрузки; None — кадр разбирается целиком"""
+    match = _ENVELOPE.match(text)
+    if match is None:
+        return None
+    signal_type, target_id, field = match.groups()
+    if SIGNAL_FIELDS[signal_type] != field:
+        return None
+    if not text.endswith("}"):
+        text = text.rstrip()
+        if not text.endswith("}"):
+            return None
+    payload = text[match.end():-1]
+    # Обрезанный кадр или лишние ключи после скаляра — через полный разбор, как и на других узлах;
+    # хвост после объекта уходит получателю как есть, служебные ключи он не подменит
+    if not is_enclosed_value(payload):
+        return None
+    return signal_type, int(target_id), payload
+
+
+def relay_frame(signal_type: str, from_id: int, payload: str) -> EncodedFrame:
+    """Кадр получателю без повторной сериализации SDP/кандидата"""
+    # Служебные ключи последними: JSON.parse берет последнее из повторяющихся, payload их не подменит.
+    # Незакрытая в payload строка или скобка поглотит их и сделает кадр невалидным, а не чужим
+    return EncodedFrame(f'{{"{SIGNAL_FIELDS[signal_type]}":{payload},"from_id":{from_id},"type":"{signal_type}"}}')
+
+
+def is_end_of_candidates(payload: str) -> bool:
+    """Пустой кандидат (или null) — сторона закончила сбор, ждать остальных незачем"""
+    return payload == "null" or '"candidate":""' in payload
+
+
+def batch_frame(from_id: int, payloads: List[str]) -> EncodedFrame:
+    return EncodedFrame(f'{{"candidates":[{",".join(payloads)}],"from_id":{from_id},"type":"ice_candidates"}}')
+
+
+async def _send_direct(websocket: WebSocket, frame: EncodedFrame):
+    try:
+        await frame.send(websocket)
+    except Exception:
+        pass
+
+
+class IceCandidateBatcher:
+    """Кандидаты одного участника другому за короткое окно уходят одним кадром ice_candidates"""
+
+    def __init__(
+        self,
+        window: float,
+        max_batch: int,
+        send: Optional[Callable[[WebSocket, EncodedFrame], Awaitable[None]]] = None
+    ):
+        self.window = window
+        self.max_batch = max_batch
+        self._send = send or _send_direct
+        self._pending: Dict[Tuple[WebSocket, int], List[str]] = {}  # (сокет получателя, from_id) -> кандидаты
+        self._timers: Dict[Tuple[WebSocket, int], asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.candidates_total = 0
+        self.frames_total = 0
+
+    async def add(self, websocket: WebSocket, from_id: int, payload: str):
+        key = (websocket, from_id)
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = []
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._flush_later, key)
+        batch.append(payload)
+        self.candidates_total += 1
+        if len(batch) >= self.max_batch or is_end_of_candidates(payload):
+            await self.flush(websocket, from_id)
+
+    def _flush_later(self, key: Tuple[WebSocket, int]):
+        task = asyncio.create_task(self.flush(*key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self, websocket: WebSocket, from_id: int):
+        """Отправка накопленного; вызывается и перед offer/answer того же отправителя, чтобы не нарушить порядок"""
+        key = (websocket, from_id)
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        if not batch:
+            return
+        self.frames_total += 1
+        frame = relay_frame("ice_candidate", from_id, batch[0]) if len(batch) == 1 else batch_frame(from_id, batch)
+        await self._send(websocket, frame)
+
+    def discard(self, websocket: WebSocket):
+        """Сокет закрыт — накопленное для него выбрасывается"""
+        for key in [key for key in self._pending if key[0] is websocket]:
+            del self._pending[key]
+            self._timers.pop(key).cancel()
+
+    def get_stats(self) -> dict:
+        return {
+            "candidates": self.candidates_total,
+            "frames": self.frames_total,
+            "pending": len(self._pending)
+        }
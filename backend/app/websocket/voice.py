@@ -1,17 +1,71 @@
 from fastapi import WebSocket, WebSocketDisconnect, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, delete
-import json
 import asyncio
-from typing import Dict
+import functools
+import logging
+import uuid
 from app.db.database import get_db, AsyncSessionLocal
 from app.models import User, VoiceChannel, VoiceChannelUser, ChannelMember
 from app.core.security import decode_access_token
 from app.websocket.connection_manager import manager
 from app.core.config import settings
+from app.core.serialization import dumps, loads
+from app.services.rate_limit import rate_limiter
+from app.services.voice_state import voice_states, public_participant
+from app.services.sfu import sfu, MODE_SFU, SFU_PEER_ID
+from app.services.indicators import indicators
+from app.websocket.signaling import split_signal
 
-# Хранилище WebRTC соединений
-voice_connections: Dict[int, Dict[int, dict]] = {}  # voice_channel_id -> {user_id -> connection_info}
+logger = logging.getLogger(__name__)
+
+# Тип входящего кадра -> политика ограничения частоты
+VOICE_RATE_EVENTS = {
+    "offer": "signaling",
+    "answer": "signaling",
+    "ice_candidate": "signaling",
+    "screen_share_start": "screen_share",
+    "screen_share_stop": "screen_share",
+    "audio_mix": "audio_mix"
+}
+# Переключатели состояния: сверх лимита не отбрасываются, применяется последнее значение
+VOICE_STATE_EVENTS = {
+    "mute": "mute",
+    "deafen": "deafen",
+    "speaking": "speaking"
+}
+
+async def broadcast_to_voice_channel(channel_id: int, message: dict, exclude_user_id: int = None):
+    """Рассылка события участникам голосового канала на всех узлах (сериализация один раз)"""
+    await voice_states.broadcast(channel_id, message, exclude_user_id)
+
+async def route_signal(channel_id: int, target_id: int, from_id: int, signal_type: str, payload: str):
+    """Сигнал серверу (режим SFU) или другому участнику"""
+    if target_id == SFU_PEER_ID:
+        await sfu.handle_signal(channel_id, from_id, signal_type, payload)
+    elif target_id:
+        await voice_states.relay_signal(channel_id, target_id, from_id, signal_type, payload)
+
+async def apply_voice_state(channel_id: int, user: User, connection_id: str, data: dict):
+    """mute/deafen/speaking участника: общее состояние и уведомление комнаты"""
+    if data["type"] == "mute":
+        is_muted = data.get("is_muted", False)
+        # Состояние меняется сразу, запись в БД — пакетом в фоне
+        if await voice_states.set_flags(channel_id, user.id, connection_id, is_muted=is_muted):
+            await broadcast_to_voice_channel(
+                channel_id, {"type": "user_muted", "user_id": user.id, "is_muted": is_muted}, exclude_user_id=user.id
+            )
+    
+    elif data["type"] == "deafen":
+        is_deafened = data.get("is_deafened", False)
+        if await voice_states.set_flags(channel_id, user.id, connection_id, is_deafened=is_deafened):
+            await broadcast_to_voice_channel(
+                channel_id, {"type": "user_deafened", "user_id": user.id, "is_deafened": is_deafened}, exclude_user_id=user.id
+            )
+    
+    elif data["type"] == "speaking":
+        # Дребезг VAD схлопывается: участники получают один кадр speaking_update за такт
+        indicators.set_speaking(channel_id, user.id, bool(data.get("is_speaking", False)))
 
 async def get_current_user_voice(
     websocket: WebSocket,
@@ -65,55 +119,58 @@ async def websocket_voice_endpoint(
         
         # Убираем проверку членства - все пользователи могут заходить в любые каналы
         
-        # Проверка лимита пользователей
-        active_users_count = await db.execute(
-            select(VoiceChannelUser).where(
-                VoiceChannelUser.voice_channel_id == channel_id
-            )
-        )
-        if len(active_users_count.scalars().all()) >= voice_channel.max_users:
+        # Место занимается до accept(): одновременные входы не превышают лимит
+        connection_id = uuid.uuid4().hex
+        if not await voice_states.reserve(channel_id, connection_id, voice_channel.max_users):
+            # Код закрытия доходит до клиента только после accept()
+            await websocket.accept()
             await websocket.close(code=4005, reason="Voice channel is full")
             return
         
-        await websocket.accept()
-        
-        # Добавление в голосовой канал в БД
-        voice_user = VoiceChannelUser(
-            voice_channel_id=channel_id,
-            user_id=user.id
-        )
-        db.add(voice_user)
-        await db.commit()
-        
-        # Инициализация хранилища для канала
-        if channel_id not in voice_connections:
-            voice_connections[channel_id] = {}
-        
-        voice_connections[channel_id][user.id] = {
-            "websocket": websocket,
-            "user_id": user.id,
-            "username": user.username,
-            "is_muted": False,
-            "is_deafened": False
-        }
-        
         try:
+            await websocket.accept()
+            manager.heartbeat.register(websocket)
+            
+            # Добавление в голосовой канал в БД
+            voice_user = VoiceChannelUser(
+                voice_channel_id=channel_id,
+                user_id=user.id
+            )
+            db.add(voice_user)
+            await db.commit()
+            
+            # Регистрация в общем состоянии комнаты (видно всем узлам)
+            voice_states.add_local(channel_id, user.id, websocket)
+            await voice_states.join(channel_id, {
+                "user_id": user.id,
+                "username": user.username,
+                "connection_id": connection_id,
+                "is_muted": False,
+                "is_deafened": False,
+                "is_screen_sharing": False
+            })
+            
             # Отправка списка участников новому пользователю
-            participants = []
-            for uid, conn_info in voice_connections[channel_id].items():
-                if uid != user.id:
-                    participants.append({
-                        "user_id": uid,
-                        "username": conn_info["username"],
-                        "is_muted": conn_info["is_muted"],
-                        "is_deafened": conn_info["is_deafened"]
-                    })
+            participants = [
+                public_participant(participant)
+                for uid, participant in (await voice_states.participants(channel_id)).items()
+                if uid != user.id
+            ]
+            
+            # Большая комната переходит на SFU: одно соединение с сервером вместо соединения с каждым
+            media_mode = await sfu.admit(
+                channel_id, user.id, len(participants) + 1, voice_states.local.get(channel_id, {})
+            )
             
-            await websocket.send_json({
+            await websocket.send_text(dumps({
                 "type": "participants",
                 "participants": participants,
-                "ice_servers": settings.ICE_SERVERS
-            })
+                "ice_servers": settings.ICE_SERVERS,
+                "features": voice_states.supported_features(),
+                "media_mode": media_mode
+            }))
+            if media_mode == MODE_SFU:
+                sfu.connect(channel_id, user.id, websocket)
             
             # Уведомление других участников о новом пользователе
             join_message = {
@@ -122,12 +179,7 @@ async def websocket_voice_endpoint(
                 "username": user.username
             }
             
-            for uid, conn_info in voice_connections[channel_id].items():
-                if uid != user.id:
-                    try:
-                        await conn_info["websocket"].send_json(join_message)
-                    except:
-                        pass
+            await broadcast_to_voice_channel(channel_id, join_message, exclude_user_id=user.id)
             
             # Глобальное уведомление всем онлайн пользователям
             global_join_message = {
@@ -141,123 +193,58 @@ async def websocket_voice_endpoint(
             
             # Обработка сообщений WebRTC
             while True:
-                data = await websocket.receive_json()
+                text = await websocket.receive_text()
+                manager.heartbeat.touch(websocket)
+                
+                # offer/answer/ice_candidate: читается только конверт, SDP пересылается как есть
+                signal = split_signal(text)
+                if signal is not None:
+                    signal_type, target_id, payload = signal
+                    if await rate_limiter.enforce(websocket, "signaling", user.id, channel_id):
+                        await route_signal(channel_id, target_id, user.id, signal_type, payload)
+                    continue
+                
+                data = loads(text)
+                state_event = VOICE_STATE_EVENTS.get(data["type"])
+                if state_event:
+                    await rate_limiter.enforce_latest(
+                        websocket, state_event, user.id, channel_id,
+                        functools.partial(apply_voice_state, channel_id, user, connection_id, data)
+                    )
+                    continue
                 
-                if data["type"] == "offer":
+                rate_event = VOICE_RATE_EVENTS.get(data["type"])
+                if rate_event and not await rate_limiter.enforce(websocket, rate_event, user.id, channel_id):
+                    continue
+                
+                if data["type"] == "ping":
+                    await manager.send_pong(websocket)
+                
+                elif data["type"] == "pong":
+                    pass
+                
+                elif data["type"] == "hello":
+                    # Согласование возможностей протокола (например, пакетная доставка ICE-кандидатов)
+                    enabled = voice_states.negotiate(websocket, data.get("features") or [])
+                    await websocket.send_text(dumps({"type": "hello", "features": enabled}))
+                
+                elif data["type"] == "offer":
                     # Пересылка offer целевому пользователю
-                    target_id = data.get("target_id")
-                    if target_id and target_id in voice_connections[channel_id]:
-                        await voice_connections[channel_id][target_id]["websocket"].send_json({
-                            "type": "offer",
-                            "from_id": user.id,
-                            "offer": data["offer"]
-                        })
+                    await route_signal(channel_id, data.get("target_id"), user.id, "offer", dumps(data["offer"]))
                 
                 elif data["type"] == "answer":
                     # Пересылка answer целевому пользователю
-                    target_id = data.get("target_id")
-                    if target_id and target_id in voice_connections[channel_id]:
-                        await voice_connections[channel_id][target_id]["websocket"].send_json({
-                            "type": "answer",
-                            "from_id": user.id,
-                            "answer": data["answer"]
-                        })
+                    await route_signal(channel_id, data.get("target_id"), user.id, "answer", dumps(data["answer"]))
                 
                 elif data["type"] == "ice_candidate":
                     # Пересылка ICE candidate целевому пользователю
-                    target_id = data.get("target_id")
-                    if target_id and target_id in voice_connections[channel_id]:
-                        await voice_connections[channel_id][target_id]["websocket"].send_json({
-                            "type": "ice_candidate",
-                            "from_id": user.id,
-                            "candidate": data["candidate"]
-                        })
-                
-                elif data["type"] == "mute":
-                    # Обновление статуса mute
-                    is_muted = data.get("is_muted", False)
-                    voice_connections[channel_id][user.id]["is_muted"] = is_muted
-                    
-                    # Обновление в БД
-                    voice_user_result = await db.execute(
-                        select(VoiceChannelUser).where(
-                            and_(
-                                VoiceChannelUser.voice_channel_id == channel_id,
-                                VoiceChannelUser.user_id == user.id
-                            )
-                        )
-                    )
-                    voice_user_db = voice_user_result.scalar_one_or_none()
-                    if voice_user_db:
-                        voice_user_db.is_muted = is_muted
-                        await db.commit()
-                    
-                    # Уведомление других участников
-                    mute_message = {
-                        "type": "user_muted",
-                        "user_id": user.id,
-                        "is_muted": is_muted
-                    }
-                    
-                    for uid, conn_info in voice_connections[channel_id].items():
-                        if uid != user.id:
-                            try:
-                                await conn_info["websocket"].send_json(mute_message)
-                            except:
-                                pass
-                
-                elif data["type"] == "deafen":
-                    # Обновление статуса deafen
-                    is_deafened = data.get("is_deafened", False)
-                    voice_connections[channel_id][user.id]["is_deafened"] = is_deafened
-                    
-                    # Обновление в БД
-                    voice_user_result = await db.execute(
-                        select(VoiceChannelUser).where(
-                            and_(
-                                VoiceChannelUser.voice_channel_id == channel_id,
-                                VoiceChannelUser.user_id == user.id
-                            )
-                        )
-                    )
-                    voice_user_db = voice_user_result.scalar_one_or_none()
-                    if voice_user_db:
-                        voice_user_db.is_deafened = is_deafened
-                        await db.commit()
-                    
-                    # Уведомление других участников
-                    deafen_message = {
-                        "type": "user_deafened",
-                        "user_id": user.id,
-                        "is_deafened": is_deafened
-                    }
-                    
-                    for uid, conn_info in voice_connections[channel_id].items():
-                        if uid != user.id:
-                            try:
-                                await conn_info["websocket"].send_json(deafen_message)
-                            except:
-                                pass
-                
-                elif data["type"] == "speaking":
-                    # Обработка информации о голосовой активности
-                    is_speaking = data.get("is_speaking", False)
-                    
-                    # Уведомление других участников о голосовой активности
-                    speaking_message = {
-                        "type": "user_speaking",
-                        "user_id": user.id,
-                        "is_speaking": is_speaking
-                    }
-                    
-                    for uid, conn_info in voice_connections[channel_id].items():
-                        if uid != user.id:
-                            try:
-                                await conn_info["websocket"].send_json(speaking_message)
-                            except:
-                                pass
+                    await route_signal(channel_id, data.get("target_id"), user.id, "ice_candidate", dumps(data["candidate"]))
                 
                 elif data["type"] == "screen_share_start":
+                    await voice_states.update(channel_id, user.id, connection_id, is_screen_sharing=True)
+                    # В режиме SFU клиент включает отправку экрана в ответе на новый offer
+                    sfu.renegotiate(channel_id, user.id)
+                    
                     # Уведомляем всех участников канала о начале демонстрации экрана
                     screen_share_message = {
                         "type": "screen_share_started",
@@ -265,16 +252,14 @@ async def websocket_voice_endpoint(
                         "username": user.username
                     }
                     
-                    for uid, conn_info in voice_connections[channel_id].items():
-                        if uid != user.id:
-                            try:
-                                await conn_info["websocket"].send_json(screen_share_message)
-                            except:
-                                pass
+                    await broadcast_to_voice_channel(channel_id, screen_share_message, exclude_user_id=user.id)
                     
-                    print(f"Пользователь {user.username} начал демонстрацию экрана")
+                    logger.info(f"🖥️ Пользователь {user.username} начал демонстрацию экрана")
                 
                 elif data["type"] == "screen_share_stop":
+                    await voice_states.update(channel_id, user.id, connection_id, is_screen_sharing=False)
+                    sfu.renegotiate(channel_id, user.id)
+                    
                     # Уведомляем всех участников канала об остановке демонстрации экрана
                     screen_share_message = {
                         "type": "screen_share_stopped",
@@ -282,18 +267,20 @@ async def websocket_voice_endpoint(
                         "username": user.username
                     }
                     
-                    for uid, conn_info in voice_connections[channel_id].items():
-                        if uid != user.id:
-                            try:
-                                await conn_info["websocket"].send_json(screen_share_message)
-                            except:
-                                pass
+                    await broadcast_to_voice_channel(channel_id, screen_share_message, exclude_user_id=user.id)
                     
-                    print(f"Пользователь {user.username} остановил демонстрацию экрана")
+                    logger.info(f"🖥️ Пользователь {user.username} остановил демонстрацию экрана")
+                
+                elif data["type"] == "audio_mix":
+                    # Слабый канал: вместо трека на каждого участника — один микс с сервера
+                    await sfu.set_mixing(
+                        channel_id, user.id, websocket, bool(data.get("enabled")),
+                        voice_states.local.get(channel_id, {})
+                    )
                 
                 else:
-                    print(f"Неизвестный тип сообщения: {data['type']}")
-                    await websocket.send_text(json.dumps({
+                    logger.warning(f"⚠️ Неизвестный тип голосового сообщения: {data['type']}")
+                    await websocket.send_text(dumps({
                         "type": "error",
                         "message": f"Неизвестный тип сообщения: {data['type']}"
                     }))
@@ -301,45 +288,50 @@ async def websocket_voice_endpoint(
         except WebSocketDisconnect:
             pass
         except Exception as e:
-            print(f"Voice WebSocket error: {e}")
+            logger.error(f"❌ Ошибка голосового WebSocket: {e}")
         finally:
-            # Удаление из голосового канала
-            if channel_id in voice_connections and user.id in voice_connections[channel_id]:
-                del voice_connections[channel_id][user.id]
-                
-                # Если канал пуст, удаляем его
-                if not voice_connections[channel_id]:
-                    del voice_connections[channel_id]
+            manager.heartbeat.unregister(websocket)
+            rate_limiter.discard_deferred(websocket)
             
-            # Удаление из БД
-            await db.execute(
-                delete(VoiceChannelUser).where(
-                    and_(
-                        VoiceChannelUser.voice_channel_id == channel_id,
-                        VoiceChannelUser.user_id == user.id
+            # Удаление из голосового канала
+            voice_states.remove_local(channel_id, user.id, websocket)
+            if user.id not in voice_states.local.get(channel_id, {}):
+                indicators.forget_speaking(channel_id, user.id)
+            await sfu.disconnect(channel_id, user.id, websocket)
+            await voice_states.release(channel_id, connection_id)
+            try:
+                left = await voice_states.leave(channel_id, user.id, connection_id)
+            except Exception as e:
+                # Запись останется до сверки: узел продолжает продлевать свою отметку
+                logger.error(f"❌ Ошибка выхода из голосовой комнаты: {e}")
+                left = True
+            # False — пользователь уже переподключился к этой комнате (новое подключение не трогаем)
+            # или запись убрала сверка, которая сама разослала уход
+            if left:
+                # Удаление из БД
+                await db.execute(
+                    delete(VoiceChannelUser).where(
+                        and_(
+                            VoiceChannelUser.voice_channel_id == channel_id,
+                            VoiceChannelUser.user_id == user.id
+                        )
                     )
                 )
-            )
-            await db.commit()
-            
-            # Уведомление других участников об уходе
-            leave_message = {
-                "type": "user_left_voice",
-                "user_id": user.id
-            }
-            
-            if channel_id in voice_connections:
-                for uid, conn_info in voice_connections[channel_id].items():
-                    try:
-                        await conn_info["websocket"].send_json(leave_message)
-                    except:
-                        pass
-            
-            # Глобальное уведомление всем онлайн пользователям
-            global_leave_message = {
-                "type": "voice_channel_leave",
-                "user_id": user.id,
-                "username": user.username,
-                "voice_channel_id": channel_id
-            }
-            await manager.broadcast_to_all(global_leave_message)
\ No newline at end of file
+                await db.commit()
+                
+                # Уведомление других участников об уходе
+                leave_message = {
+                    "type": "user_left_voice",
+                    "user_id": user.id
+                }
+                
+                await broadcast_to_voice_channel(channel_id, leave_message)
+                
+                # Глобальное уведомление всем онлайн пользователям
+                global_leave_message = {
+                    "type": "voice_channel_leave",
+                    "user_id": user.id,
+                    "username": user.username,
+                    "voice_channel_id": channel_id
+                }
+                await manager.broadcast_to_all(global_leave_message)
\ No newline at end of file
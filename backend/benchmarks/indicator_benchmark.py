@@ -0,0 +1,86 @@
+"""Бенчмарк индикаторов «говорит»/«печатает»: сколько кадров получают клиенты при немедленной
+пересылке каждого события и при склейке изменений в один кадр на канал за такт.
+
+Моделируется голосовая комната, где у каждого участника дребезжит VAD (переключения speaking
+с заданной частотой), и сервер, где часть участников печатает и повторяет typing раз в пару секунд.
+Время модельное: движок получает события и такты без ожидания.
+
+Запуск из каталога backend:
+    python -m benchmarks.indicator_benchmark --sizes 5 10 25 50 --flaps 10 --seconds 60
+"""
+import argparse
+import math
+import random
+from app.core.config import settings
+from app.services.indicators import IndicatorEngine
+
+TYPING_REPEAT = 2.0  # секунды между typing печатающего клиента
+TYPING_BURST = 6.0  # секунды печати перед отправкой сообщения или паузой
+
+
+def simulate(size: int, flaps: float, seconds: float, tick: float, typers: int, rng: random.Random) -> dict:
+    now = 0.0
+    engine = IndicatorEngine(tick, settings.TYPING_TTL, clock=lambda: now)
+    speaking = [False] * size
+    typing_until = [rng.uniform(0, TYPING_BURST * 2) for _ in range(typers)]
+    last_typing = [-TYPING_REPEAT] * typers
+    speaking_events = typing_events = 0
+    deliveries = {"speaking": 0, "typing": 0}
+
+    for _ in range(int(seconds / tick)):
+        # События внутри такта: переключения VAD и повторы typing
+        for user_id in range(size):
+            for _ in range(_poisson(rng, flaps * tick)):
+                speaking[user_id] = not speaking[user_id]
+                engine.set_speaking(1, user_id, speaking[user_id])
+                speaking_events += 1
+        for user_id in range(typers):
+            if now < typing_until[user_id] and now - last_typing[user_id] >= TYPING_REPEAT:
+                engine.set_typing(1, 10, user_id, f"user{user_id}")
+                last_typing[user_id] = now
+                typing_events += 1
+            elif now >= typing_until[user_id] + TYPING_BURST:
+                typing_until[user_id] = now + rng.uniform(1, TYPING_BURST)
+        now += tick
+        for kind, _, _ in engine.collect(now):
+            deliveries[kind] += size
+
+    return {
+        "speaking_immediate": speaking_events * (size - 1) / seconds,
+        "speaking_ticks": deliveries["speaking"] / seconds,
+        "typing_immediate": typing_events * size / seconds,
+        "typing_ticks": deliveries["typing"] / seconds
+    }
+
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    """Число событий за такт при средней частоте mean (алгоритм Кнута)"""
+    limit, count, product = math.exp(-mean), 0, rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 10, 25, 50], help="Участников в комнате")
+    parser.add_argument("--flaps", type=float, default=10.0, help="Переключений VAD в секунду на участника")
+    parser.add_argument("--typers", type=int, default=3, help="Печатающих участников")
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--tick", type=float, default=settings.INDICATOR_TICK_INTERVAL)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"Такт {args.tick * 1000:.0f} мс; кадров клиентам в секунду")
+    print(f"{'комната':>8} {'speaking сразу':>15} {'по тактам':>10} {'typing сразу':>13} {'по тактам':>10}")
+    for size in args.sizes:
+        result = simulate(size, args.flaps, args.seconds, args.tick, min(args.typers, size), rng)
+        print(f"{size:>8} {result['speaking_immediate']:>15.0f} {result['speaking_ticks']:>10.0f} "
+              f"{result['typing_immediate']:>13.1f} {result['typing_ticks']:>10.1f}")
+    print(f"Раньше индикатор печати не гас вовсе; теперь гаснет через TYPING_TTL={settings.TYPING_TTL:.0f} с "
+          f"после последнего typing (или сразу после отправки сообщения)")
+
+
+if __name__ == "__main__":
+    main()
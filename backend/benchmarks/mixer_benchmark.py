@@ -0,0 +1,94 @@
+"""Бенчмарк серверного сведения звука: стоимость одного такта (20 мс) в зависимости от размера комнаты.
+
+Каждый участник комнаты слушает микс. Сравнивается векторизованное сведение (сумма активных голосов
+одним умножением матрицы, вычитание своего голоса и обрезка — для всех слушателей сразу) с циклом
+по слушателям, где каждый микс собирается отдельно. Отдельно замеряется кодирование миксов в Opus —
+его отправители aiortc выполняют сами, по потоку на слушателя. Доля — от бюджета такта на одно ядро.
+
+Запуск из каталога backend:
+    python -m benchmarks.mixer_benchmark --sizes 2 5 10 15 25 50 --speakers 4 --ticks 500
+"""
+import argparse
+import fractions
+import time
+import numpy as np
+from av import AudioFrame
+from aiortc.codecs.opus import OpusEncoder
+from app.core.config import settings
+from app.services.audio_mixer import FRAME_LENGTH, FRAME_SAMPLES, FRAME_TIME, SAMPLE_RATE, mix_frames
+
+
+def build_frames(size: int, talking: int, rng: np.random.Generator) -> np.ndarray:
+    """Кадры комнаты: talking участников говорят (шум речевой громкости), остальные почти молчат"""
+    frames = rng.normal(0, 30, (size, FRAME_LENGTH))
+    frames[:talking] = rng.normal(0, 6000, (talking, FRAME_LENGTH))
+    return np.clip(frames, -32768, 32767).astype(np.int16)
+
+
+def mix_per_listener(frames: np.ndarray, listeners: np.ndarray, max_speakers: int) -> np.ndarray:
+    """Цикл по слушателям: выбор голосов и сумма для каждого заново"""
+    result = []
+    for own in listeners:
+        pcm = frames.astype(np.float32)
+        energy = (pcm * pcm).mean(axis=1)
+        loudest = np.argsort(energy)[::-1][:max_speakers] if max_speakers > 0 else np.arange(len(pcm))
+        mix = np.zeros(FRAME_LENGTH, dtype=np.float32)
+        for i in loudest:
+            if i != own and energy[i] > 100.0 ** 2:
+                mix += pcm[i]
+        result.append(np.clip(mix, -32768, 32767).astype(np.int16))
+    return np.stack(result)
+
+
+def measure(mix, frames: np.ndarray, listeners: np.ndarray, speakers: int, ticks: int) -> float:
+    """Микросекунды на такт"""
+    started = time.perf_counter()
+    for _ in range(ticks):
+        mix(frames, listeners, speakers)
+    return (time.perf_counter() - started) / ticks * 1e6
+
+
+def measure_encode(mixes: np.ndarray, ticks: int) -> float:
+    """Микросекунды на такт: по кадру Opus каждому слушателю, у каждого свой кодер"""
+    encoders = [OpusEncoder() for _ in mixes]
+    frames = []
+    for pcm in mixes:
+        frame = AudioFrame(format="s16", layout="stereo", samples=FRAME_SAMPLES)
+        frame.planes[0].update(pcm.tobytes())
+        frame.pts = 0
+        frame.sample_rate = SAMPLE_RATE
+        frame.time_base = fractions.Fraction(1, SAMPLE_RATE)
+        frames.append(frame)
+    started = time.perf_counter()
+    for _ in range(ticks):
+        for encoder, frame in zip(encoders, frames):
+            encoder.encode(frame)
+    return (time.perf_counter() - started) / ticks * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2, 5, 10, 15, 25, 50], help="Размеры комнат")
+    parser.add_argument("--speakers", type=int, default=settings.VOICE_MIX_MAX_SPEAKERS, help="Голосов в миксе")
+    parser.add_argument("--talking", type=int, default=3, help="Сколько участников говорят одновременно")
+    parser.add_argument("--ticks", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    budget = FRAME_TIME * 1e6
+    print(f"{'комната':>8} {'сведение, мкс':>14} {'по слушателям':>14} {'Opus, мкс':>10} {'доля такта':>11}")
+    for size in args.sizes:
+        frames = build_frames(size, min(args.talking, size), rng)
+        listeners = np.arange(size, dtype=np.intp)
+        mixes = mix_frames(frames, listeners, args.speakers)
+        # Слушатель должен услышать то же самое, что и при сборке микса по отдельности
+        assert np.array_equal(mixes, mix_per_listener(frames, listeners, args.speakers))
+        vectorized = measure(mix_frames, frames, listeners, args.speakers, args.ticks)
+        naive = measure(mix_per_listener, frames, listeners, args.speakers, max(args.ticks // 10, 1))
+        encode = measure_encode(mixes, max(args.ticks // 10, 1))
+        share = (vectorized + encode) / budget * 100
+        print(f"{size:>8} {vectorized:>14.0f} {naive:>14.0f} {encode:>10.0f} {share:>10.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Бенчмарк полнотекстового поиска по синтетическому корпусу сообщений.
+
+Запуск из каталога backend (нужна БД из DATABASE_URL после alembic upgrade head):
+    python -m benchmarks.search_benchmark --rows 3000000 --queries 200
+    python -m benchmarks.search_benchmark --cleanup
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from sqlalchemy import text
+from app.db.database import engine
+from app.core.snowflake import EPOCH_MS, TIMESTAMP_SHIFT
+
+BENCH_USER = "search_benchmark_user"
+
+RU_WORDS = [
+    "привет", "сервер", "голосовой", "канал", "сообщение", "обновление", "игра", "вечером",
+    "завтра", "ссылка", "проект", "релиз", "ошибка", "исправили", "музыка", "стрим", "друзья",
+    "встреча", "документация", "база", "данных", "поиск", "работает", "быстро", "медленно",
+]
+EN_WORDS = [
+    "hello", "server", "voice", "channel", "message", "update", "game", "tonight", "tomorrow",
+    "link", "project", "release", "bug", "fixed", "music", "stream", "friends", "meeting",
+    "docs", "database", "search", "works", "fast", "slow", "deploy",
+]
+
+
+async def seed(rows: int) -> int:
+    """Создание тестового сервера и rows сообщений одним INSERT ... SELECT"""
+    async with engine.begin() as conn:
+        user_id = (await conn.execute(text("""
+            INSERT INTO users (username, email, hashed_password, is_active, is_online)
+            VALUES (:name, :email, '-', true, false)
+            ON CONFLICT (username) DO UPDATE SET username = EXCLUDED.username
+            RETURNING id
+        """), {"name": BENCH_USER, "email": f"{BENCH_USER}@example.invalid"})).scalar_one()
+        channel_id = (await conn.execute(text(
+            "INSERT INTO channels (name, owner_id) VALUES ('search benchmark', :uid) RETURNING id"
+        ), {"uid": user_id})).scalar_one()
+        await conn.execute(text(
+            "INSERT INTO channel_members (channel_id, user_id) VALUES (:cid, :uid)"
+        ), {"cid": channel_id, "uid": user_id})
+        text_channel_ids = [
+            (await conn.execute(text(
+                "INSERT INTO text_channels (name, channel_id, position) VALUES (:name, :cid, :pos) RETURNING id"
+            ), {"name": f"bench-{i}", "cid": channel_id, "pos": i})).scalar_one()
+            for i in range(4)
+        ]
+
+        # Текст из случайных русских и английских слов; id — snowflake, по одному на секунду истории
+        started = time.perf_counter()
+        await conn.execute(text("""
+            INSERT INTO messages (id, content, author_id, text_channel_id, created_at, is_edited)
+            SELECT
+                ((((extract(epoch FROM ts) * 1000)::bigint - :epoch) << :shift) | (g % 4096)),
+                (SELECT string_agg(w, ' ') FROM (
+                    SELECT (CASE WHEN random() < 0.5 THEN CAST(:ru AS text[]) ELSE CAST(:en AS text[]) END)[1 + floor(random() * 25)::int] AS w
+                    FROM generate_series(1, 6 + (g % 14))
+                ) words),
+                :uid,
+                (CAST(:text_channels AS int[]))[1 + (g % 4)],
+                ts,
+                0
+            FROM generate_series(1, CAST(:rows AS int)) AS g,
+                 LATERAL (SELECT now() - make_interval(secs => g) AS ts) t
+        """), {
+            "epoch": EPOCH_MS, "shift": TIMESTAMP_SHIFT, "ru": RU_WORDS, "en": EN_WORDS,
+            "uid": user_id, "text_channels": text_channel_ids, "rows": rows,
+        })
+        await conn.execute(text("ANALYZE messages"))
+        print(f"Вставлено {rows} строк за {time.perf_counter() - started:.1f} с (канал {channel_id})")
+        return channel_id
+
+
+async def run_queries(channel_id: int, queries: int):
+    """Замер поискового запроса в форме, которую выполняет /api/channels/{id}/search"""
+    timings = []
+    async with engine.connect() as conn:
+        for _ in range(queries):
+            words = random.sample(RU_WORDS, 1) + random.sample(EN_WORDS, 1)
+            q = " ".join(words)
+            started = time.perf_counter()
+            await conn.execute(text("""
+                WITH query AS (
+                    SELECT websearch_to_tsquery('russian', :q) || websearch_to_tsquery('english', :q) AS tsq
+                )
+                SELECT m.id, ts_rank_cd(m.search_vector, query.tsq)::real AS rank
+                FROM messages m
+                JOIN text_channels tc ON tc.id = m.text_channel_id, query
+                WHERE tc.channel_id = :cid AND m.search_vector @@ query.tsq
+                ORDER BY rank DESC, m.id DESC
+                LIMIT 25
+            """), {"q": q, "cid": channel_id})
+            timings.append((time.perf_counter() - started) * 1000)
+
+    timings.sort()
+    print(f"Запросов: {queries}")
+    print(f"p50: {statistics.median(timings):.1f} мс")
+    print(f"p95: {timings[int(len(timings) * 0.95) - 1]:.1f} мс")
+    print(f"max: {timings[-1]:.1f} мс")
+
+
+async def cleanup():
+    """Удаление синтетического корпуса"""
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            DELETE FROM messages WHERE author_id IN (SELECT id FROM users WHERE username = :name)
+        """), {"name": BENCH_USER})
+        await conn.execute(text("""
+            DELETE FROM text_channels WHERE channel_id IN (
+                SELECT c.id FROM channels c JOIN users u ON u.id = c.owner_id WHERE u.username = :name
+            )
+        """), {"name": BENCH_USER})
+        await conn.execute(text("""
+            DELETE FROM channel_members WHERE user_id IN (SELECT id FROM users WHERE username = :name)
+        """), {"name": BENCH_USER})
+        await conn.execute(text("""
+            DELETE FROM channels WHERE owner_id IN (SELECT id FROM users WHERE username = :name)
+        """), {"name": BENCH_USER})
+        await conn.execute(text("DELETE FROM users WHERE username = :name"), {"name": BENCH_USER})
+    print("Синтетический корпус удален")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--channel-id", type=int, help="Использовать уже засеянный сервер")
+    parser.add_argument("--cleanup", action="store_true")
+    args = parser.parse_args()
+
+    try:
+        if args.cleanup:
+            await cleanup()
+            return
+        channel_id = args.channel_id or await seed(args.rows)
+        await run_queries(channel_id, args.queries)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
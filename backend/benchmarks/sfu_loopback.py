@@ -0,0 +1,222 @@
+"""Проверка режима SFU на одной машине: клиенты — настоящие aiortc-пиры, сигналинг — напрямую в SfuManager.
+
+Для каждого размера комнаты участники входят по одному, комната переходит на SFU по порогу,
+затем первый участник включает демонстрацию экрана, второй переходит на серверный микс звука,
+а последний выходит. Проверяется, что каждый слышит всех остальных и видит экран, слушатель микса
+получает звук одним потоком, а исходящих потоков у клиента один при любом размере комнаты
+(в mesh их на одного меньше, чем участников). Все пиры и сервер делят один процесс и кодируют
+звук и экран сами: на одном ядре первый кадр экрана приходит через несколько секунд, а комнаты
+больше 6 человек упираются в процессор самой проверки.
+
+Запуск из каталога backend:
+    python -m benchmarks.sfu_loopback --sizes 3 4 6 --threshold 3 --seconds 5
+"""
+import argparse
+import array
+import asyncio
+import fractions
+import json
+import math
+from collections import defaultdict
+from av import AudioFrame
+from aiortc import RTCPeerConnection, RTCSessionDescription
+from aiortc.mediastreams import AudioStreamTrack, MediaStreamError, VideoStreamTrack
+from app.services.sfu import MODE_SFU, SFU_PEER_ID, SfuManager
+
+CHANNEL_ID = 1
+SAMPLE_RATE = 48000
+SAMPLES = 960  # 20 мс
+
+
+class ToneTrack(AudioStreamTrack):
+    """Микрофон участника: синус своей частоты, чтобы Opus кодировал не тишину"""
+
+    def __init__(self, frequency: float):
+        super().__init__()
+        self._pcm = array.array(
+            "h", (int(8000 * math.sin(2 * math.pi * frequency * i / SAMPLE_RATE)) for i in range(SAMPLES))
+        ).tobytes()
+        self._pts = 0
+        self._started = None
+
+    async def recv(self):
+        loop = asyncio.get_running_loop()
+        if self._started is None:
+            self._started = loop.time()
+        else:
+            self._pts += SAMPLES
+            await asyncio.sleep(self._started + self._pts / SAMPLE_RATE - loop.time())
+        frame = AudioFrame(format="s16", layout="mono", samples=SAMPLES)
+        frame.planes[0].update(self._pcm)
+        frame.pts = self._pts
+        frame.sample_rate = SAMPLE_RATE
+        frame.time_base = fractions.Fraction(1, SAMPLE_RATE)
+        return frame
+
+
+class LoopbackClient:
+    """Клиент так же, как браузер: отвечает на offer сервера и раскладывает входящие треки по mid"""
+
+    def __init__(self, sfu: SfuManager, user_id: int):
+        self.sfu = sfu
+        self.user_id = user_id
+        self.pc = RTCPeerConnection()
+        self.mic = ToneTrack(220 + 40 * user_id)
+        self.screen = None
+        self.uplink = {}
+        self.tracks = {}
+        self.frames = defaultdict(lambda: defaultdict(int))  # вид -> user_id -> кадров
+        self.mode = None
+        self._tasks = set()
+        self.pc.on("track", self._on_track)
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def send_text(self, text: str):
+        """Кадр сервера; ответ уходит отдельной задачей, как по сети"""
+        data = json.loads(text)
+        if data["type"] == "media_mode":
+            self.mode = data["mode"]
+        elif data["type"] == "sfu_tracks":
+            self.uplink = data["uplink"]
+            self.tracks = data["tracks"]
+        elif data["type"] == "offer":
+            self._spawn(self._answer(data["offer"]))
+
+    async def _answer(self, offer: dict):
+        await self.pc.setRemoteDescription(RTCSessionDescription(sdp=offer["sdp"], type=offer["type"]))
+        for transceiver in self.pc.getTransceivers():
+            if transceiver.mid == self.uplink.get("audio"):
+                transceiver.sender.replaceTrack(self.mic)
+                transceiver.direction = "sendonly"
+            elif transceiver.mid == self.uplink.get("video"):
+                transceiver.sender.replaceTrack(self.screen)
+                transceiver.direction = "sendonly" if self.screen else "inactive"
+        await self.pc.setLocalDescription(await self.pc.createAnswer())
+        answer = self.pc.localDescription
+        await self.sfu.handle_signal(
+            CHANNEL_ID, self.user_id, "answer", json.dumps({"type": answer.type, "sdp": answer.sdp})
+        )
+
+    def _on_track(self, track):
+        transceiver = next(t for t in self.pc.getTransceivers() if t.receiver.track is track)
+        self._spawn(self._consume(transceiver, track))
+
+    async def _consume(self, transceiver, track):
+        try:
+            while True:
+                await track.recv()
+                owner = self.tracks.get(transceiver.mid)
+                if owner is not None:
+                    self.frames[track.kind][owner] += 1
+        except MediaStreamError:
+            pass
+
+    def audio_owners(self) -> set:
+        """Чьи звуковые треки сейчас приходят (SFU_PEER_ID — микс сервера)"""
+        return {
+            self.tracks[transceiver.mid] for transceiver in self.pc.getTransceivers()
+            if transceiver.kind == "audio" and transceiver.mid in self.tracks
+        }
+
+    async def active_streams(self, stats_type: str) -> int:
+        """RTP-потоки клиента, по которым идут пакеты (outbound-rtp — исходящие, inbound-rtp — входящие)"""
+        report = await self.pc.getStats()
+        field = "packetsSent" if stats_type == "outbound-rtp" else "packetsReceived"
+        return sum(1 for stats in report.values() if stats.type == stats_type and getattr(stats, field) > 0)
+
+    async def close(self):
+        await self.pc.close()
+        for task in list(self._tasks):
+            task.cancel()
+
+
+async def wait_for(condition, timeout: float) -> bool:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        if loop.time() > deadline:
+            return False
+        await asyncio.sleep(0.2)
+    return True
+
+
+async def run_room(size: int, threshold: int, seconds: float) -> dict:
+    # Клиенты проверки — не сокеты голосовых комнат: кадры им отдаются без исходящих очередей
+    sfu = SfuManager(threshold, ice_servers=[], send=lambda client, frame: frame.send(client))
+    clients = {}
+    for user_id in range(1, size + 1):
+        client = clients[user_id] = LoopbackClient(sfu, user_id)
+        client.mode = await sfu.admit(CHANNEL_ID, user_id, len(clients), clients)
+        if client.mode == MODE_SFU:
+            sfu.connect(CHANNEL_ID, user_id, client)
+
+    heard_all = await wait_for(lambda: all(
+        set(client.frames["audio"]) == set(clients) - {user_id} for user_id, client in clients.items()
+    ), seconds)
+    uplink = [await client.active_streams("outbound-rtp") for client in clients.values()]
+    downlink = [await client.active_streams("inbound-rtp") for client in clients.values()]
+
+    # Демонстрация экрана первого участника: новая m-строка у остальных, у самого — включение отправки
+    clients[1].screen = VideoStreamTrack()
+    sfu.renegotiate(CHANNEL_ID, 1)
+    saw_screen = await wait_for(lambda: all(
+        client.frames["video"].get(1, 0) > 0 for user_id, client in clients.items() if user_id != 1
+    ), seconds * 3)
+
+    # Второй участник переходит на микс: одна m-строка звука от сервера вместо трека на каждого
+    listener = clients[2]
+    await sfu.set_mixing(CHANNEL_ID, 2, listener, True, clients)
+    mixed = await wait_for(
+        lambda: listener.frames["audio"].get(SFU_PEER_ID, 0) > 0 and listener.audio_owners() == {SFU_PEER_ID},
+        seconds
+    )
+
+    # Выход последнего участника: его m-строки у остальных освобождаются без пересогласования
+    leaving = clients.pop(size)
+    await sfu.disconnect(CHANNEL_ID, size, leaving)
+    await leaving.close()
+    released = all(size not in client.tracks.values() for client in clients.values())
+
+    stats = sfu.get_stats()
+    for client in clients.values():
+        await client.close()
+    await sfu.stop()
+    return {
+        "size": size,
+        "uplink": max(uplink),
+        "downlink": min(downlink),
+        "heard_all": heard_all,
+        "saw_screen": saw_screen,
+        "mixed": mixed,
+        "released": released,
+        "offers": stats["offers"]
+    }
+
+
+async def run(args):
+    print(f"{'комната':>8} {'исходящих':>10} {'в mesh':>7} {'входящих':>9} "
+          f"{'слышат всех':>12} {'экран':>6} {'микс':>6} {'выход':>6} {'offer':>6}")
+    for size in args.sizes:
+        result = await run_room(size, args.threshold, args.seconds)
+        print(f"{result['size']:>8} {result['uplink']:>10} {size - 1:>7} {result['downlink']:>9} "
+              f"{str(result['heard_all']):>12} {str(result['saw_screen']):>6} {str(result['mixed']):>6} "
+              f"{str(result['released']):>6} {result['offers']:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 4, 6], help="Размеры комнат")
+    parser.add_argument("--threshold", type=int, default=3, help="Порог перехода на SFU")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Ожидание звука; экрана — втрое дольше")
+    args = parser.parse_args()
+    if min(args.sizes) < args.threshold:
+        parser.error("Комнаты меньше порога остаются в mesh")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
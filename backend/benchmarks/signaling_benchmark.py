@@ -0,0 +1,123 @@
+"""Бенчмарк пересылки WebRTC-сигналинга: полный разбор JSON против чтения только конверта.
+
+Моделируется вход участника в комнату: с каждым из остальных он обменивается offer/answer,
+обе стороны шлют ICE-кандидаты. Замеряется CPU узла на пересылку всех кадров одного входа
+и число исходящих кадров с пакетной доставкой ICE-кандидатов.
+
+Запуск из каталога backend:
+    python -m benchmarks.signaling_benchmark --room 10 --candidates 8 --joins 2000
+"""
+import argparse
+import json
+import math
+import random
+import string
+import time
+from app.core.config import settings
+from app.core.serialization import dumps
+from app.websocket.signaling import SIGNAL_FIELDS, relay_frame, split_signal
+
+
+def _fake_sdp(kind: str) -> str:
+    """SDP размером с настоящий (аудио + видео + демонстрация экрана, ~5 КБ)"""
+    token = lambda size: "".join(random.choices(string.ascii_letters + string.digits, k=size))
+    lines = ["v=0", f"o=- {random.getrandbits(62)} 2 IN IP4 127.0.0.1", "s=-", "t=0 0",
+             "a=group:BUNDLE 0 1 2", "a=extmap-allow-mixed", "a=msid-semantic: WMS"]
+    for mid, media in enumerate(("audio", "video", "video")):
+        lines += [
+            f"m={media} 9 UDP/TLS/RTP/SAVPF 111 63 9 0 8 13 110 126",
+            "c=IN IP4 0.0.0.0", "a=rtcp:9 IN IP4 0.0.0.0",
+            f"a=ice-ufrag:{token(4)}", f"a=ice-pwd:{token(24)}", "a=ice-options:trickle",
+            "a=fingerprint:sha-256 " + ":".join(f"{random.getrandbits(8):02X}" for _ in range(32)),
+            f"a=setup:{'actpass' if kind == 'offer' else 'active'}", f"a=mid:{mid}",
+        ]
+        lines += [f"a=extmap:{i} urn:ietf:params:rtp-hdrext:{token(20)}" for i in range(1, 8)]
+        lines += [f"a=rtpmap:{pt} {token(6)}/48000/2" for pt in (111, 63, 9, 0, 8, 13, 110, 126)]
+        lines += [f"a=fmtp:{pt} minptime=10;useinbandfec=1" for pt in (111, 63)]
+        lines += [f"a=ssrc:{random.getrandbits(31)} cname:{token(16)}" for _ in range(4)]
+    return "\r\n".join(lines) + "\r\n"
+
+
+def build_join_frames(room: int, candidates: int) -> list[str]:
+    """Кадры, которые узел получает при входе одного участника в комнату из room человек"""
+    frames = []
+    for peer in range(1, room):
+        for kind in ("offer", "answer"):
+            frames.append(json.dumps(
+                {"type": kind, "target_id": peer, kind: {"type": kind, "sdp": _fake_sdp(kind)}},
+                separators=(",", ":")
+            ))
+        for _ in range(candidates * 2):
+            candidate = (
+                f"candidate:{random.getrandbits(32)} 1 udp {random.getrandbits(31)} "
+                f"192.168.{random.randrange(256)}.{random.randrange(256)} {random.randrange(1024, 65535)} typ host "
+                f"generation 0 ufrag {random.getrandbits(16):04x} network-id 1"
+            )
+            frames.append(json.dumps(
+                {"type": "ice_candidate", "target_id": peer,
+                 "candidate": {"candidate": candidate, "sdpMid": "0", "sdpMLineIndex": 0, "usernameFragment": None}},
+                separators=(",", ":")
+            ))
+    return frames
+
+
+def relay_full_parse(text: str, from_id: int) -> str:
+    """Прежний путь: receive_json разбирает весь кадр, ответ собирается и сериализуется заново"""
+    data = json.loads(text)
+    field = SIGNAL_FIELDS[data["type"]]
+    return dumps({"type": data["type"], "from_id": from_id, field: data[field]})
+
+
+def relay_envelope(text: str, from_id: int) -> str:
+    """Новый путь: только конверт, полезная нагрузка вставляется как есть"""
+    signal_type, _, payload = split_signal(text)
+    return relay_frame(signal_type, from_id, payload).text
+
+
+def batched_frame_count(frames: list[str], max_batch: int) -> int:
+    """Исходящих кадров при пакетной доставке ICE (все кандидаты пары укладываются в окно)"""
+    candidates_by_target: dict[int, int] = {}
+    count = 0
+    for text in frames:
+        signal_type, target_id, _ = split_signal(text)
+        if signal_type == "ice_candidate":
+            candidates_by_target[target_id] = candidates_by_target.get(target_id, 0) + 1
+        else:
+            count += 1
+    return count + sum(math.ceil(total / max_batch) for total in candidates_by_target.values())
+
+
+def measure(relay, frames: list[str], joins: int) -> float:
+    """Микросекунды CPU на пересылку кадров одного входа"""
+    started = time.perf_counter()
+    for _ in range(joins):
+        for text in frames:
+            relay(text, 42)
+    return (time.perf_counter() - started) / joins * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--room", type=int, default=10, help="Участников в комнате вместе с входящим")
+    parser.add_argument("--candidates", type=int, default=8, help="ICE-кандидатов с каждой стороны")
+    parser.add_argument("--joins", type=int, default=2000)
+    parser.add_argument("--batch-max", type=int, default=settings.VOICE_ICE_BATCH_MAX)
+    args = parser.parse_args()
+
+    frames = build_join_frames(args.room, args.candidates)
+    # Получатель должен увидеть то же самое, что и раньше
+    for text in frames:
+        assert json.loads(relay_envelope(text, 42)) == json.loads(relay_full_parse(text, 42))
+
+    size = sum(len(text) for text in frames)
+    print(f"Кадров на вход: {len(frames)}, {size / 1024:.0f} КБ")
+    full = measure(relay_full_parse, frames, args.joins)
+    envelope = measure(relay_envelope, frames, args.joins)
+    print(f"Полный разбор:   {full:8.0f} мкс на вход")
+    print(f"Только конверт:  {envelope:8.0f} мкс на вход")
+    print(f"Ускорение:       {full / envelope:8.1f}x")
+    print(f"Кадров получателям: {len(frames)} по одному, {batched_frame_count(frames, args.batch_max)} с ice_batching")
+
+
+if __name__ == "__main__":
+    main()
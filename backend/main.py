@@ -6,45 +6,77 @@ import asyncio
 import logging
 
 from app.core.config import settings
-from app.db.database import engine, Base
-from app.api import auth, channels
+from app.core.serialization import FastJSONResponse
+from app.api import attachments, auth, channels, export, messages, search, unread
 from app.websocket import chat, voice
 from app.websocket.connection_manager import manager
 from app.websocket.chat import websocket_chat_endpoint, websocket_notifications_endpoint
 from app.websocket.voice import websocket_voice_endpoint
+from app.services.message_ingest import message_ingest
+from app.services.message_cache import message_cache
+from app.services.rate_limit import rate_limiter
+from app.services.read_state import read_states
+from app.services.thumbnails import thumbnails
+from app.services.attachment_sweeper import attachment_sweeper
+from app.services.partitions import partition_maintainer
+from app.services.voice_state import voice_states
+from app.services.sfu import sfu
+from app.services.audio_mixer import audio_mixer
+from app.services.indicators import indicators
+from app.core.snowflake import snowflake, worker_lease
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Задача для автоматической очистки соединений
-async def cleanup_task():
-    """Периодическая очистка устаревших WebSocket соединений"""
-    while True:
-        try:
-            await asyncio.sleep(300)  # Каждые 5 минут
-            await manager.cleanup_stale_connections()
-        except Exception as e:
-            logger.error(f"❌ Ошибка в задаче очистки соединений: {e}")
-
-# Создание таблиц при старте
+# Схему базы создают и обновляют миграции Alembic (alembic upgrade head) до запуска приложения
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # Партиции сообщений на текущий и ближайшие месяцы
+    await partition_maintainer.start()
     
     # Инициализация Redis для WebSocket
     await manager.init_redis()
+    await manager.start_pubsub()
+    message_cache.attach_redis(manager.redis_client)
+    rate_limiter.attach_redis(manager.redis_client)
+    read_states.attach_redis(manager.redis_client)
+    voice_states.attach_redis(manager.redis_client)
+    
+    # Уникальный worker_id генератора id: из конфигурации или аренда в Redis
+    if settings.SNOWFLAKE_WORKER_ID >= 0:
+        snowflake.worker_id = settings.SNOWFLAKE_WORKER_ID
+    elif not await worker_lease.acquire(manager.redis_client, manager.node_id):
+        logger.warning("⚠️ worker_id не получен, используется 0 — при нескольких процессах id могут совпасть")
+    
+    # Запуск heartbeat вместо периодической очистки соединений
+    manager.heartbeat.start()
     
-    # Запуск задачи очистки соединений
-    cleanup_task_handle = asyncio.create_task(cleanup_task())
-    logger.info("🧹 Запущена задача автоматической очистки WebSocket соединений")
+    # Фоновая пакетная запись сообщений чата
+    message_ingest.start()
+    read_states.start()
+    thumbnails.start()
+    attachment_sweeper.start()
+    # Голосовые комнаты: сверка с БД убирает участников, оставшихся после падения процессов
+    await voice_states.start()
+    indicators.start()
     
     yield
     
     # Shutdown
-    cleanup_task_handle.cancel()
+    await manager.heartbeat.stop()
+    await message_ingest.stop()
+    await read_states.stop()
+    await thumbnails.stop()
+    await attachment_sweeper.stop()
+    await indicators.stop()
+    await sfu.stop()
+    await audio_mixer.stop()
+    await voice_states.stop()
+    await partition_maintainer.stop()
+    await worker_lease.release()
+    await manager.stop_pubsub()
     if manager.redis_client:
         await manager.redis_client.close()
     logger.info("🔴 Приложение остановлено")
@@ -54,7 +86,8 @@ app = FastAPI(
     title="Miscord API",
     description="Discord-like chat application API",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # Настройка CORS
@@ -69,15 +102,20 @@ app.add_middleware(
 # Подключение роутеров
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(channels.router, prefix="/api/channels", tags=["channels"])
+app.include_router(search.router, prefix="/api/channels", tags=["search"])
+app.include_router(unread.router, prefix="/api/channels", tags=["unread"])
+app.include_router(messages.router, prefix="/api/text-channels", tags=["messages"])
+app.include_router(attachments.router, prefix="/api", tags=["attachments"])
+app.include_router(export.router, prefix="/api", tags=["export"])
 
 # WebSocket эндпоинты
 @app.websocket("/ws/chat/{channel_id}")
-async def websocket_chat_endpoint_route(websocket: WebSocket, channel_id: int, token: str):
-    await websocket_chat_endpoint(websocket, channel_id, token)
+async def websocket_chat_endpoint_route(websocket: WebSocket, channel_id: int, token: str, session_id: str = None):
+    await websocket_chat_endpoint(websocket, channel_id, token, session_id=session_id)
 
 @app.websocket("/ws/notifications")
-async def websocket_notifications_endpoint_route(websocket: WebSocket, token: str):
-    await websocket_notifications_endpoint(websocket, token)
+async def websocket_notifications_endpoint_route(websocket: WebSocket, token: str, session_id: str = None):
+    await websocket_notifications_endpoint(websocket, token, session_id=session_id)
 
 @app.websocket("/ws/voice/{channel_id}")
 async def websocket_voice_endpoint_route(websocket: WebSocket, channel_id: int, token: str):
@@ -87,11 +125,23 @@ async def websocket_voice_endpoint_route(websocket: WebSocket, channel_id: int,
 @app.get("/api/debug/websocket-stats")
 async def get_websocket_stats():
     """Получение статистики WebSocket соединений"""
-    return manager.get_connection_stats()
+    return {
+        **manager.get_connection_stats(),
+        'message_ingest': message_ingest.get_stats(),
+        'message_cache': message_cache.get_stats(),
+        'rate_limit': rate_limiter.get_stats(),
+        'read_states': read_states.get_stats(),
+        'thumbnails': thumbnails.get_stats(),
+        'attachment_sweeper': attachment_sweeper.get_stats(),
+        'voice': voice_states.get_stats(),
+        'sfu': sfu.get_stats(),
+        'audio_mix': audio_mixer.get_stats(),
+        'indicators': indicators.get_stats()
+    }
 
 @app.post("/api/debug/cleanup-connections")
 async def force_cleanup_connections():
-    """Принудительная очистка устаревших соединений"""
+    """Принудительная проверка простаивающих соединений"""
     await manager.cleanup_stale_connections()
     return {"message": "Очистка соединений выполнена"}
 
@@ -129,6 +179,8 @@ async def root():
         "endpoints": {
             "auth": "/api/auth",
             "channels": "/api/channels",
+            "messages": "/api/text-channels/{text_channel_id}/messages",
+            "search": "/api/channels/{channel_id}/search",
             "websocket_chat": "/ws/chat/{channel_id}",
             "websocket_voice": "/ws/voice/{channel_id}",
             "websocket_notifications": "/ws/notifications",
@@ -0,0 +1,107 @@
+"""Заглушки WebSocket и Redis для тестов без сети"""
+import asyncio
+
+
+class FakeWebSocket:
+    """Сокет, складывающий отправленные кадры в список; delay — задержка каждой отправки"""
+
+    def __init__(self, delay: float = 0.0, error: Exception = None):
+        self.sent = []
+        self.closed_with = None
+        self.delay = delay
+        self.error = error
+
+    async def send_text(self, text: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        self.sent.append(text)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        self.closed_with = code
+
+
+class FakeScript:
+    """Lua-скрипт Redis, замененный функцией над словарем FakeRedis"""
+
+    def __init__(self, redis, source: str):
+        self.redis = redis
+        self.source = source
+
+    async def __call__(self, keys=None, args=None):
+        self.redis.script_calls.append((self.source, list(keys or []), list(args or [])))
+        if self.redis.fail:
+            raise ConnectionError("Redis недоступен")
+        if "INCRBY" in self.source:
+            return self._stamp(keys, args)
+        if "HSET" in self.source:
+            return self._advance(keys, args)
+        # Продление и освобождение аренды: только если ключ принадлежит владельцу
+        key, owner = keys[0], args[0]
+        if self.redis.data.get(key) != owner:
+            return 0
+        if "DEL" in self.source:
+            del self.redis.data[key]
+        return 1
+
+    def _advance(self, keys, args):
+        pointers = self.redis.data.setdefault(keys[0], {})
+        for i in range(0, len(args), 2):
+            if int(args[i + 1]) > int(pointers.get(args[i], 0)):
+                pointers[args[i]] = args[i + 1]
+        return 1
+
+    def _stamp(self, keys, args):
+        mirror = args[0] == "1"
+        position = 3
+        result = []
+        for i in range(0, len(keys), 2):
+            count = int(args[position])
+            position += 1
+            last = self.redis.data.get(keys[i], 0) + count
+            self.redis.data[keys[i]] = last
+            if mirror:
+                frames = self.redis.lists.setdefault(keys[i + 1], [])
+                for j in range(count):
+                    prefix, suffix = args[position + j * 2], args[position + j * 2 + 1]
+                    frames.append(f"{prefix}{last - count + 1 + j}{suffix}")
+                position += count * 2
+            result.append(last)
+        return result
+
+
+class FakeRedis:
+    """Ровно то подмножество redis.asyncio, которым пользуются проверяемые модули"""
+
+    def __init__(self):
+        self.data = {}
+        self.lists = {}
+        self.script_calls = []
+        self.fail = False
+
+    def register_script(self, source: str) -> FakeScript:
+        return FakeScript(self, source)
+
+    async def set(self, key, value, nx: bool = False, ex: int = None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def lrange(self, key, start, end):
+        return list(self.lists.get(key, []))
+
+    async def hmget(self, key, fields):
+        if self.fail:
+            raise ConnectionError("Redis недоступен")
+        return [self.data.get(key, {}).get(field) for field in fields]
+
+    async def hdel(self, key, *fields):
+        if self.fail:
+            raise ConnectionError("Redis недоступен")
+        pointers = self.data.get(key, {})
+        return sum(pointers.pop(field, None) is not None for field in fields)
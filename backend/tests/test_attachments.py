@@ -0,0 +1,30 @@
+import pytest
+from starlette.requests import Request
+from app.api.attachments import file_response
+
+ETAG = '"abc"'
+
+
+def _headers(content_type: str) -> dict:
+    # If-None-Match совпадает — ответ 304 с теми же заголовками, хранилище не читается
+    request = Request({"type": "http", "method": "GET", "headers": [(b"if-none-match", ETAG.encode())]})
+    response = file_response(request, "content/abc", ETAG, 10, content_type, "file")
+    assert response.status_code == 304
+    return response.headers
+
+
+@pytest.mark.parametrize("content_type", ["image/png", "image/JPEG", "video/mp4", "audio/ogg"])
+def test_raster_images_and_media_open_inline(content_type):
+    headers = _headers(content_type)
+    assert headers["content-disposition"].startswith("inline;")
+    assert headers["content-security-policy"] == "sandbox"
+
+
+@pytest.mark.parametrize("content_type", [
+    "image/svg+xml", "text/html", "application/xhtml+xml", "text/xml", "application/pdf", "image/x-unknown"
+])
+def test_active_content_is_downloaded(content_type):
+    headers = _headers(content_type)
+    assert headers["content-disposition"].startswith("attachment;")
+    assert headers["content-security-policy"] == "sandbox"
+    assert headers["x-content-type-options"] == "nosniff"
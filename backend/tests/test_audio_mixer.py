@@ -0,0 +1,48 @@
+"""Сведение звука: векторный mix_frames против цикла по слушателям из benchmarks/mixer_benchmark"""
+import numpy as np
+import pytest
+
+pytest.importorskip("av")
+
+from app.services.audio_mixer import FRAME_LENGTH, mix_frames  # noqa: E402
+from benchmarks.mixer_benchmark import mix_per_listener  # noqa: E402
+
+
+def voices(amplitudes) -> np.ndarray:
+    """Источники с разной громкостью: по одному синусу на источник"""
+    t = np.arange(FRAME_LENGTH, dtype=np.float32)
+    return np.stack([
+        (amplitude * np.sin(t * (i + 1) / 50)).astype(np.int16) for i, amplitude in enumerate(amplitudes)
+    ])
+
+
+def test_mix_matches_per_listener_reference():
+    frames = voices([3000, 0, 1200, 5000, 2500, 50, 4000])
+    listeners = np.array([0, 1, 2, 3, 4, 5, 6, -1, -1])
+    for max_speakers in (0, 2, 3, 10):
+        expected = mix_per_listener(frames, listeners, max_speakers)
+        np.testing.assert_array_equal(mix_frames(frames, listeners, max_speakers), expected)
+
+
+def test_listener_does_not_hear_own_voice():
+    frames = voices([3000, 2000])
+    mixes = mix_frames(frames, np.array([0, 1, -1]), 0)
+    np.testing.assert_array_equal(mixes[0], frames[1])
+    np.testing.assert_array_equal(mixes[1], frames[0])
+    np.testing.assert_array_equal(mixes[2], frames[0] + frames[1])
+
+
+def test_silent_and_quiet_sources_are_left_out():
+    frames = voices([3000, 50, 2000, 1000])
+    mixes = mix_frames(frames, np.array([-1]), 2)
+    # Источник 1 ниже порога тишины, источник 3 тише двух самых громких
+    np.testing.assert_array_equal(mixes[0], frames[0] + frames[2])
+
+
+def test_mix_is_clipped_to_int16():
+    frames = np.full((3, FRAME_LENGTH), 20000, dtype=np.int16)
+    frames[1] = -20000
+    mixes = mix_frames(frames, np.array([1, -1]), 0)
+    assert mixes.dtype == np.int16
+    assert (mixes[0] == 32767).all()
+    assert (mixes[1] == 20000).all()
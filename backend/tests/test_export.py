@@ -0,0 +1,62 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timezone
+import pytest
+from sqlalchemy.dialects import postgresql
+from app.services.export import EXPORT_COLUMNS, encode_csv, encode_ndjson, export_query, stream_export
+
+CREATED = datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+ROWS = [
+    (1234567890123456789, 10, 1, "alice", CREATED, None, 0, "привет"),
+    (1234567890123456790, 10, 2, "bob", CREATED, CREATED, 1, 'цитата "в кавычках", запятая\nи перенос')
+]
+
+
+def test_ndjson_keeps_ids_exact():
+    lines = encode_ndjson(ROWS).decode().splitlines()
+    first, second = map(json.loads, lines)
+    # id — строкой: 64-битные snowflake в JSON-числе теряют точность у JS-клиентов
+    assert first["id"] == "1234567890123456789"
+    assert first == {
+        "id": "1234567890123456789", "text_channel_id": 10, "author_id": 1, "author": "alice",
+        "created_at": CREATED.isoformat(), "updated_at": None, "is_edited": False, "content": "привет"
+    }
+    assert second["is_edited"] is True and second["content"] == ROWS[1][7]
+
+
+def test_csv_round_trips_quotes_and_newlines():
+    text = (encode_csv((), header=True) + encode_csv(ROWS)).decode("utf-8")
+    header, *records = list(csv.reader(io.StringIO(text)))
+    assert tuple(header) == EXPORT_COLUMNS
+    assert records[1][0] == str(ROWS[1][0])
+    assert records[1][6] == "1"
+    assert records[1][7] == ROWS[1][7]
+
+
+def test_empty_export_streams_header_and_valid_gzip():
+    async def collect():
+        return b"".join([chunk async for chunk in stream_export([], "csv", compress=True)])
+
+    assert gzip.decompress(asyncio.run(collect())).decode() == ",".join(EXPORT_COLUMNS) + "\r\n"
+
+
+def _sql(query) -> str:
+    return str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def test_multi_channel_cursor_compares_channel_and_id():
+    sql = _sql(export_query([10, 11, 12], after=500, after_text_channel=11))
+    assert "(messages.text_channel_id, messages.id) > (11, 500)" in sql
+    assert "ORDER BY messages.text_channel_id, messages.id" in sql
+
+
+def test_single_channel_cursor_uses_id():
+    assert "messages.id > 500" in _sql(export_query([10], after=500))
+
+
+def test_multi_channel_cursor_requires_channel():
+    with pytest.raises(ValueError):
+        export_query([10, 11], after=500)
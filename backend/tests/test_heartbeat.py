@@ -0,0 +1,149 @@
+import asyncio
+from app.websocket.heartbeat import HeartbeatMonitor, TimingWheel
+from tests.fakes import FakeWebSocket
+
+
+def _advance(wheel: TimingWheel, ticks: int) -> list:
+    """Номера тиков (с 1), на которых сработали таймеры"""
+    fired = []
+    for tick in range(1, ticks + 1):
+        fired += [(tick, key) for key in wheel.advance()]
+    return fired
+
+
+def test_wheel_fires_after_delay():
+    wheel = TimingWheel(tick_interval=0.1, slots=8)
+    wheel.schedule("a", 0.3)
+    wheel.schedule("b", 0.05)
+    assert len(wheel) == 2
+    assert _advance(wheel, 8) == [(1, "b"), (3, "a")]
+    assert len(wheel) == 0
+
+
+def test_wheel_counts_full_rounds():
+    wheel = TimingWheel(tick_interval=0.1, slots=4)
+    wheel.schedule("a", 1.0)
+    assert _advance(wheel, 12) == [(10, "a")]
+
+
+def test_wheel_reschedule_and_cancel():
+    wheel = TimingWheel(tick_interval=0.1, slots=8)
+    wheel.schedule("a", 0.2)
+    wheel.schedule("a", 0.5)
+    wheel.schedule("b", 0.2)
+    wheel.cancel("b")
+    wheel.cancel("missing")
+    assert len(wheel) == 1
+    assert _advance(wheel, 8) == [(5, "a")]
+
+
+def _monitor(pings, dead, ping_result=True, idle=0.05, deadline=0.05):
+    async def send_ping(websocket):
+        pings.append(websocket)
+        return ping_result
+
+    async def on_dead(websocket, reason):
+        dead.append(websocket)
+
+    return HeartbeatMonitor(send_ping, on_dead, idle_timeout=idle, deadline=deadline, tick_interval=0.01, slots=16)
+
+
+def test_idle_socket_is_pinged_then_evicted():
+    async def scenario():
+        pings, dead = [], []
+        monitor = _monitor(pings, dead)
+        websocket = FakeWebSocket()
+        monitor.register(websocket)
+        await asyncio.sleep(0.06)
+        await monitor.sweep()
+        pinged = list(pings)
+        awaiting = websocket in monitor.awaiting_pong
+        await asyncio.sleep(0.06)
+        await monitor.sweep()
+        return pinged, awaiting, dead, monitor
+
+    pinged, awaiting, dead, monitor = asyncio.run(scenario())
+    assert len(pinged) == 1 and awaiting
+    assert len(dead) == 1
+    assert monitor.get_stats() == {"tracked_connections": 0, "awaiting_pong": 0, "evicted_total": 1}
+
+
+def test_traffic_answers_ping():
+    async def scenario():
+        pings, dead = [], []
+        monitor = _monitor(pings, dead)
+        websocket = FakeWebSocket()
+        monitor.register(websocket)
+        await asyncio.sleep(0.06)
+        await monitor.sweep()
+        monitor.touch(websocket)
+        await monitor.sweep()
+        return monitor, websocket, dead
+
+    monitor, websocket, dead = asyncio.run(scenario())
+    assert dead == []
+    assert websocket not in monitor.awaiting_pong
+    assert websocket in monitor.last_seen
+
+
+def test_failed_ping_evicts_immediately():
+    async def scenario():
+        pings, dead = [], []
+        monitor = _monitor(pings, dead, ping_result=False)
+        websocket = FakeWebSocket()
+        monitor.register(websocket)
+        await asyncio.sleep(0.06)
+        await monitor.sweep()
+        return dead, websocket
+
+    dead, websocket = asyncio.run(scenario())
+    assert dead == [websocket]
+
+
+def test_ticker_pings_only_idle_sockets():
+    async def scenario():
+        pings, dead = [], []
+        monitor = _monitor(pings, dead)
+        active, silent = FakeWebSocket(), FakeWebSocket()
+        monitor.register(active)
+        monitor.register(silent)
+        monitor.start()
+        for _ in range(30):
+            monitor.touch(active)
+            await asyncio.sleep(0.01)
+        await monitor.stop()
+        return pings, dead, active, silent
+
+    pings, dead, active, silent = asyncio.run(scenario())
+    assert active not in pings
+    assert silent in pings
+    assert dead == [silent]
+
+
+def test_dead_sockets_are_evicted_concurrently():
+    async def scenario():
+        dead = []
+
+        async def send_ping(websocket):
+            return False
+
+        async def on_dead(websocket, reason):
+            await asyncio.sleep(0.05)
+            if websocket is sockets[0]:
+                raise ConnectionError("close failed")
+            dead.append(websocket)
+
+        monitor = HeartbeatMonitor(send_ping, on_dead, idle_timeout=0.01, deadline=0.05, tick_interval=0.01, slots=16)
+        sockets = [FakeWebSocket() for _ in range(10)]
+        for websocket in sockets:
+            monitor.register(websocket)
+        await asyncio.sleep(0.02)
+        started = asyncio.get_running_loop().time()
+        await monitor.sweep()
+        return asyncio.get_running_loop().time() - started, dead, sockets, monitor
+
+    elapsed, dead, sockets, monitor = asyncio.run(scenario())
+    # Десять закрытий по 50 мс заняли время одного, ошибка одного не остановила остальные
+    assert elapsed < 0.25
+    assert dead == sockets[1:]
+    assert monitor.get_stats()["evicted_total"] == 10
@@ -0,0 +1,90 @@
+import asyncio
+import json
+from app.websocket.signaling import IceCandidateBatcher
+from tests.fakes import FakeWebSocket
+
+CANDIDATE = '{"candidate":"candidate:1 1 udp 2122260223 10.0.0.1 54321 typ host","sdpMid":"0"}'
+END_OF_CANDIDATES = '{"candidate":"","sdpMid":"0"}'
+
+
+def _batcher(sent, window=0.05, max_batch=3):
+    async def send(websocket, frame):
+        sent.append((websocket, json.loads(frame.text)))
+    return IceCandidateBatcher(window, max_batch, send=send)
+
+
+def test_candidates_within_window_are_batched():
+    async def scenario():
+        sent, websocket = [], FakeWebSocket()
+        batcher = _batcher(sent)
+        await batcher.add(websocket, 7, CANDIDATE)
+        await batcher.add(websocket, 7, CANDIDATE)
+        before = list(sent)
+        await asyncio.sleep(0.1)
+        return before, sent, batcher
+
+    before, sent, batcher = asyncio.run(scenario())
+    assert before == []
+    assert len(sent) == 1
+    frame = sent[0][1]
+    assert frame["type"] == "ice_candidates" and frame["from_id"] == 7
+    assert frame["candidates"] == [json.loads(CANDIDATE)] * 2
+    assert batcher.get_stats() == {"candidates": 2, "frames": 1, "pending": 0}
+
+
+def test_single_candidate_uses_plain_frame():
+    async def scenario():
+        sent = []
+        batcher = _batcher(sent)
+        await batcher.add(FakeWebSocket(), 7, CANDIDATE)
+        await asyncio.sleep(0.1)
+        return sent
+
+    sent = asyncio.run(scenario())
+    assert [frame for _, frame in sent] == [{"candidate": json.loads(CANDIDATE), "from_id": 7, "type": "ice_candidate"}]
+
+
+def test_full_batch_and_end_of_candidates_flush_immediately():
+    async def scenario():
+        sent, websocket = [], FakeWebSocket()
+        batcher = _batcher(sent, window=10)
+        for _ in range(3):
+            await batcher.add(websocket, 7, CANDIDATE)
+        full = len(sent)
+        await batcher.add(websocket, 7, CANDIDATE)
+        await batcher.add(websocket, 7, END_OF_CANDIDATES)
+        return full, sent
+
+    full, sent = asyncio.run(scenario())
+    assert full == 1
+    assert len(sent) == 2
+    assert sent[1][1]["candidates"][-1] == json.loads(END_OF_CANDIDATES)
+
+
+def test_batches_are_kept_per_sender_and_flushed_before_offer():
+    async def scenario():
+        sent, websocket = [], FakeWebSocket()
+        batcher = _batcher(sent, window=10)
+        await batcher.add(websocket, 7, CANDIDATE)
+        await batcher.add(websocket, 8, CANDIDATE)
+        # Перед offer от 7 уходят только его кандидаты
+        await batcher.flush(websocket, 7)
+        return sent, batcher
+
+    sent, batcher = asyncio.run(scenario())
+    assert [frame["from_id"] for _, frame in sent] == [7]
+    assert batcher.get_stats()["pending"] == 1
+
+
+def test_discard_drops_batches_of_closed_socket():
+    async def scenario():
+        sent, closed, alive = [], FakeWebSocket(), FakeWebSocket()
+        batcher = _batcher(sent)
+        await batcher.add(closed, 7, CANDIDATE)
+        await batcher.add(alive, 7, CANDIDATE)
+        batcher.discard(closed)
+        await asyncio.sleep(0.1)
+        return sent, alive
+
+    sent, alive = asyncio.run(scenario())
+    assert [websocket for websocket, _ in sent] == [alive]
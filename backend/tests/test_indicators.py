@@ -0,0 +1,78 @@
+from app.services.indicators import IndicatorEngine
+
+TTL = 5.0
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _engine():
+    clock = Clock()
+    return IndicatorEngine(tick_interval=0.1, typing_ttl=TTL, clock=clock), clock
+
+
+def test_flapping_within_tick_is_coalesced():
+    engine, _ = _engine()
+    for is_speaking in (True, False, True, False):
+        engine.set_speaking(1, 10, is_speaking)
+    engine.set_speaking(1, 11, True)
+    engine.set_speaking(1, 12, True)
+    assert engine.collect(0.1) == [("speaking", 1, {"type": "speaking_update", "started": [11, 12], "stopped": []})]
+    assert engine.collect(0.2) == []
+
+
+def test_speaking_stop_is_announced_once():
+    engine, _ = _engine()
+    engine.set_speaking(1, 10, True)
+    engine.collect(0.1)
+    engine.set_speaking(1, 10, False)
+    engine.set_speaking(1, 10, True)
+    assert engine.collect(0.2) == []
+    engine.set_speaking(1, 10, False)
+    assert engine.collect(0.3) == [("speaking", 1, {"type": "speaking_update", "started": [], "stopped": [10]})]
+    assert engine.collect(0.4) == []
+    assert engine.get_stats()["speaking_channels"] == 0
+
+
+def test_leaving_room_sends_no_stop_frame():
+    engine, _ = _engine()
+    engine.set_speaking(1, 10, True)
+    engine.collect(0.1)
+    engine.forget_speaking(1, 10)
+    assert engine.collect(0.2) == []
+
+
+def test_typing_expires_without_repeat():
+    engine, clock = _engine()
+    engine.set_typing(1, 20, 10, "alice")
+    (kind, channel_id, frame), = engine.collect(0.1)
+    assert (kind, channel_id) == ("typing", 1)
+    assert frame["started"] == [{"user": {"id": 10, "username": "alice"}, "text_channel_id": 20}]
+
+    # Повтор продлевает индикатор и не дает нового кадра
+    clock.now = 3.0
+    engine.set_typing(1, 20, 10, "alice")
+    assert engine.collect(3.1) == []
+    assert engine.collect(TTL + 0.1) == []
+    assert engine.collect(3.0 + TTL) == [
+        ("typing", 1, {"type": "typing_update", "started": [], "stopped": [{"user_id": 10, "text_channel_id": 20}]})
+    ]
+
+
+def test_stop_typing_clears_only_matching_channel():
+    engine, _ = _engine()
+    engine.set_typing(1, 20, 10, "alice")
+    engine.set_typing(1, 21, 10, "alice")
+    engine.collect(0.1)
+    engine.stop_typing(1, 10, text_channel_id=20)
+    (_, _, frame), = engine.collect(0.2)
+    assert frame["stopped"] == [{"user_id": 10, "text_channel_id": 20}]
+    engine.stop_typing(1, 10)
+    (_, _, frame), = engine.collect(0.3)
+    assert frame["stopped"] == [{"user_id": 10, "text_channel_id": 21}]
+    assert engine.get_stats()["typing_channels"] == 0
@@ -0,0 +1,116 @@
+import asyncio
+from app.services.message_cache import RecentMessagesCache
+
+
+def _cache(per_channel=3, max_bytes=1000, local_ttl=60.0):
+    return RecentMessagesCache(per_channel=per_channel, max_bytes=max_bytes, use_redis=False, local_ttl=local_ttl)
+
+
+def _page(*ids):
+    return [(message_id, f"m{message_id}".encode()) for message_id in ids]
+
+
+async def _fill(cache, channel_id, messages, complete=True):
+    cache.begin_fill(channel_id)
+    await cache.fill(channel_id, messages, complete)
+
+
+def test_fill_then_append():
+    async def scenario():
+        cache = _cache()
+        await _fill(cache, 1, _page(1, 2))
+        first = await cache.get_latest(1, 5)
+        await cache.append(1, 3, b"m3")
+        await cache.append(1, 4, b"m4")
+        return first, await cache.get_latest(1, 3), await cache.get_latest(1, 5), cache
+
+    first, latest, beyond, cache = asyncio.run(scenario())
+    assert first == [b"m1", b"m2"]
+    assert latest == [b"m2", b"m3", b"m4"]
+    # Самое старое вытеснено — канал больше не полный, запрос глубже кэша идет в БД
+    assert beyond is None
+    assert cache.get_stats()["bytes"] == 6
+
+
+def test_append_during_fill_cancels_fill():
+    async def scenario():
+        cache = _cache()
+        cache.begin_fill(1)
+        # Сообщение записано, пока страница читалась из БД: в странице его может не быть
+        await cache.append(1, 3, b"m3")
+        await cache.fill(1, _page(1, 2), complete=True)
+        return await cache.get_latest(1, 2)
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_remote_update_during_fill_cancels_fill():
+    async def scenario():
+        cache = _cache()
+        cache.begin_fill(1)
+        await cache._handle_remote("1", {"op": "invalidate"})
+        await cache.fill(1, _page(1, 2), complete=True)
+        return await cache.get_latest(1, 2)
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_append_to_cold_channel_is_ignored():
+    async def scenario():
+        cache = _cache()
+        await cache.append(1, 1, b"m1")
+        return await cache.get_latest(1, 1), cache.get_stats()
+
+    latest, stats = asyncio.run(scenario())
+    assert latest is None
+    assert stats["channels"] == 0 and stats["misses"] == 1
+
+
+def test_remote_append_and_invalidate():
+    async def scenario():
+        cache = _cache()
+        await _fill(cache, 1, _page(1))
+        await cache._handle_remote("1", {"op": "append", "id": "2", "item": "m2"})
+        appended = await cache.get_latest(1, 2)
+        await cache._handle_remote("1", {"op": "invalidate"})
+        return appended, await cache.get_latest(1, 1), cache.get_stats()["remote_updates"]
+
+    appended, invalidated, remote_updates = asyncio.run(scenario())
+    assert appended == [b"m1", b"m2"]
+    assert invalidated is None
+    assert remote_updates == 2
+
+
+def test_out_of_order_append_invalidates():
+    async def scenario():
+        cache = _cache()
+        await _fill(cache, 1, _page(1, 5))
+        await cache._handle_remote("1", {"op": "append", "id": "3", "item": "m3"})
+        return await cache.get_latest(1, 1)
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_local_entries_expire():
+    async def scenario():
+        cache = _cache(local_ttl=0.0)
+        await _fill(cache, 1, _page(1))
+        return await cache.get_latest(1, 1), cache.get_stats()
+
+    latest, stats = asyncio.run(scenario())
+    assert latest is None
+    assert stats["channels"] == 0 and stats["bytes"] == 0
+
+
+def test_least_recent_channel_is_evicted_by_bytes():
+    async def scenario():
+        cache = _cache(max_bytes=8)
+        await _fill(cache, 1, _page(1, 2))
+        await _fill(cache, 2, _page(3, 4))
+        await cache.get_latest(1, 1)
+        await _fill(cache, 3, _page(5))
+        return list(cache.channels), cache.get_stats()["bytes"]
+
+    channels, size = asyncio.run(scenario())
+    assert channels == [1, 3]
+    assert size == 6
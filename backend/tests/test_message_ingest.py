@@ -0,0 +1,162 @@
+import asyncio
+import json
+import pytest
+from sqlalchemy.exc import IntegrityError, OperationalError
+import app.services.message_ingest as ingest_module
+from app.services.message_ingest import MessageIngest, PendingMessage
+from tests.fakes import FakeWebSocket
+
+
+class FakeDatabase:
+    """Таблица messages: строки удаленных каналов нарушают внешний ключ, down — база недоступна"""
+
+    def __init__(self):
+        self.rows = []
+        self.inserts = 0
+        self.bad_channels = set()
+        self.down = False
+
+    def session(self):
+        return FakeSession(self)
+
+
+class FakeSession:
+    def __init__(self, database: FakeDatabase):
+        self.database = database
+        self.staged = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, rows=None):
+        if rows is None:
+            return
+        self.database.inserts += 1
+        if self.database.down:
+            raise OperationalError("INSERT", {}, ConnectionError("connection refused"))
+        if any(row["text_channel_id"] in self.database.bad_channels for row in rows):
+            raise IntegrityError("INSERT", {}, Exception("violates foreign key constraint"))
+        self.staged += rows
+
+    async def commit(self):
+        self.database.rows += self.staged
+
+
+class FakeManager:
+    def __init__(self):
+        self.personal = []
+        self.channel = []
+
+    async def send_personal_message(self, message, websocket):
+        self.personal.append((websocket, json.loads(message)))
+
+    async def send_to_channel(self, channel_id, message, ephemeral=False):
+        self.channel.append((channel_id, message))
+
+
+class FakeReadStates:
+    def __init__(self, error: Exception = None):
+        self.persisted = []
+        self.error = error
+
+    async def messages_persisted(self, rows):
+        if self.error is not None:
+            raise self.error
+        self.persisted += rows
+
+
+class FakeCache:
+    def __init__(self):
+        self.appended = []
+        self.failures = 0
+
+    async def append(self, text_channel_id, message_id, item):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("cache down")
+        self.appended.append(message_id)
+
+
+@pytest.fixture
+def env(monkeypatch):
+    database, manager, cache = FakeDatabase(), FakeManager(), FakeCache()
+    monkeypatch.setattr(ingest_module, "AsyncSessionLocal", database.session)
+    monkeypatch.setattr(ingest_module, "manager", manager)
+    monkeypatch.setattr(ingest_module, "read_states", FakeReadStates())
+    monkeypatch.setattr(ingest_module, "message_cache", cache)
+    monkeypatch.setattr(ingest_module, "serialize_new_message", lambda row, author, attachments: b"{}")
+    return database, manager, cache
+
+
+def _pending(message_id: int, text_channel_id: int = 10) -> PendingMessage:
+    row = {"id": message_id, "content": "hi", "author_id": 1, "text_channel_id": text_channel_id}
+    return PendingMessage(row, author=None, server_id=1, sender=FakeWebSocket(), nonce=f"n{message_id}")
+
+
+def _replies(manager: FakeManager, kind: str) -> list:
+    return [int(frame["id"]) for _, frame in manager.personal if frame["type"] == kind]
+
+
+def test_bad_row_revokes_only_itself(env):
+    database, manager, cache = env
+    database.bad_channels = {99}
+    ingest = MessageIngest(batch_size=500, flush_interval=0.001, queue_size=100, queue_timeout=0.1)
+    batch = [_pending(i, 99 if i == 5 else 10) for i in range(8)]
+
+    asyncio.run(ingest._flush(batch))
+
+    assert [row["id"] for row in database.rows] == [0, 1, 2, 3, 4, 6, 7]
+    assert _replies(manager, "message_ack") == [0, 1, 2, 3, 4, 6, 7]
+    assert _replies(manager, "message_error") == [5]
+    assert manager.channel == [(1, {"type": "message_delete", "id": "5", "text_channel_id": 99})]
+    assert cache.appended == [0, 1, 2, 3, 4, 6, 7]
+    assert ingest.get_stats()["persisted_total"] == 7
+    assert ingest.get_stats()["failed_total"] == 1
+    # Пополам, а не по одной: 1 пакет + 2 половины + ... до виновной строки
+    assert database.inserts <= 1 + 2 * 3
+
+
+def test_unavailable_database_fails_whole_batch_once(env):
+    database, manager, _ = env
+    database.down = True
+    ingest = MessageIngest(batch_size=500, flush_interval=0.001, queue_size=100, queue_timeout=0.1)
+
+    asyncio.run(ingest._flush([_pending(i) for i in range(4)]))
+
+    assert database.inserts == 1
+    assert _replies(manager, "message_error") == [0, 1, 2, 3]
+    assert len(manager.channel) == 4
+
+
+def test_ingest_survives_failures_after_insert(env, monkeypatch):
+    database, manager, cache = env
+    monkeypatch.setattr(ingest_module, "read_states", FakeReadStates(error=RuntimeError("redis down")))
+    cache.failures = 1
+
+    async def scenario():
+        ingest = MessageIngest(batch_size=500, flush_interval=0.001, queue_size=100, queue_timeout=0.1)
+        ingest.start()
+        for message_id in (1, 2):
+            await ingest.queue.put(_pending(message_id))
+            await asyncio.sleep(0.05)
+        running = ingest.running
+        await ingest.stop()
+        return running
+
+    assert asyncio.run(scenario())
+    assert [row["id"] for row in database.rows] == [1, 2]
+    # Первый пакет оборвался на кэше, второй обработан полностью
+    assert _replies(manager, "message_ack") == [2]
+
+
+def test_submit_is_rejected_without_consumer(env):
+    database, manager, _ = env
+    ingest = MessageIngest(batch_size=500, flush_interval=0.001, queue_size=1, queue_timeout=0.1)
+
+    accepted = asyncio.run(ingest.submit(None, 1, 10, "hi", sender=FakeWebSocket()))
+
+    assert accepted is None
+    assert manager.channel == []
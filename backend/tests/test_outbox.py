@@ -0,0 +1,84 @@
+import asyncio
+from app.websocket.outbox import ConnectionOutbox
+from tests.fakes import FakeWebSocket
+
+
+def _outbox(websocket, failures, max_size=8, send_timeout=1.0):
+    async def on_failure(ws, reason):
+        failures.append((ws, reason))
+    return ConnectionOutbox(websocket, on_failure, max_size=max_size, send_timeout=send_timeout)
+
+
+def test_messages_are_sent_in_order():
+    async def scenario():
+        websocket, failures = FakeWebSocket(), []
+        outbox = _outbox(websocket, failures)
+        for i in range(5):
+            assert outbox.enqueue(f"m{i}")
+        await asyncio.sleep(0.01)
+        outbox.close()
+        return websocket.sent, failures
+
+    sent, failures = asyncio.run(scenario())
+    assert sent == [f"m{i}" for i in range(5)]
+    assert failures == []
+
+
+def test_overflow_fails_connection_once():
+    async def scenario():
+        websocket, failures = FakeWebSocket(delay=10), []
+        outbox = _outbox(websocket, failures, max_size=2)
+        accepted = [outbox.enqueue(f"m{i}") for i in range(4)]
+        await asyncio.sleep(0.01)
+        outbox.close()
+        return websocket, outbox, accepted, failures
+
+    websocket, outbox, accepted, failures = asyncio.run(scenario())
+    assert accepted == [True, True, False, False]
+    assert len(failures) == 1
+    assert failures[0][0] is websocket
+    assert "переполнена" in failures[0][1]
+    assert outbox.closed
+
+
+def test_slow_send_fails_connection():
+    async def scenario():
+        websocket, failures = FakeWebSocket(delay=1.0), []
+        outbox = _outbox(websocket, failures, send_timeout=0.05)
+        outbox.enqueue("m0")
+        await asyncio.sleep(0.2)
+        return outbox, failures
+
+    outbox, failures = asyncio.run(scenario())
+    assert len(failures) == 1
+    assert "дольше" in failures[0][1]
+    assert outbox.closed
+    assert not outbox.enqueue("m1")
+
+
+def test_send_error_fails_connection():
+    async def scenario():
+        websocket, failures = FakeWebSocket(error=RuntimeError("broken pipe")), []
+        outbox = _outbox(websocket, failures)
+        outbox.enqueue("m0")
+        await asyncio.sleep(0.01)
+        return failures
+
+    failures = asyncio.run(scenario())
+    assert len(failures) == 1
+    assert "broken pipe" in failures[0][1]
+
+
+def test_close_drops_pending_messages():
+    async def scenario():
+        websocket, failures = FakeWebSocket(), []
+        outbox = _outbox(websocket, failures)
+        outbox.enqueue("m0")
+        outbox.close()
+        await asyncio.sleep(0.01)
+        return websocket.sent, outbox.enqueue("m1"), failures
+
+    sent, accepted, failures = asyncio.run(scenario())
+    assert sent == []
+    assert not accepted
+    assert failures == []
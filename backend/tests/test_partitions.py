@@ -0,0 +1,44 @@
+import asyncio
+from datetime import datetime, timezone
+from app.services.partitions import add_months, oldest_partition_lower, partition_bounds, partition_name
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeConnection:
+    """pg_inherits родителя messages: имя партиции -> выражение границ"""
+
+    def __init__(self, partitions: dict):
+        self.partitions = partitions
+
+    async def execute(self, statement, params=None):
+        return FakeResult(list(self.partitions.items()))
+
+
+def _bound(lower, upper) -> str:
+    return f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+
+
+def test_month_arithmetic_and_names():
+    december = datetime(2025, 12, 1, tzinfo=timezone.utc)
+    assert add_months(december, 1) == datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert add_months(december, -12) == datetime(2024, 12, 1, tzinfo=timezone.utc)
+    assert partition_name(december) == "messages_p202512"
+    lower, upper = partition_bounds(december)
+    assert upper == partition_bounds(add_months(december, 1))[0] > lower
+
+
+def test_oldest_partition_ignores_legacy_catch_all():
+    months = [datetime(2026, month, 1, tzinfo=timezone.utc) for month in (3, 4, 5)]
+    partitions = {partition_name(month): _bound(*partition_bounds(month)) for month in months}
+    # После архива старых месяцев messages_legacy пуста, но покрывает их id
+    partitions["messages_legacy"] = f"FOR VALUES FROM (MINVALUE) TO ('{partition_bounds(months[0])[0]}')"
+
+    assert asyncio.run(oldest_partition_lower(FakeConnection(partitions))) == partition_bounds(months[0])[0]
+    assert asyncio.run(oldest_partition_lower(FakeConnection({}))) is None
@@ -0,0 +1,103 @@
+import asyncio
+import json
+from app.services.rate_limit import RateLimiter
+from tests.fakes import FakeWebSocket
+
+
+def _limiter(rate=20.0, burst=2, channel=None):
+    scopes = {"user": [rate, burst]}
+    if channel is not None:
+        scopes["channel"] = channel
+    return RateLimiter({"speaking": scopes}, use_redis=False, flood_strikes=3, flood_window=10.0)
+
+
+def test_burst_then_limited():
+    async def scenario():
+        limiter = _limiter(rate=1.0, burst=2)
+        return [await limiter.check("speaking", 1, 10) for _ in range(3)], await limiter.check("speaking", 2, 10)
+
+    waits, other_user = asyncio.run(scenario())
+    assert waits[:2] == [0.0, 0.0]
+    assert 0 < waits[2] <= 1.0
+    assert other_user == 0.0
+
+
+def test_channel_bucket_is_shared_and_not_charged_on_reject():
+    async def scenario():
+        limiter = _limiter(rate=100.0, burst=5, channel=[1.0, 2])
+        waits = [await limiter.check("speaking", user_id, 10) for user_id in (1, 2, 3)]
+        return limiter, waits
+
+    limiter, waits = asyncio.run(scenario())
+    assert waits[:2] == [0.0, 0.0] and waits[2] > 0
+    # Отклоненное событие не списывает токен пользователя
+    assert limiter._buckets[("speaking", "user", 3)][0] == 5
+
+
+def test_unknown_event_is_not_limited():
+    assert asyncio.run(_limiter().check("chat", 1)) == 0.0
+
+
+def test_flood_detection():
+    limiter = _limiter()
+    assert [limiter.record_violation(1) for _ in range(4)] == [False, False, False, True]
+    assert not limiter.record_violation(2)
+
+
+def test_state_toggles_coalesce_to_latest_value():
+    async def scenario():
+        limiter = _limiter(rate=20.0, burst=2)
+        websocket = FakeWebSocket()
+        applied = []
+
+        def apply(value):
+            async def run():
+                applied.append(value)
+            return run
+
+        for value in range(6):
+            await limiter.enforce_latest(websocket, "speaking", 1, 10, apply(value))
+        immediate = list(applied)
+        await asyncio.sleep(0.15)
+        return limiter, immediate, applied
+
+    limiter, immediate, applied = asyncio.run(scenario())
+    assert immediate == [0, 1]
+    assert applied == [0, 1, 5]
+    stats = limiter.get_stats()
+    assert stats["coalesced_total"] == 4
+    assert stats["deferred"] == 0
+
+
+def test_discarded_toggles_are_not_applied():
+    async def scenario():
+        limiter = _limiter(rate=20.0, burst=1)
+        websocket = FakeWebSocket()
+        applied = []
+
+        async def apply():
+            applied.append(True)
+
+        await limiter.enforce_latest(websocket, "speaking", 1, 10, apply)
+        await limiter.enforce_latest(websocket, "speaking", 1, 10, apply)
+        limiter.discard_deferred(websocket)
+        await asyncio.sleep(0.1)
+        return limiter, applied
+
+    limiter, applied = asyncio.run(scenario())
+    assert applied == [True]
+    assert limiter.get_stats()["deferred"] == 0
+
+
+def test_rejected_event_gets_rate_limited_frame():
+    async def scenario():
+        limiter = _limiter(rate=1.0, burst=1)
+        websocket = FakeWebSocket()
+        results = [await limiter.enforce(websocket, "speaking", 1, 10, text_channel_id=5) for _ in range(2)]
+        return results, websocket.sent
+
+    results, sent = asyncio.run(scenario())
+    assert results == [True, False]
+    assert len(sent) == 1
+    frame = json.loads(sent[0])
+    assert frame["type"] == "rate_limited" and frame["event"] == "speaking" and frame["text_channel_id"] == 5
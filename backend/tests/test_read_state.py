@@ -0,0 +1,145 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+import app.services.read_state as read_state_module
+from app.services.read_state import LATEST_KEY, ReadStateTracker
+from tests.fakes import FakeRedis
+
+
+class FakeManager:
+    """Публикации процесса: в тесте их доставляют другому процессу через _handle_remote"""
+
+    def __init__(self):
+        self.published = []
+
+    def register_redis_handler(self, prefix, handler):
+        pass
+
+    async def publish(self, redis_channel, message, shared_state=False):
+        self.published.append((redis_channel, message))
+
+    async def send_to_user(self, user_id, message):
+        pass
+
+
+class FakeDatabase:
+    """max(id) по каналам, который latest_for дочитывает для неизвестных указателей"""
+
+    def __init__(self, latest):
+        self.latest = latest
+        self.queries = 0
+
+    async def execute(self, statement):
+        self.queries += 1
+        missing = statement.whereclause.right.value
+        return SimpleNamespace(all=lambda: [(tid, self.latest.get(tid, 0)) for tid in missing])
+
+
+@pytest.fixture
+def fake_manager(monkeypatch):
+    fake = FakeManager()
+    monkeypatch.setattr(read_state_module, "manager", fake)
+    return fake
+
+
+def tracker(redis=None) -> ReadStateTracker:
+    result = ReadStateTracker(flush_interval=1.0, use_redis=redis is not None)
+    result.attach_redis(redis)
+    return result
+
+
+def persisted(*rows):
+    return [
+        (1, {"id": message_id, "text_channel_id": tid, "content": "", "author_id": 1})
+        for tid, message_id in rows
+    ]
+
+
+async def deliver(manager: FakeManager, *trackers: ReadStateTracker):
+    for redis_channel, message in manager.published:
+        for other in trackers:
+            await other._handle_remote(redis_channel.partition(":")[2], message)
+    manager.published.clear()
+
+
+def test_advance_reaches_other_processes(fake_manager):
+    writer, reader = tracker(), tracker()
+    reader.latest[5] = 20
+
+    async def scenario():
+        await writer.messages_persisted(persisted((5, 10), (5, 30), (6, 7)))
+        await deliver(fake_manager, reader)
+        # Указатель только растет: запоздавшая публикация не откатывает его
+        await reader._handle_remote("advance", {"op": "advance", "latest": {"5": "25"}})
+
+    asyncio.run(scenario())
+    assert writer.latest == {5: 30, 6: 7}
+    assert reader.latest == {5: 30, 6: 7}
+
+
+def test_delete_invalidates_pointer_everywhere(fake_manager):
+    deleting, other = tracker(), tracker()
+
+    async def scenario():
+        await deleting.messages_persisted(persisted((5, 30)))
+        await deliver(fake_manager, other)
+        await deleting.invalidate(5)
+        await deliver(fake_manager, other)
+        # Последнее сообщение удалено — указатель берется из БД заново
+        db = FakeDatabase({5: 12})
+        return await other.latest_for(db, [5]), db.queries
+
+    assert asyncio.run(scenario()) == ({5: 12}, 1)
+    assert 5 not in deleting.latest
+    assert other.latest == {5: 12}
+
+
+def test_shared_pointers_are_not_published(fake_manager):
+    redis = FakeRedis()
+    shared = tracker(redis)
+
+    async def scenario():
+        await shared.messages_persisted(persisted((5, 30)))
+        await shared.invalidate(5)
+
+    asyncio.run(scenario())
+    assert fake_manager.published == []
+    assert redis.data[LATEST_KEY] == {}
+
+
+def test_failed_redis_advance_drops_pointer(fake_manager):
+    redis = FakeRedis()
+    shared = tracker(redis)
+
+    async def scenario():
+        await shared.messages_persisted(persisted((5, 30)))
+        redis.fail = True
+        await shared.messages_persisted(persisted((5, 40)))
+        redis.fail = False
+        assert shared._stale == {5}
+        # Redis снова доступен, но указатель в нем старый: канал читается из БД
+        db = FakeDatabase({5: 40})
+        latest = await shared.latest_for(db, [5])
+        await shared._drop_shared([])
+        return latest
+
+    assert asyncio.run(scenario()) == {5: 40}
+    assert shared._stale == set()
+    assert redis.data[LATEST_KEY] == {}
+
+
+def test_redis_advance_failure_with_working_hdel(fake_manager):
+    redis = FakeRedis()
+    shared = tracker(redis)
+
+    async def failing_script(keys=None, args=None):
+        raise ConnectionError("NOSCRIPT")
+
+    async def scenario():
+        await shared.messages_persisted(persisted((5, 30)))
+        shared._advance_script = failing_script
+        await shared.messages_persisted(persisted((5, 40)))
+
+    asyncio.run(scenario())
+    assert redis.data[LATEST_KEY] == {}
+    assert shared._stale == set()
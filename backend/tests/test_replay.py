@@ -0,0 +1,150 @@
+import asyncio
+import json
+from app.websocket.connection_manager import ConnectionManager
+from app.websocket.frames import EncodedFrame
+from app.websocket.outbox import ConnectionOutbox
+from app.websocket.replay import ReplayStore
+from tests.fakes import FakeRedis, FakeWebSocket
+
+
+def _store(capacity=3, max_streams=4, redis_mirror=False):
+    return ReplayStore(capacity=capacity, max_streams=max_streams, session_ttl=60, redis_mirror=redis_mirror)
+
+
+def test_stamp_keeps_frames_valid():
+    async def scenario():
+        store = _store()
+        empty = await store.stamp("channel:1", EncodedFrame("{}"))
+        spaced = await store.stamp("channel:1", EncodedFrame('{ "type": "x" }'))
+        return empty.text, spaced.text
+
+    empty, spaced = asyncio.run(scenario())
+    assert json.loads(empty) == {"stream": "channel:1", "seq": 1}
+    assert json.loads(spaced) == {"stream": "channel:1", "seq": 2, "type": "x"}
+
+
+def test_since_returns_missed_frames():
+    async def scenario():
+        store = _store(capacity=3)
+        for i in range(5):
+            await store.stamp("channel:1", EncodedFrame(f'{{"n":{i}}}'))
+        return store, await store.since("channel:1", 2), await store.since("channel:1", 5)
+
+    store, missed, current = asyncio.run(scenario())
+    assert [json.loads(text)["n"] for text in missed] == [2, 3, 4]
+    assert current == []
+    assert store.current_seq("channel:1") == 5
+
+
+def test_since_requires_resync_when_buffer_overflowed_or_reset():
+    async def scenario():
+        store = _store(capacity=3)
+        for _ in range(5):
+            await store.stamp("channel:1", EncodedFrame("{}"))
+        return await store.since("channel:1", 1), await store.since("channel:1", 9), await store.since("channel:2", 0)
+
+    overflowed, reset, unknown = asyncio.run(scenario())
+    assert overflowed is None
+    assert reset is None
+    assert unknown == []
+
+
+def test_least_recent_stream_is_evicted():
+    async def scenario():
+        store = _store(max_streams=2)
+        for stream in ("user:1", "user:2", "user:1", "user:3"):
+            await store.stamp(stream, EncodedFrame("{}"))
+        return list(store.buffers)
+
+    assert asyncio.run(scenario()) == ["user:1", "user:3"]
+
+
+def test_shared_sequence_is_batched():
+    async def scenario():
+        redis = FakeRedis()
+        store = _store(capacity=20, redis_mirror=True)
+        store.attach_redis(redis, shared_sequence=True)
+        frames = await asyncio.gather(*(
+            store.stamp(f"channel:{i % 3}", EncodedFrame(f'{{"n":{i}}}')) for i in range(30)
+        ))
+        return store, redis, frames
+
+    store, redis, frames = asyncio.run(scenario())
+    assert store.get_stats()["stamp_round_trips"] == 1
+    assert len(redis.script_calls) == 1
+    for stream in range(3):
+        stamped = [json.loads(frame.text) for frame in frames[stream::3]]
+        assert [event["seq"] for event in stamped] == list(range(1, 11))
+        assert [event["n"] for event in stamped] == list(range(stream, 30, 3))
+        # Зеркало в Redis совпадает с тем, что ушло клиентам
+        assert redis.lists[f"ws_replay:channel:{stream}"] == [frame.text for frame in frames[stream::3]]
+
+
+def test_mirror_restores_buffer_after_restart():
+    async def scenario():
+        redis = FakeRedis()
+        store = _store(redis_mirror=True)
+        store.attach_redis(redis, shared_sequence=False)
+        for _ in range(3):
+            await store.stamp("channel:1", EncodedFrame("{}"))
+        restarted = _store(redis_mirror=True)
+        restarted.attach_redis(redis, shared_sequence=False)
+        return await restarted.since("channel:1", 1)
+
+    restored = asyncio.run(scenario())
+    assert [json.loads(text)["seq"] for text in restored] == [2, 3]
+
+
+def test_shared_sequence_falls_back_to_local_numbers():
+    async def scenario():
+        redis = FakeRedis()
+        redis.fail = True
+        store = _store()
+        store.attach_redis(redis, shared_sequence=True)
+        frames = await asyncio.gather(*(store.stamp("channel:1", EncodedFrame("{}")) for _ in range(3)))
+        return [json.loads(frame.text)["seq"] for frame in frames]
+
+    assert asyncio.run(scenario()) == [1, 2, 3]
+
+
+def test_ephemeral_frames_are_not_stamped():
+    async def scenario():
+        manager = ConnectionManager()
+        websocket = FakeWebSocket()
+
+        async def on_failure(ws, reason):
+            pass
+
+        manager.channel_connections[1] = {7: websocket}
+        manager.outboxes[websocket] = ConnectionOutbox(websocket, on_failure, max_size=8, send_timeout=1.0)
+        await manager.send_to_channel(1, {"type": "typing_update"}, ephemeral=True)
+        await manager.send_to_channel(1, {"type": "new_message"})
+        await asyncio.sleep(0.01)
+        manager.outboxes[websocket].close()
+        return manager, websocket.sent
+
+    manager, sent = asyncio.run(scenario())
+    assert [json.loads(text) for text in sent] == [
+        {"type": "typing_update"},
+        {"stream": "channel:1", "seq": 1, "type": "new_message"}
+    ]
+    assert manager.replay.current_seq("channel:1") == 1
+
+
+def test_resume_with_malformed_last_seq_requires_resync():
+    async def scenario(last_seq):
+        manager = ConnectionManager()
+        websocket = FakeWebSocket()
+        sent = []
+        manager.connection_metadata[websocket] = {"user_id": 7, "channel_id": 1}
+        manager._enqueue = lambda ws, text: sent.append(json.loads(text)) or True
+        session_id = await manager.replay.open_session(7)
+        await manager.resume(websocket, session_id, last_seq)
+        return sent
+
+    for last_seq in (["channel:1"], "channel:1", {"channel:1": "5"}, {"channel:1": -1}, {"channel:1": None},
+                     {"channel:1": True}, {"channel:1": 1.5}):
+        assert asyncio.run(scenario(last_seq)) == [
+            {"type": "resync_required", "streams": ["user:7", "broadcast", "channel:1"]}
+        ]
+    assert asyncio.run(scenario({"channel:1": 0})) == [{"type": "resumed", "replayed": 0, "resync": []}]
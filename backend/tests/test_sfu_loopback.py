@@ -0,0 +1,43 @@
+"""Комната на SFU с настоящими aiortc-пирами в одном процессе (сценарий benchmarks/sfu_loopback)"""
+import asyncio
+import pytest
+
+pytest.importorskip("aiortc")
+
+from types import SimpleNamespace  # noqa: E402
+from app.services.sfu import _request_keyframe  # noqa: E402
+from benchmarks.sfu_loopback import run_room  # noqa: E402
+
+THRESHOLD = 3
+SECONDS = 5.0
+
+
+@pytest.mark.parametrize("size", [3, 4])
+def test_sfu_room(size):
+    result = asyncio.run(run_room(size, THRESHOLD, SECONDS))
+    assert result["heard_all"], "не каждый участник слышит всех остальных"
+    assert result["saw_screen"], "демонстрация экрана не дошла до остальных"
+    assert result["mixed"], "слушатель микса получает не один поток сервера"
+    assert result["released"], "треки вышедшего участника не освобождены"
+    # Один исходящий поток при любом размере комнаты, входящих — по одному на каждого другого
+    assert result["uplink"] == 1
+    assert result["downlink"] == size - 1
+
+
+def test_keyframe_request_survives_aiortc_without_pli():
+    sources = [SimpleNamespace(source=11), SimpleNamespace(source=12)]
+    requested = []
+
+    async def send_pli(media_ssrc):
+        requested.append(media_ssrc)
+
+    async def changed_signature():
+        pass
+
+    def receiver(**methods):
+        return SimpleNamespace(getSynchronizationSources=lambda: sources, **methods)
+
+    assert asyncio.run(_request_keyframe(receiver(_send_rtcp_pli=send_pli)))
+    assert requested == [11, 12]
+    assert not asyncio.run(_request_keyframe(receiver()))
+    assert not asyncio.run(_request_keyframe(receiver(_send_rtcp_pli=changed_signature)))
@@ -0,0 +1,68 @@
+import json
+import pytest
+from app.websocket.signaling import relay_frame, split_signal
+
+CANDIDATE = '{"candidate":"candidate:1 1 udp 2122260223 10.0.0.1 54321 typ host","sdpMid":"0"}'
+
+
+def test_split_signal_keeps_payload_untouched():
+    text = f'{{"type":"ice_candidate","target_id":42,"candidate":{CANDIDATE}}}'
+    assert split_signal(text) == ("ice_candidate", 42, CANDIDATE)
+    assert split_signal(text + " \n") == ("ice_candidate", 42, CANDIDATE)
+
+
+@pytest.mark.parametrize("text", [
+    # Лишний ключ после полезной нагрузки
+    f'{{"type":"ice_candidate","target_id":42,"candidate":{CANDIDATE},"extra":1}}',
+    # Скалярная полезная нагрузка с дописанными ключами
+    '{"type":"ice_candidate","target_id":42,"candidate":null,"from_id":666}',
+    # Значение закрывается не тем, чем открылось
+    '{"type":"offer","target_id":42,"offer":["v=0"}',
+    '{"type":"offer","target_id":42,"offer":"v=0}',
+    # Пустая полезная нагрузка
+    '{"type":"offer","target_id":42,"offer":}',
+    # Поле не соответствует типу
+    f'{{"type":"offer","target_id":42,"candidate":{CANDIDATE}}}',
+    # Другой порядок ключей
+    f'{{"target_id":42,"type":"ice_candidate","candidate":{CANDIDATE}}}',
+    # Обрезанный кадр
+    f'{{"type":"ice_candidate","target_id":42,"candidate":{CANDIDATE}'
+])
+def test_split_signal_falls_back_to_full_parse(text):
+    assert split_signal(text) is None
+
+
+def test_relay_frame_is_valid_json():
+    payload = '{"type":"offer","sdp":"v=0\\r\\n","from_id":666}'
+    assert json.loads(relay_frame("offer", 7, payload).text) == {
+        "offer": {"type": "offer", "sdp": "v=0\r\n", "from_id": 666},
+        "from_id": 7,
+        "type": "offer"
+    }
+
+
+@pytest.mark.parametrize("payload", [
+    "null",
+    '"end"',
+    '{"sdp":"v=0\\r\\n} \\"quoted\\" {","nested":[1,{"a":[]}]}',
+])
+def test_split_signal_accepts_any_single_value(payload):
+    text = f'{{"type":"offer","target_id":42,"offer":{payload}}}'
+    assert split_signal(text) == ("offer", 42, payload)
+    assert json.loads(relay_frame("offer", 7, payload).text)["offer"] == json.loads(payload)
+
+
+def test_malformed_payload_cannot_forge_envelope():
+    # Полезная нагрузка проходит проверку границ, но from_id и type в кадре остаются свои
+    payload = '{"sdp":"v=0"},"from_id":666,"type":"answer","x":{}'
+    text = f'{{"type":"offer","target_id":42,"offer":{payload}}}'
+    assert split_signal(text) == ("offer", 42, payload)
+    frame = json.loads(relay_frame("offer", 7, payload).text)
+    assert frame["from_id"] == 7 and frame["type"] == "offer"
+
+
+@pytest.mark.parametrize("payload", ['{"sdp":"v=0",}', '{"sdp":"v=0"', '{"sdp":"v=0}', '"v=0'])
+def test_unbalanced_payload_breaks_frame_instead_of_envelope(payload):
+    # Незакрытая строка или скобка поглощает служебные ключи: кадр невалиден, а не подменен
+    with pytest.raises(json.JSONDecodeError):
+        json.loads(relay_frame("offer", 7, payload).text)
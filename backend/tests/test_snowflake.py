@@ -0,0 +1,67 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import pytest
+from app.core.snowflake import (
+    MAX_WORKER_ID, SEQUENCE_BITS, SnowflakeGenerator, WorkerIdLease,
+    parse_snowflake, snowflake_from_time, snowflake_time
+)
+from tests.fakes import FakeRedis
+
+
+def test_ids_are_unique_and_increasing():
+    generator = SnowflakeGenerator(worker_id=5)
+    ids = [generator.next_id() for _ in range(20000)]
+    assert ids == sorted(set(ids))
+    assert all((value >> SEQUENCE_BITS) & MAX_WORKER_ID == 5 for value in ids)
+
+
+def test_id_encodes_creation_time():
+    before = datetime.now(timezone.utc) - timedelta(milliseconds=1)
+    value = SnowflakeGenerator().next_id()
+    assert before <= snowflake_time(value) <= datetime.now(timezone.utc) + timedelta(milliseconds=1)
+    assert snowflake_from_time(before) <= value
+    assert snowflake_from_time(datetime(2000, 1, 1, tzinfo=timezone.utc)) == 0
+
+
+def test_worker_id_is_validated():
+    with pytest.raises(ValueError):
+        SnowflakeGenerator(worker_id=MAX_WORKER_ID + 1)
+    with pytest.raises(ValueError):
+        SnowflakeGenerator(worker_id=-1)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("123", 123),
+    (123, 123),
+    ("12a", None),
+    (True, None),
+    (-1, None),
+    (1 << 63, None),
+    ("9" * 21, None),
+    (None, None)
+])
+def test_parse_snowflake(value, expected):
+    assert parse_snowflake(value) == expected
+
+
+def test_lease_takes_free_worker_id_and_releases_it():
+    async def scenario():
+        redis = FakeRedis()
+        redis.data["snowflake:worker:0"] = "other-node"
+        generator = SnowflakeGenerator()
+        lease = WorkerIdLease(generator, ttl=60)
+        acquired = await lease.acquire(redis, "this-node")
+        held = dict(redis.data)
+        await lease.release()
+        return acquired, generator.worker_id, held, redis.data
+
+    acquired, worker_id, held, released = asyncio.run(scenario())
+    assert acquired and worker_id == 1
+    assert held["snowflake:worker:1"] == "this-node"
+    assert released == {"snowflake:worker:0": "other-node"}
+
+
+def test_lease_without_redis_keeps_default_worker_id():
+    generator = SnowflakeGenerator(worker_id=3)
+    assert not asyncio.run(WorkerIdLease(generator).acquire(None, "this-node"))
+    assert generator.worker_id == 3
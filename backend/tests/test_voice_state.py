@@ -0,0 +1,245 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import app.services.voice_state as voice_state_module
+from app.services.voice_state import VoiceStateStore
+
+
+class FakeVoiceTable:
+    """Строки VoiceChannelUser: select возвращает строки старше границы, delete удаляет по id"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.deleted = []
+
+    def session(self):
+        return FakeSession(self)
+
+
+class FakeSession:
+    def __init__(self, table: FakeVoiceTable):
+        self.table = table
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, rows=None):
+        bound = statement.whereclause.right.value
+        if statement.is_select:
+            return SimpleNamespace(all=lambda: [row for row in self.table.rows if row.joined_at < bound])
+        self.table.deleted += bound
+        self.table.rows = [row for row in self.table.rows if row.id not in bound]
+
+    async def commit(self):
+        pass
+
+
+def make_store(single_node=True) -> VoiceStateStore:
+    return VoiceStateStore(
+        use_redis=False,
+        single_node=single_node,
+        node_ttl=30,
+        reconcile_interval=60.0,
+        flags_flush_interval=1.0,
+        ice_batch_window=0,
+        ice_batch_max=16
+    )
+
+
+def voice_row(row_id: int, joined_at: datetime):
+    return SimpleNamespace(id=row_id, voice_channel_id=1, user_id=row_id, joined_at=joined_at)
+
+
+def test_single_process_removes_rows_of_previous_run(monkeypatch):
+    store = make_store()
+    table = FakeVoiceTable([
+        voice_row(1, store.started_at - timedelta(hours=1)),
+        voice_row(2, store.started_at + timedelta(seconds=1))
+    ])
+    monkeypatch.setattr(voice_state_module, "AsyncSessionLocal", table.session)
+
+    asyncio.run(store.reconcile())
+
+    assert table.deleted == [1]
+    assert [row.id for row in table.rows] == [2]
+    assert store.ghosts_removed == 1
+
+
+def test_cleanup_runs_only_before_start(monkeypatch):
+    store = make_store()
+    table = FakeVoiceTable([voice_row(1, datetime.now(timezone.utc) - timedelta(hours=1))])
+    monkeypatch.setattr(voice_state_module, "AsyncSessionLocal", table.session)
+    store._task = object()
+
+    asyncio.run(store.reconcile())
+
+    assert table.deleted == []
+
+
+def test_several_processes_without_redis_keep_rows(monkeypatch):
+    store = make_store(single_node=False)
+    table = FakeVoiceTable([voice_row(1, store.started_at - timedelta(hours=1))])
+    monkeypatch.setattr(voice_state_module, "AsyncSessionLocal", table.session)
+
+    asyncio.run(store.reconcile())
+
+    assert table.deleted == []
+
+
+def test_reserve_enforces_limit():
+    store = make_store()
+
+    async def scenario():
+        admitted = [await store.reserve(7, f"conn-{i}", 2) for i in range(3)]
+        return admitted
+
+    assert asyncio.run(scenario()) == [True, True, False]
+    assert store.slots[7] == {"conn-0", "conn-1"}
+    assert "conn-2" not in store.reserved
+    assert store.rejected_total == 1
+
+
+def test_reserve_is_idempotent_and_unlimited_without_max_users():
+    store = make_store()
+
+    async def scenario():
+        assert await store.reserve(7, "conn-0", 1)
+        # Повтор того же подключения не занимает второе место
+        assert await store.reserve(7, "conn-0", 1)
+        return [await store.reserve(8, f"conn-{i}", None) for i in range(1, 4)]
+
+    assert asyncio.run(scenario()) == [True, True, True]
+    assert store.slots[7] == {"conn-0"}
+    assert len(store.slots[8]) == 3
+    assert store.rejected_total == 0
+
+
+def test_release_frees_slot_once():
+    store = make_store()
+
+    async def scenario():
+        await store.reserve(7, "conn-0", 1)
+        await store.release(7, "conn-0")
+        await store.release(7, "conn-0")
+        assert 7 not in store.slots
+        assert await store.reserve(7, "conn-1", 1)
+        # Повторное освобождение старого подключения не отдает чужое место
+        await store.release(7, "conn-0")
+        return await store.reserve(7, "conn-2", 1)
+
+    assert asyncio.run(scenario()) is False
+    assert store.slots[7] == {"conn-1"}
+    assert store.reserved == {"conn-1": 7}
+
+
+def test_zero_or_negative_limit_means_unlimited():
+    store = make_store()
+
+    async def scenario():
+        return [await store.reserve(7, f"conn-{i}", limit) for i, limit in enumerate((0, 0, -1, -1))]
+
+    assert asyncio.run(scenario()) == [True] * 4
+    assert len(store.slots[7]) == 4
+    assert store.rejected_total == 0
+
+
+class FakeFlagWriter:
+    """Сессия для записи mute/deafen: каждый execute — один executemany, fail — сбой базы"""
+
+    def __init__(self):
+        self.batches = []
+        self.fail = False
+
+    def session(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, params=None):
+        if self.fail:
+            raise RuntimeError("database down")
+        self.batches.append(params)
+
+    async def commit(self):
+        pass
+
+
+def join_user(store: VoiceStateStore, channel_id: int, user_id: int):
+    participant = {"user_id": user_id, "username": f"user{user_id}", "connection_id": f"conn-{user_id}"}
+    return store.join(channel_id, participant)
+
+
+def test_flag_changes_coalesce_into_one_write(monkeypatch):
+    store = make_store()
+    writer = FakeFlagWriter()
+    monkeypatch.setattr(voice_state_module, "AsyncSessionLocal", writer.session)
+
+    async def scenario():
+        await join_user(store, 1, 10)
+        await join_user(store, 1, 11)
+        for muted in (True, False, True):
+            assert await store.set_flags(1, 10, "conn-10", is_muted=muted)
+        assert await store.set_flags(1, 10, "conn-10", is_deafened=True)
+        assert await store.set_flags(1, 11, "conn-11", is_deafened=False)
+        # Чужое подключение не меняет ни состояние, ни очередь записи
+        assert not await store.set_flags(1, 11, "conn-old", is_muted=True)
+        await store.flush_flags()
+        await store.flush_flags()
+
+    asyncio.run(scenario())
+
+    assert len(writer.batches) == 1
+    rows = {row["b_user_id"]: row for row in writer.batches[0]}
+    assert rows[10]["b_is_muted"] is True and rows[10]["b_is_deafened"] is True
+    assert rows[11]["b_is_muted"] is None and rows[11]["b_is_deafened"] is False
+    assert store.flag_changes == 5
+    assert store.flag_writes == 2
+    assert store.channels[1][10]["is_muted"] is True
+
+
+def test_failed_write_requeues_without_overwriting_newer_flags(monkeypatch):
+    store = make_store()
+    writer = FakeFlagWriter()
+    monkeypatch.setattr(voice_state_module, "AsyncSessionLocal", writer.session)
+
+    async def scenario():
+        await join_user(store, 1, 10)
+        await store.set_flags(1, 10, "conn-10", is_muted=True, is_deafened=True)
+        pending, store._pending_flags = store._pending_flags, {}
+        # Изменение, пришедшее во время неудачной записи, новее возвращаемого в очередь
+        await store.set_flags(1, 10, "conn-10", is_muted=False)
+        writer.fail = True
+        await store._write_flags(pending)
+        assert store._pending_flags == {(1, 10): {"is_muted": False, "is_deafened": True}}
+        writer.fail = False
+        await store.flush_flags()
+
+    asyncio.run(scenario())
+
+    assert writer.batches == [[
+        {"b_channel_id": 1, "b_user_id": 10, "b_is_muted": False, "b_is_deafened": True}
+    ]]
+    assert store._pending_flags == {}
+
+
+def test_leave_drops_pending_flags(monkeypatch):
+    store = make_store()
+    writer = FakeFlagWriter()
+    monkeypatch.setattr(voice_state_module, "AsyncSessionLocal", writer.session)
+
+    async def scenario():
+        await join_user(store, 1, 10)
+        await store.set_flags(1, 10, "conn-10", is_muted=True)
+        assert await store.leave(1, 10, "conn-10")
+        await store.flush_flags()
+
+    asyncio.run(scenario())
+
+    assert writer.batches == []
@@ -116,7 +116,7 @@ export const useStore = create<AppState>()(
         const { currentChannel, user } = get();
         if (currentChannel && user) {
           const message: Message = {
-            id: Date.now(),
+            id: String(Date.now()),
             content,
             author: user,
             timestamp: new Date().toISOString(),
@@ -5,6 +5,9 @@ const WS_URL = process.env.NEXT_PUBLIC_WS_URL || 'wss://miscord.ru';
 
 console.log('🎙️ VoiceService инициализирован с WS_URL:', WS_URL);
 
+// В режиме SFU сервер выступает собеседником с этим id (target_id/from_id)
+const SFU_PEER_ID = 0;
+
 interface PeerConnection {
   pc: RTCPeerConnection;
   userId: number;
@@ -16,6 +19,11 @@ class VoiceService {
   private rawStream: MediaStream | null = null; // Сырой поток для VAD
   private screenStream: MediaStream | null = null; // Поток демонстрации экрана
   private peerConnections: Map<number, PeerConnection> = new Map();
+  private mediaMode: 'mesh' | 'sfu' = 'mesh'; // sfu — одно соединение с сервером вместо соединения с каждым
+  private sfuUplink: { audio?: string; video?: string } = {}; // mid m-строк для микрофона и экрана
+  private sfuTracks: Map<string, number> = new Map(); // mid -> user_id владельца входящего трека
+  private sfuAttached: Map<string, number> = new Map(); // mid -> user_id, чей элемент уже воспроизводит трек
+  private audioMixing: boolean = false; // слабый канал: звук остальных одним миксом с сервера (mid -> SFU_PEER_ID)
   private iceServers: RTCIceServer[] = [];
   private voiceChannelId: number | null = null;
   private token: string | null = null;
@@ -162,6 +170,12 @@ class VoiceService {
   }
 
   private async handleMessage(data: any) {
+    // Heartbeat сервера: отвечаем, чтобы соединение не считалось мертвым
+    if (data.type === 'ping') {
+      this.sendMessage({ type: 'pong' });
+      return;
+    }
+    
     if (this.audioDataLogging) {
       console.log('🔊 VoiceService получил сообщение (детально):', {
         type: data.type,
@@ -178,10 +192,25 @@ class VoiceService {
         this.iceServers = data.ice_servers;
         console.log('🔊 ICE серверы получены:', this.iceServers);
         
+        // Пакетная доставка ICE-кандидатов, если сервер ее поддерживает
+        if (data.features?.includes('ice_batching')) {
+          this.sendMessage({ type: 'hello', features: ['ice_batching'] });
+        }
+        
+        if (this.audioMixing) {
+          this.sendMessage({ type: 'audio_mix', enabled: true });
+        }
+        
         if (this.onParticipantsReceivedCallback) {
           this.onParticipantsReceivedCallback(data.participants);
         }
         
+        // Большая комната: соединение предложит сервер, с участниками напрямую не соединяемся
+        if (data.media_mode === 'sfu') {
+          this.mediaMode = 'sfu';
+          break;
+        }
+        
         const currentUserId = this.getCurrentUserId();
         for (const participant of data.participants) {
           if (participant.user_id !== currentUserId) {
@@ -198,7 +227,7 @@ class VoiceService {
           this.onParticipantJoined(data.user_id, data.username);
         }
         const currentUserId2 = this.getCurrentUserId();
-        if (data.user_id !== currentUserId2) {
+        if (this.mediaMode === 'mesh' && data.user_id !== currentUserId2) {
           const shouldCreateOffer = currentUserId2 !== null && currentUserId2 < data.user_id;
           await this.createPeerConnection(data.user_id, shouldCreateOffer);
         }
@@ -250,27 +279,55 @@ class VoiceService {
         }
         await this.handleIceCandidate(data.from_id, data.candidate);
         break;
+
+      case 'ice_candidates':
+        console.log(`🔊 Получено ICE candidates от пользователя ${data.from_id}: ${data.candidates.length}`);
+        for (const candidate of data.candidates) {
+          await this.handleIceCandidate(data.from_id, candidate);
+        }
+        break;
+
+      case 'hello':
+        console.log('🔊 Согласованы возможности протокола:', data.features);
+        break;
+
+      case 'media_mode':
+        console.log('🎛️ Комната переходит в режим:', data.mode);
+        if (data.mode === 'sfu' && this.mediaMode !== 'sfu') {
+          this.mediaMode = 'sfu';
+          Array.from(this.peerConnections.keys())
+            .filter(userId => userId !== SFU_PEER_ID)
+            .forEach(userId => this.removePeerConnection(userId));
+        }
+        break;
+
+      case 'sfu_tracks':
+        this.sfuUplink = data.uplink;
+        this.sfuTracks = new Map(Object.entries(data.tracks).map(([mid, userId]) => [mid, userId as number]));
+        this.applySfuTracks();
+        break;
         
-      case 'user_speaking':
-        // Ignore server speaking messages for the local user - we handle that locally with VAD
+      case 'speaking_update':
+        // Изменения голосовой активности за такт сервера; свою активность определяет локальный VAD
         const localUserId = this.getCurrentUserId();
-        if (data.user_id === localUserId) {
+        const speakingChanges: [number, boolean][] = [
+          ...data.started.map((userId: number): [number, boolean] => [userId, true]),
+          ...data.stopped.map((userId: number): [number, boolean] => [userId, false])
+        ];
+        for (const [userId, isSpeaking] of speakingChanges) {
+          if (userId === localUserId) continue;
+          
           if (this.audioDataLogging) {
-            console.log('🔊 Игнорируем серверное сообщение о голосовой активности для локального пользователя');
+            console.log('🔊 🗣️ Изменение голосовой активности пользователя:', {
+              user_id: userId,
+              is_speaking: isSpeaking,
+              timestamp: new Date().toISOString()
+            });
+          }
+          
+          if (this.onSpeakingChanged) {
+            this.onSpeakingChanged(userId, isSpeaking);
           }
-          break;
-        }
-        
-        if (this.audioDataLogging) {
-          console.log('🔊 🗣️ Изменение голосовой активности пользователя:', {
-            user_id: data.user_id,
-            is_speaking: data.is_speaking,
-            timestamp: new Date().toISOString()
-          });
-        }
-        
-        if (this.onSpeakingChanged) {
-          this.onSpeakingChanged(data.user_id, data.is_speaking);
         }
         break;
         
@@ -349,7 +406,8 @@ class VoiceService {
       }, 5000); // Каждые 5 секунд
     }
 
-    if (this.localStream) {
+    // С сервером SFU микрофон уходит в m-строку, которую сервер выделит в offer (см. prepareSfuUplink)
+    if (this.localStream && userId !== SFU_PEER_ID) {
       this.localStream.getTracks().forEach(track => {
         console.log(`🔊 Добавляем трек ${track.kind} в peer connection для пользователя ${userId}`);
         const sender = pc.addTrack(track, this.localStream!);
@@ -368,6 +426,11 @@ class VoiceService {
     }
 
     pc.ontrack = (event) => {
+      if (userId === SFU_PEER_ID) {
+        this.applySfuTracks();
+        return;
+      }
+      
       if (this.audioDataLogging) {
         console.log('🔊 📥 Получен удаленный поток от пользователя (детально):', userId, {
           streams: event.streams,
@@ -773,6 +836,11 @@ class VoiceService {
   private async handleOffer(userId: number, offer: RTCSessionDescriptionInit) {
     console.log(`🔊 Обрабатываем offer от пользователя ${userId}:`, offer);
     
+    if (this.mediaMode === 'sfu' && userId !== SFU_PEER_ID) {
+      console.log(`🔊 Режим SFU: offer от пользователя ${userId} пропущен`);
+      return;
+    }
+    
     let peerConnection = this.peerConnections.get(userId);
     
     if (!peerConnection) {
@@ -785,6 +853,10 @@ class VoiceService {
       await peerConnection.pc.setRemoteDescription(offer);
       console.log(`🔊 Установлен remote description для пользователя ${userId}`);
       
+      if (userId === SFU_PEER_ID) {
+        await this.prepareSfuUplink(peerConnection.pc);
+      }
+      
       const answer = await peerConnection.pc.createAnswer();
       await peerConnection.pc.setLocalDescription(answer);
       console.log(`🔊 Создан и установлен answer для пользователя ${userId}:`, answer);
@@ -800,6 +872,57 @@ class VoiceService {
     }
   }
 
+  // SFU: микрофон и экран отправляются в m-строки, которые сервер выделил под исходящие потоки
+  private async prepareSfuUplink(pc: RTCPeerConnection) {
+    for (const transceiver of pc.getTransceivers()) {
+      if (transceiver.mid === this.sfuUplink.audio) {
+        await transceiver.sender.replaceTrack(this.localStream?.getAudioTracks()[0] ?? null);
+        transceiver.direction = 'sendonly';
+      } else if (transceiver.mid === this.sfuUplink.video) {
+        const screenTrack = this.screenStream?.getVideoTracks()[0] ?? null;
+        await transceiver.sender.replaceTrack(screenTrack);
+        transceiver.direction = screenTrack ? 'sendonly' : 'inactive';
+      }
+    }
+  }
+
+  // SFU: входящие треки сервера раскладываются по участникам согласно карте mid -> user_id
+  private applySfuTracks() {
+    const sfuConnection = this.peerConnections.get(SFU_PEER_ID);
+    if (!sfuConnection) return;
+    
+    for (const transceiver of sfuConnection.pc.getTransceivers()) {
+      const mid = transceiver.mid;
+      if (!mid) continue;
+      
+      const userId = this.sfuTracks.get(mid);
+      const previous = this.sfuAttached.get(mid);
+      if (previous === userId) continue;
+      
+      // m-строка освободилась или досталась другому участнику: прежний элемент больше не его
+      const track = transceiver.receiver.track;
+      if (previous !== undefined) {
+        document.getElementById(`remote-${track.kind}-${previous}`)?.remove();
+        this.sfuAttached.delete(mid);
+      }
+      if (userId === undefined) continue;
+      
+      this.sfuAttached.set(mid, userId);
+      if (track.kind === 'audio') {
+        this.setupRemoteAudio(userId, [track]);
+      } else {
+        this.setupRemoteVideo(userId, [track]);
+      }
+    }
+  }
+
+  private remoteUserIds(): number[] {
+    if (this.mediaMode === 'sfu') {
+      return Array.from(new Set(this.sfuAttached.values()));
+    }
+    return Array.from(this.peerConnections.keys());
+  }
+
   private async handleAnswer(userId: number, answer: RTCSessionDescriptionInit) {
     console.log(`🔊 Обрабатываем answer от пользователя ${userId}:`, answer);
     
@@ -890,8 +1013,8 @@ class VoiceService {
   setDeafened(deafened: boolean) {
     console.log(`🔊 Установка deafened: ${deafened}`);
     
-    // Проходим по всем подключениям и управляем аудио элементами
-    this.peerConnections.forEach(({ userId }) => {
+    // Проходим по всем собеседникам и управляем аудио элементами
+    this.remoteUserIds().forEach((userId) => {
       const audioElement = document.getElementById(`remote-audio-${userId}`) as HTMLAudioElement;
       if (audioElement) {
         audioElement.muted = deafened;
@@ -921,6 +1044,13 @@ class VoiceService {
     this.sendMessage({ type: 'deafen', is_deafened: deafened });
   }
 
+  // Слабый канал: сервер сводит звук остальных в один поток вместо потока от каждого участника
+  setAudioMixing(enabled: boolean) {
+    console.log(`🎚️ Сведение звука на сервере: ${enabled}`);
+    this.audioMixing = enabled;
+    this.sendMessage({ type: 'audio_mix', enabled });
+  }
+
   onParticipantJoin(callback: (userId: number, username: string) => void) {
     this.onParticipantJoined = callback;
   }
@@ -951,6 +1081,10 @@ class VoiceService {
       this.cleanupUserElements(userId);
     });
     this.peerConnections.clear();
+    this.mediaMode = 'mesh';
+    this.sfuUplink = {};
+    this.sfuTracks.clear();
+    this.sfuAttached.clear();
 
     // Останавливаем демонстрацию экрана
     if (this.screenStream) {
@@ -1186,6 +1320,8 @@ class VoiceService {
 
       console.log(`🖥️ Начинаем добавление видео треков к ${this.peerConnections.size} peer connections`);
       this.peerConnections.forEach(async ({ pc }, userId) => {
+        // Серверу SFU экран уходит в ответе на его новый offer после screen_share_start
+        if (userId === SFU_PEER_ID) return;
         try {
           console.log(`🖥️ Обрабатываем peer connection для пользователя ${userId}, состояние: ${pc.connectionState}`);
           const videoTrack = this.screenStream!.getVideoTracks()[0];
@@ -1307,6 +1443,7 @@ class VoiceService {
     });
 
     this.peerConnections.forEach(({ pc }, userId) => {
+      if (userId === SFU_PEER_ID) return;
       try {
         const senders = pc.getSenders();
         senders.forEach((sender: RTCRtpSender) => {
@@ -90,6 +90,13 @@ class WebSocketService {
       this.ws.onmessage = (event) => {
         try {
           const data = JSON.parse(event.data);
+          
+          // Heartbeat сервера: отвечаем, чтобы соединение не считалось мертвым
+          if (data.type === 'ping') {
+            this.ws?.send(JSON.stringify({ type: 'pong' }));
+            return;
+          }
+          
           console.log('🔔 Получено уведомление WebSocket:', data);
           
           // Вызываем соответствующий обработчик
@@ -29,7 +29,7 @@ export interface Channel {
 }
 
 export interface Message {
-  id: number;
+  id: string; // snowflake: больше 2^53, поэтому сервер отдает строкой
   content: string;
   author: User;
   timestamp: string;